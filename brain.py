@@ -5,15 +5,47 @@ import time
 from pathlib import Path
 
 from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
 from langchain_openai import AzureOpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores.faiss import FAISS
 
+from keployrag.config import DOCS_EMBEDDING_BACKEND, DOCS_INDEX_QUANTIZATION
+from keployrag.embedding_backends import get_local_backend
+from keployrag.index_types import index_quantization, quantize_flat
+
 # Global variables for tracking document state
 document_timestamps: Dict[str, float] = {}
 current_index = None
 current_embeddings = None
 
+# Indexes built by different embedding backends are not interchangeable, so local backends get their own folder
+DOCUMENT_INDEX_DIR = "document_index" if DOCS_EMBEDDING_BACKEND == "azure" else f"document_index_{DOCS_EMBEDDING_BACKEND}"
+
+class LocalEmbeddings(Embeddings):
+    """LangChain adapter over a keployrag local embedding backend (hashing or ONNX)."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.backend.embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.backend.embed([text])[0].tolist()
+
+def get_docs_embeddings() -> Embeddings:
+    """Embeddings for the docs index, from DOCS_EMBEDDING_BACKEND."""
+    backend = get_local_backend(DOCS_EMBEDDING_BACKEND)
+    if backend is not None:
+        return LocalEmbeddings(backend)
+    return AzureOpenAIEmbeddings(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        openai_api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        model="keploy-docs-embedding", # text-embedding-ada-002
+        chunk_size=1,
+    )
+
 def parse_mdx(file: BytesIO, filename: str) -> Tuple[List[str], str]:
     content = file.read().decode('utf-8')
     # You might want to add more sophisticated MDX parsing here
@@ -60,7 +92,7 @@ def needs_update(filepath: str) -> bool:
         return True
     return get_file_timestamp(filepath) > document_timestamps[filepath]
 
-def update_document_index(filepath: str, index: FAISS, embeddings: AzureOpenAIEmbeddings) -> FAISS:
+def update_document_index(filepath: str, index: FAISS, embeddings: Embeddings) -> FAISS:
     """Update a single document in the index."""
     try:
         with open(filepath, "rb") as f:
@@ -73,10 +105,14 @@ def update_document_index(filepath: str, index: FAISS, embeddings: AzureOpenAIEm
         # Note: FAISS doesn't support direct deletion, so we need to rebuild the index
         # for the specific document
         
-        new_index = FAISS.from_documents(documents, embeddings)
-        
-        # Merge the new embeddings with the existing index
-        index.merge_from(new_index)
+        if index_quantization(index.index) == "none":
+            new_index = FAISS.from_documents(documents, embeddings)
+
+            # Merge the new embeddings with the existing index
+            index.merge_from(new_index)
+        else:
+            # A quantized index only merges with one sharing its trained ranges, so add directly
+            index.add_documents(documents)
         
         # Update timestamp
         document_timestamps[filepath] = get_file_timestamp(filepath)
@@ -90,21 +126,16 @@ def get_index_for_mdx(mdx_files, mdx_names):
     global current_index, current_embeddings
     print("Creating/updating index for MDX files...")
 
-    embeddings = AzureOpenAIEmbeddings(
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        openai_api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        model="keploy-docs-embedding", # text-embedding-ada-002
-        chunk_size=1,
-    )
+    embeddings = get_docs_embeddings()
     
-    if os.path.exists("document_index") and current_index:
+    if os.path.exists(DOCUMENT_INDEX_DIR) and current_index:
         print("Using existing index and checking for updates...")
         index = current_index
     else:
-        if os.path.exists("document_index"):
+        if os.path.exists(DOCUMENT_INDEX_DIR):
             print("Loading existing index...")
             index = FAISS.load_local(
-                folder_path="document_index",
+                folder_path=DOCUMENT_INDEX_DIR,
                 embeddings=embeddings,
                 allow_dangerous_deserialization=True
             )
@@ -116,10 +147,14 @@ def get_index_for_mdx(mdx_files, mdx_names):
                 documents.extend(text_to_docs(text, filename))
             index = FAISS.from_documents(documents, embeddings)
 
+    if index_quantization(index.index) != DOCS_INDEX_QUANTIZATION:
+        print(f"Converting document index to {DOCS_INDEX_QUANTIZATION} quantization...")
+        index.index = quantize_flat(index.index, DOCS_INDEX_QUANTIZATION)
+
     # Store current state
     current_index = index
     current_embeddings = embeddings
 
     # Save the index
-    index.save_local("document_index")
+    index.save_local(DOCUMENT_INDEX_DIR)
     return index
\ No newline at end of file
@@ -19,6 +19,6 @@ fi
 echo "Processing the directory at $folder_path..."
 
 # Run scripts with the folder_path
-python parsing/preprocessing.py "$folder_path"
+python -m parsing.preprocessing "$folder_path"
 
 echo "Processing complete."
\ No newline at end of file
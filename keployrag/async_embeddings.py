@@ -0,0 +1,148 @@
+import time
+import random
+import asyncio
+import email.utils
+import openai
+from openai import AsyncAzureOpenAI
+from keployrag import embeddings
+from keployrag.embedding_backends import get_local_backend
+from keployrag.config import (
+    AZURE_OPENAI_ENDPOINT,
+    AZURE_OPENAI_API_KEY,
+    AZURE_OPENAI_API_VERSION,
+    AZURE_EMBEDDING_DEPLOYMENT,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_RPM_LIMIT,
+    EMBEDDING_TPM_LIMIT,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_RETRY_BASE_DELAY,
+    EMBEDDING_RETRY_MAX_DELAY
+)
+
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+class TokenBucket:
+    """Paces usage against a per-minute limit; a limit of 0 disables it.
+
+    There is no lock: the check-and-take in acquire() never awaits, so it is atomic on the event loop.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount=1):
+        if not self.capacity:
+            return
+        # A single request larger than the whole budget waits for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+            self.updated = now
+            if self.available >= amount:
+                self.available -= amount
+                return
+            await asyncio.sleep((amount - self.available) * 60 / self.capacity)
+
+# Shared across calls so quota used by one reindex batch is still accounted for in the next
+requests_bucket = TokenBucket(EMBEDDING_RPM_LIMIT)
+tokens_bucket = TokenBucket(EMBEDDING_TPM_LIMIT)
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, from Retry-After / retry-after-ms, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time()) if retry_at else None
+
+def _backoff(attempt):
+    # Full jitter keeps workers that were throttled together from retrying together
+    return random.uniform(0, min(EMBEDDING_RETRY_MAX_DELAY, EMBEDDING_RETRY_BASE_DELAY * 2 ** attempt))
+
+async def _request_with_retries(client, inputs, token_count):
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        await requests_bucket.acquire(1)
+        await tokens_bucket.acquire(token_count)
+        try:
+            response = await client.embeddings.create(model=AZURE_EMBEDDING_DEPLOYMENT, input=inputs)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except _RETRYABLE_ERRORS as e:
+            if attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            delay = _retry_after(e)
+            delay = _backoff(attempt) if delay is None else min(delay, EMBEDDING_RETRY_MAX_DELAY)
+            print(f"Embedding request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+def create_client(**kwargs):
+    """Async Azure OpenAI client; retries are handled here rather than by the SDK."""
+    options = {
+        "api_key": AZURE_OPENAI_API_KEY,
+        "api_version": AZURE_OPENAI_API_VERSION,
+        "azure_endpoint": AZURE_OPENAI_ENDPOINT,
+        "max_retries": 0
+    }
+    options.update(kwargs)
+    return AsyncAzureOpenAI(**options)
+
+async def generate_embeddings_batch_async(texts, client=None, concurrency=EMBEDDING_CONCURRENCY):
+    """Async counterpart of embeddings.generate_embeddings_batch with the same return value.
+
+    Up to `concurrency` requests are in flight at once, paced by EMBEDDING_RPM_LIMIT and
+    EMBEDDING_TPM_LIMIT, and rate-limited or failed requests are retried with backoff.
+    """
+    if get_local_backend() is not None:
+        # Local backends embed in-process; keep the event loop free while they do
+        return await asyncio.to_thread(embeddings.generate_embeddings_batch, texts)
+
+    owns_client = client is None
+    client = client or create_client()
+    cache = embeddings.cache
+    result, failed, pending = embeddings.cached_embeddings(texts)
+    batches, rejected = embeddings.pack_batches(texts, pending)
+    failed.update(rejected)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def embed_batch(batch, token_count):
+        async with semaphore:
+            try:
+                result[batch] = await _request_with_retries(client, [texts[i] for i in batch], token_count)
+            except Exception as e:
+                if len(batch) == 1:
+                    failed[batch[0]] = str(e)
+                    return
+                print(f"Batch of {len(batch)} embeddings failed, retrying individually: {e}")
+                for i in batch:
+                    try:
+                        result[i] = (await _request_with_retries(client, [texts[i]], token_count // len(batch)))[0]
+                    except Exception as item_error:
+                        failed[i] = str(item_error)
+        if cache is not None:
+            embedded = [i for i in batch if i not in failed]
+            cache.put_many(AZURE_EMBEDDING_DEPLOYMENT, [texts[i] for i in embedded], result[embedded])
+
+    try:
+        await asyncio.gather(*(embed_batch(batch, token_count) for batch, token_count in batches))
+    finally:
+        if owns_client:
+            await client.close()
+    return result, failed
+
+def generate_embeddings_concurrent(texts):
+    """Blocking wrapper around generate_embeddings_batch_async for synchronous callers."""
+    return asyncio.run(generate_embeddings_batch_async(texts))
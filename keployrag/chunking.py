@@ -0,0 +1,86 @@
+from keployrag.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, INDEX_GRANULARITY
+from keployrag.tokens import count_tokens
+
+def _split_long_line(line, max_tokens):
+    """Split a single line that is over the budget into pieces that fit."""
+    pieces = []
+    while line:
+        # Shrink the piece until it fits; tokens are at least one character
+        size = min(len(line), max_tokens * 4)
+        while size > 1 and count_tokens(line[:size]) > max_tokens:
+            size = size * max_tokens // count_tokens(line[:size]) or size // 2
+        pieces.append(line[:size])
+        line = line[size:]
+    return pieces
+
+def _break_point(lines, start, end):
+    """Where to end the window lines[start:end]: after the last blank line or before the last
+    top-level statement in its second half, so chunks tend to hold whole definitions."""
+    for i in range(end - 1, start + (end - start) // 2, -1):
+        text = lines[i][1]
+        if not text.strip():
+            return i + 1
+        if not text[0].isspace():
+            return i
+    return end
+
+def chunk_file(content, filepath):
+    """Split a source file into the entries to embed, according to INDEX_GRANULARITY."""
+    if INDEX_GRANULARITY == "symbol":
+        # Imported here so tree-sitter is only needed when symbol indexing is enabled
+        from keployrag.symbols import extract_symbol_chunks
+        chunks = extract_symbol_chunks(content, filepath)
+        if chunks:
+            return chunks
+    return chunk_text(content)
+
+def chunk_text(content, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Split content into overlapping windows of whole lines within a token budget.
+
+    Returns a list of dicts with the chunk content, its 1-based inclusive line range and its
+    byte offsets in the UTF-8 encoded content. Content within the budget is a single chunk.
+    """
+    total_bytes = len(content.encode("utf-8"))
+    if count_tokens(content) <= max_tokens:
+        return [{
+            "content": content,
+            "start_line": 1,
+            "end_line": content.count("\n") + 1,
+            "start_byte": 0,
+            "end_byte": total_bytes
+        }]
+
+    # (line number, text, byte offset, tokens) per line, with over-long lines pre-split
+    lines = []
+    offset = 0
+    for number, line in enumerate(content.splitlines(keepends=True), start=1):
+        for piece in _split_long_line(line, max_tokens):
+            lines.append((number, piece, offset, count_tokens(piece)))
+            offset += len(piece.encode("utf-8"))
+
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end, tokens = start, 0
+        while end < len(lines) and tokens + lines[end][3] <= max_tokens:
+            tokens += lines[end][3]
+            end += 1
+        if end < len(lines):
+            end = _break_point(lines, start, end)
+        window = lines[start:end]
+        chunks.append({
+            "content": "".join(line[1] for line in window),
+            "start_line": window[0][0],
+            "end_line": window[-1][0],
+            "start_byte": window[0][2],
+            "end_byte": window[-1][2] + len(window[-1][1].encode("utf-8"))
+        })
+        if end == len(lines):
+            break
+        # Step back over up to overlap_tokens of trailing lines, always moving forward
+        next_start, overlap = end, 0
+        while next_start - 1 > start and overlap + lines[next_start - 1][3] <= overlap_tokens:
+            next_start -= 1
+            overlap += lines[next_start][3]
+        start = next_start
+    return chunks
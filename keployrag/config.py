@@ -12,20 +12,133 @@ AZURE_CHAT_DEPLOYMENT = os.getenv("AZURE_CHAT_DEPLOYMENT", "gpt-4")
 
 EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 1536))
 
+# Embedding backend: "azure" (Azure OpenAI), "hashing" (CPU-only feature hashing, no model files)
+# or "onnx" (a sentence encoder exported to ONNX, loaded from EMBEDDING_MODEL_PATH). The docs
+# index uses DOCS_EMBEDDING_BACKEND, which defaults to the same backend.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "azure").lower()
+DOCS_EMBEDDING_BACKEND = os.getenv("DOCS_EMBEDDING_BACKEND", EMBEDDING_BACKEND).lower()
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH")
+EMBEDDING_MAX_LENGTH = int(os.getenv("EMBEDDING_MAX_LENGTH", 512))
+
+# Embedding request packing: at most EMBEDDING_BATCH_SIZE inputs and EMBEDDING_BATCH_TOKENS tokens
+# per request, and no single input over the model's EMBEDDING_MAX_TOKENS limit
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 100000))
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", 8191))
+
+# Source files over CHUNK_MAX_TOKENS are split into windows of whole lines of at most that many
+# tokens, each overlapping the previous one by up to CHUNK_OVERLAP_TOKENS
+CHUNK_MAX_TOKENS = min(int(os.getenv("CHUNK_MAX_TOKENS", 1024)), EMBEDDING_MAX_TOKENS)
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 128))
+# "chunk" embeds token windows of each file; "symbol" embeds each class, method, function and block of
+# module-level code found by tree-sitter as its own entry (files in unsupported languages are still chunked)
+INDEX_GRANULARITY = os.getenv("INDEX_GRANULARITY", "chunk").lower()
+# Symbol indexing keeps the syntax trees of the last TREE_CACHE_SIZE files it parsed, so a changed
+# file is re-parsed incrementally from its previous tree
+TREE_CACHE_SIZE = int(os.getenv("TREE_CACHE_SIZE", 256))
+# With symbol indexing, answers also show up to GRAPH_CONTEXT_CALLERS callers of each retrieved
+# symbol, found through the symbol graph rather than by vector search
+GRAPH_CONTEXT_CALLERS = int(os.getenv("GRAPH_CONTEXT_CALLERS", 2))
+# Identifiers in a query (`quoted`, snake_case, camelCase or dotted names) are first looked up in the
+# index's identifier index. When each of them names a class, method or function, those exact hits answer
+# the query without an embedding call, unless SEARCH_EXACT_FAST_PATH is false; otherwise exact and vector
+# hits are merged by reciprocal rank fusion
+SEARCH_EXACT_FAST_PATH = os.getenv("SEARCH_EXACT_FAST_PATH", "true").lower() in ("1", "true", "yes")
+
 # Project directory
 WATCHED_DIR = os.getenv("WATCHED_DIR", os.path.join(os.getcwd(), 'keployrag'))
 
 # FAISS index file path
 FAISS_INDEX_FILE = os.getenv("FAISS_INDEX_FILE", os.path.join(WATCHED_DIR, 'keployrag_index.faiss'))
 
+# Index type: flat, ivf_flat, ivf_pq or hnsw. Types that need training start out flat and are
+# migrated at a checkpoint once the index holds enough vectors to train on.
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat").lower()
+INDEX_NLIST = int(os.getenv("INDEX_NLIST", 256))
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", 16))
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", 64))
+INDEX_PQ_NBITS = int(os.getenv("INDEX_PQ_NBITS", 8))
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", 32))
+INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", 200))
+INDEX_HNSW_EF_SEARCH = int(os.getenv("INDEX_HNSW_EF_SEARCH", 64))
+INDEX_TRAIN_SIZE = int(os.getenv("INDEX_TRAIN_SIZE", 100000))
+# Scalar quantization of the stored vectors: none (float32), fp16 (2x smaller) or int8 (4x smaller,
+# trained on the first INDEX_SQ_TRAIN_SIZE vectors). Applies to flat, ivf_flat and hnsw indexes;
+# ivf_pq is already compressed. The docs index is set separately with DOCS_INDEX_QUANTIZATION.
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "none").lower()
+INDEX_SQ_TRAIN_SIZE = int(os.getenv("INDEX_SQ_TRAIN_SIZE", 1000))
+DOCS_INDEX_QUANTIZATION = os.getenv("DOCS_INDEX_QUANTIZATION", "none").lower()
+# HNSW cannot delete in place; removed vectors are masked until they exceed this share of the index
+INDEX_TOMBSTONE_RATIO = float(os.getenv("INDEX_TOMBSTONE_RATIO", 0.1))
+
+# Optional read-only shards for search: "directory" groups files by their top INDEX_SHARD_DEPTH
+# directories, "hash" spreads them evenly over INDEX_SHARD_COUNT shards. Shards are memory-mapped
+# unless INDEX_MMAP is disabled.
+INDEX_SHARDING = os.getenv("INDEX_SHARDING", "none").lower()
+INDEX_SHARD_DEPTH = int(os.getenv("INDEX_SHARD_DEPTH", 1))
+INDEX_SHARD_COUNT = int(os.getenv("INDEX_SHARD_COUNT", 16))
+INDEX_MMAP = os.getenv("INDEX_MMAP", "true").lower() in ("1", "true", "yes")
+
+# SQLite metadata store for the code index; file content is zlib-compressed unless disabled
+METADATA_DB_FILE = os.getenv("METADATA_DB_FILE", os.path.splitext(FAISS_INDEX_FILE)[0] + "_metadata.db")
+METADATA_COMPRESSION = os.getenv("METADATA_COMPRESSION", "true").lower() in ("1", "true", "yes")
+
+# Concurrent embedding client: requests in flight, the deployment's rate limits (0 = unlimited)
+# and retries with exponential backoff for rate-limited or failed requests
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+EMBEDDING_RPM_LIMIT = int(os.getenv("EMBEDDING_RPM_LIMIT", 0))
+EMBEDDING_TPM_LIMIT = int(os.getenv("EMBEDDING_TPM_LIMIT", 0))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 6))
+EMBEDDING_RETRY_BASE_DELAY = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", 1.0))
+EMBEDDING_RETRY_MAX_DELAY = float(os.getenv("EMBEDDING_RETRY_MAX_DELAY", 60.0))
+
+# Persistent embedding cache keyed by (deployment, content hash), evicted LRU past the size cap
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", os.path.splitext(FAISS_INDEX_FILE)[0] + "_embedding_cache.db")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Append-only index log: compacted into a checkpoint once any of these thresholds is reached
+INDEX_LOG_MAX_ENTRIES = int(os.getenv("INDEX_LOG_MAX_ENTRIES", 256))
+INDEX_LOG_MAX_BYTES = int(os.getenv("INDEX_LOG_MAX_BYTES", 64 * 1024 * 1024))
+INDEX_CHECKPOINT_INTERVAL = float(os.getenv("INDEX_CHECKPOINT_INTERVAL", 300))
+
+# How startup finds the files changed since the index was last brought up to date: "auto" asks git
+# (the recorded commit diffed against the work tree) when WATCHED_DIR is in a git repository and
+# stats every file against the manifest otherwise; "manifest" always stats every file
+INDEX_SYNC_MODE = os.getenv("INDEX_SYNC_MODE", "auto").lower()
+
+# Full reindex pipeline: REINDEX_READ_WORKERS threads read and chunk files into groups of REINDEX_GROUP_FILES,
+# up to REINDEX_EMBED_GROUPS groups are embedded at once, and a single writer adds them to the index. The queues
+# between stages hold at most REINDEX_QUEUE_SIZE groups, so a slow stage holds back the ones before it.
+# Progress is reported every REINDEX_PROGRESS_INTERVAL seconds.
+REINDEX_READ_WORKERS = int(os.getenv("REINDEX_READ_WORKERS", 8))
+REINDEX_GROUP_FILES = int(os.getenv("REINDEX_GROUP_FILES", 128))
+REINDEX_EMBED_GROUPS = int(os.getenv("REINDEX_EMBED_GROUPS", 2))
+REINDEX_QUEUE_SIZE = int(os.getenv("REINDEX_QUEUE_SIZE", 4))
+REINDEX_PROGRESS_INTERVAL = float(os.getenv("REINDEX_PROGRESS_INTERVAL", 10.0))
+
+# File watcher: changes are queued and coalesced per path, and a path is indexed once it has been quiet
+# for WATCH_DEBOUNCE_SECONDS (or has waited WATCH_MAX_DELAY_SECONDS under constant edits). WATCH_WORKERS
+# threads drain the queue in batches of up to WATCH_BATCH_SIZE files.
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", 1.0))
+WATCH_MAX_DELAY_SECONDS = float(os.getenv("WATCH_MAX_DELAY_SECONDS", 10.0))
+WATCH_BATCH_SIZE = int(os.getenv("WATCH_BATCH_SIZE", 32))
+WATCH_WORKERS = int(os.getenv("WATCH_WORKERS", 2))
+WATCH_STATS_INTERVAL = float(os.getenv("WATCH_STATS_INTERVAL", 30.0))
+
 # Project-Specific Configuration
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Paths skipped by full reindexing, startup checks and the watcher, as gitignore-style patterns
+# relative to WATCHED_DIR: a leading "/" anchors a pattern to WATCHED_DIR, a trailing "/" matches
+# directories only and "**" spans directories. IGNORE_PATTERNS adds comma-separated patterns.
+# .gitignore files under WATCHED_DIR are honoured too (and take precedence, as in git) unless
+# USE_GITIGNORE is false.
 IGNORE_PATHS = [
-    os.path.join(WATCHED_DIR, ".venv"),
-    os.path.join(WATCHED_DIR, "node_modules"),
-    os.path.join(WATCHED_DIR, "__pycache__"),
-    "**/__pycache__",
-    os.path.join(WATCHED_DIR, ".git"),
-    os.path.join(WATCHED_DIR, "tests"),
-]
\ No newline at end of file
+    "/.venv/",
+    "/node_modules/",
+    "**/__pycache__/",
+    ".git/",
+    "/tests/",
+] + [p.strip() for p in os.getenv("IGNORE_PATTERNS", "").split(",") if p.strip()]
+USE_GITIGNORE = os.getenv("USE_GITIGNORE", "true").lower() in ("1", "true", "yes")
\ No newline at end of file
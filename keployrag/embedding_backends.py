@@ -0,0 +1,132 @@
+import os
+import re
+import zlib
+import numpy as np
+from keployrag.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_PATH,
+    EMBEDDING_MAX_LENGTH,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_DIM
+)
+
+# Identifiers are split on case and underscores so getUserName, get_user_name and
+# GetUserName share features; numbers are kept as their own tokens
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_SUBWORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+class HashingEmbedder:
+    """CPU-only embeddings from signed feature hashing; needs no model files or network.
+
+    Each text becomes a bag of identifiers, their sub-words and adjacent sub-word pairs,
+    hashed into `dim` buckets with sublinear term frequency and L2-normalised, so the
+    index's L2 distance ranks by cosine similarity.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        # Stored alongside cached vectors; bump the version when the feature set changes
+        self.cache_key = f"hashing-v1-{dim}"
+
+    def _features(self, text):
+        features = []
+        for word in _WORD_RE.findall(text):
+            subwords = [s.lower() for s in _SUBWORD_RE.findall(word)]
+            features.append(word.lower())
+            if len(subwords) > 1:
+                features.extend(subwords)
+                features.extend(f"{a} {b}" for a, b in zip(subwords, subwords[1:]))
+        return features
+
+    def _vector(self, text):
+        counts = {}
+        for feature in self._features(text):
+            # crc32 rather than hash(): it must be stable across processes
+            h = zlib.crc32(feature.encode("utf-8"))
+            bucket = h % self.dim
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            counts[bucket] = counts.get(bucket, 0.0) + sign
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if counts:
+            buckets = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            vector[buckets] = np.sign(values) * np.log1p(np.abs(values))
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+        return vector
+
+    def embed(self, texts):
+        """Return a float32 matrix with one row per text."""
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            embeddings[i] = self._vector(text)
+        return embeddings
+
+class OnnxEmbedder:
+    """Sentence encoder exported to ONNX, run on CPU with onnxruntime.
+
+    model_path is a directory holding model.onnx and the matching Hugging Face tokenizer.json.
+    Token embeddings are mean-pooled over the attention mask and L2-normalised.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path=EMBEDDING_MODEL_PATH, dim=EMBEDDING_DIM, max_length=EMBEDDING_MAX_LENGTH):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("The onnx embedding backend needs the onnxruntime and tokenizers packages") from e
+        if not model_path or not os.path.isdir(model_path):
+            raise ValueError(f"EMBEDDING_MODEL_PATH must be a directory with model.onnx and tokenizer.json, got {model_path!r}")
+
+        self.dim = dim
+        self.cache_key = f"onnx-{os.path.basename(os.path.normpath(model_path))}-{dim}"
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_path, "model.onnx"), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def embed(self, texts):
+        """Return a float32 matrix with one row per text."""
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            encoded = self.tokenizer.encode_batch(texts[start:start + EMBEDDING_BATCH_SIZE])
+            input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                inputs["token_type_ids"] = np.array([e.type_ids for e in encoded], dtype=np.int64)
+            token_embeddings = self.session.run(None, inputs)[0]
+            if token_embeddings.shape[-1] != self.dim:
+                raise ValueError(f"Model produces {token_embeddings.shape[-1]}-dimensional embeddings but EMBEDDING_DIM is {self.dim}")
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            embeddings[start:start + len(encoded)] = pooled
+        return embeddings
+
+LOCAL_BACKENDS = {
+    "hashing": HashingEmbedder,
+    "onnx": OnnxEmbedder
+}
+
+_local_backends = {}
+
+def get_local_backend(name=None):
+    """Return the local embedder for a backend name (EMBEDDING_BACKEND by default), or None
+    for the Azure OpenAI backend."""
+    name = name or EMBEDDING_BACKEND
+    if name == "azure":
+        return None
+    if name not in LOCAL_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {name!r}; expected azure, {', '.join(LOCAL_BACKENDS)}")
+    if name not in _local_backends:
+        _local_backends[name] = LOCAL_BACKENDS[name]()
+    return _local_backends[name]
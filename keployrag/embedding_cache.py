@@ -0,0 +1,137 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (embedding deployment, content hash).
+
+    Entries are evicted least-recently-used first once the cache grows past max_bytes.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = None
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    deployment TEXT NOT NULL,
+                    content_hash BLOB NOT NULL,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (deployment, content_hash)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            conn.commit()
+            (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+            self._total_bytes = total
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def content_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, deployment, texts, dim):
+        """Return {position: vector} for the texts that are cached."""
+        hashes = [self.content_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            by_hash = {}
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE deployment = ? "
+                    f"AND content_hash IN ({', '.join('?' * len(chunk))})",
+                    [deployment] + chunk
+                ).fetchall()
+                by_hash.update(rows)
+            for i, content_hash in enumerate(hashes):
+                vector = by_hash.get(content_hash)
+                if vector is not None and len(vector) == dim * 4:
+                    found[i] = np.frombuffer(vector, dtype=np.float32)
+            if found:
+                now = time.time()
+                with conn:
+                    conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE deployment = ? AND content_hash = ?",
+                        [(now, deployment, hashes[i]) for i in found]
+                    )
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, deployment, texts, vectors):
+        """Store one vector per text, then evict old entries if the cache is over its size cap."""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.ascontiguousarray(vector, dtype=np.float32).tobytes()
+            rows.append((deployment, self.content_hash(text), blob, len(blob), now))
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._total_bytes += sum(row[3] for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict(conn)
+
+    def _evict(self, conn):
+        # Evict down to 90% of the cap so a full cache does not evict on every insert
+        target = int(self.max_bytes * 0.9)
+        (self._total_bytes,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        while self._total_bytes > target:
+            rows = conn.execute(
+                "SELECT rowid, size FROM embeddings ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            evict = []
+            for rowid, size in rows:
+                if self._total_bytes <= target:
+                    break
+                evict.append((rowid,))
+                self._total_bytes -= size
+            with conn:
+                conn.executemany("DELETE FROM embeddings WHERE rowid = ?", evict)
+            self.evictions += len(evict)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes
+            }
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM embeddings")
+            self._total_bytes = 0
@@ -3,26 +3,139 @@ from keployrag.config import (
     AZURE_OPENAI_ENDPOINT,
     AZURE_OPENAI_API_KEY,
     AZURE_OPENAI_API_VERSION,
-    AZURE_EMBEDDING_DEPLOYMENT
+    AZURE_EMBEDDING_DEPLOYMENT,
+    EMBEDDING_DIM,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_MAX_TOKENS,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_FILE,
+    EMBEDDING_CACHE_MAX_BYTES
 )
+from keployrag.tokens import count_tokens
+from keployrag.embedding_cache import EmbeddingCache
+from keployrag.embedding_backends import get_local_backend
 from openai import AzureOpenAI
 
-# Initialize Azure OpenAI client
-client = AzureOpenAI(
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_OPENAI_API_VERSION,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT
-)
+# Azure OpenAI client, created on first use so the module can be imported without credentials
+client = None
+
+def get_client():
+    global client
+    if client is None:
+        client = AzureOpenAI(
+            api_key=AZURE_OPENAI_API_KEY,
+            api_version=AZURE_OPENAI_API_VERSION,
+            azure_endpoint=AZURE_OPENAI_ENDPOINT
+        )
+    return client
+
+cache = EmbeddingCache(EMBEDDING_CACHE_FILE, EMBEDDING_CACHE_MAX_BYTES) if EMBEDDING_CACHE_ENABLED else None
+
+def cache_key():
+    """Name cached vectors are stored under, so different models never share cache entries."""
+    backend = get_local_backend()
+    return AZURE_EMBEDDING_DEPLOYMENT if backend is None else backend.cache_key
 
 def generate_embeddings(text):
-    """Generate embeddings using Azure OpenAI."""
+    """Generate embeddings with the configured backend (Azure OpenAI by default)."""
+    embeddings, failed = generate_embeddings_batch([text])
+    if failed:
+        print(f"Error generating embeddings: {failed[0]}")
+        return None
+    return embeddings
+
+def pack_batches(texts, positions):
+    """Group input positions into requests within the item-count and token budgets.
+
+    Returns (batches, failed): batches is a list of (positions, token_count) and failed maps
+    positions that cannot be sent to a reason.
+    """
+    batches = []
+    failed = {}
+    batch, batch_tokens = [], 0
+    for i in positions:
+        text = texts[i]
+        tokens = count_tokens(text)
+        if tokens > EMBEDDING_MAX_TOKENS:
+            failed[i] = f"input has {tokens} tokens, over the {EMBEDDING_MAX_TOKENS} token limit"
+            continue
+        if batch and (len(batch) >= EMBEDDING_BATCH_SIZE or batch_tokens + tokens > EMBEDDING_BATCH_TOKENS):
+            batches.append((batch, batch_tokens))
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append((batch, batch_tokens))
+    return batches, failed
+
+def _request_embeddings(inputs):
+    response = get_client().embeddings.create(
+        model=AZURE_EMBEDDING_DEPLOYMENT,
+        input=inputs
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def cached_embeddings(texts):
+    """Look the non-empty texts up in the embedding cache.
+
+    Returns (embeddings, failed, pending): the matrix with cached rows filled in, the empty
+    inputs mapped to a reason, and the positions that still need embedding.
+    """
+    embeddings = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    failed = {i: "empty input" for i, text in enumerate(texts) if not text or not text.strip()}
+    pending = [i for i in range(len(texts)) if i not in failed]
+    if cache is not None and pending:
+        cached = cache.get_many(cache_key(), [texts[i] for i in pending], EMBEDDING_DIM)
+        for j, vector in cached.items():
+            embeddings[pending[j]] = vector
+        pending = [i for j, i in enumerate(pending) if j not in cached]
+    return embeddings, failed, pending
+
+def _embed_locally(backend, texts, embeddings, failed, pending):
     try:
-        response = client.embeddings.create(
-            model=AZURE_EMBEDDING_DEPLOYMENT,
-            input=[text]
-        )
-        embeddings = response.data[0].embedding
-        return np.array(embeddings).astype('float32').reshape(1, -1)
+        embeddings[pending] = backend.embed([texts[i] for i in pending])
     except Exception as e:
-        print(f"Error generating embeddings with Azure OpenAI: {e}")
-        return None
\ No newline at end of file
+        failed.update((i, str(e)) for i in pending)
+        return embeddings, failed
+    if cache is not None:
+        cache.put_many(backend.cache_key, [texts[i] for i in pending], embeddings[pending])
+    return embeddings, failed
+
+def generate_embeddings_batch(texts):
+    """Generate embeddings for many texts with as few Azure OpenAI requests as possible.
+
+    Returns (embeddings, failed): a contiguous float32 matrix with one row per input, and a
+    dict mapping the position of every input that could not be embedded to the reason.
+    Rows of failed inputs are left as zeros. Inputs already in the embedding cache are not sent.
+    With a local EMBEDDING_BACKEND the texts are embedded in-process instead.
+    """
+    embeddings, failed, pending = cached_embeddings(texts)
+    backend = get_local_backend()
+    if backend is not None:
+        return _embed_locally(backend, texts, embeddings, failed, pending) if pending else (embeddings, failed)
+
+    batches, rejected = pack_batches(texts, pending)
+    failed.update(rejected)
+    for batch, _ in batches:
+        try:
+            embeddings[batch] = _request_embeddings([texts[i] for i in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                failed[batch[0]] = str(e)
+                continue
+            # Retry one by one so a single bad input does not fail the rest of the request
+            print(f"Batch of {len(batch)} embeddings failed, retrying individually: {e}")
+            for i in batch:
+                try:
+                    embeddings[i] = _request_embeddings([texts[i]])[0]
+                except Exception as item_error:
+                    failed[i] = str(item_error)
+        if cache is not None:
+            embedded = [i for i in batch if i not in failed]
+            cache.put_many(AZURE_EMBEDDING_DEPLOYMENT, [texts[i] for i in embedded], embeddings[embedded])
+    return embeddings, failed
+
+def cache_stats():
+    """Hit/miss statistics of the embedding cache for this process, or None if it is disabled."""
+    return cache.stats() if cache is not None else None
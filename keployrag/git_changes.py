@@ -0,0 +1,64 @@
+import os
+import subprocess
+
+# Hash of git's empty tree, the base to diff against before the first commit
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+def _git(root, *args):
+    return subprocess.run(["git", "-C", root, *args], capture_output=True, check=True).stdout
+
+def repo_root(path):
+    """Top-level directory of the git work tree containing path, or None if there is none
+    (or git is not installed)."""
+    try:
+        return os.path.normpath(_git(path, "rev-parse", "--show-toplevel").decode().strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def head_commit(root):
+    """Commit checked out at root, or EMPTY_TREE in a repository without commits."""
+    try:
+        return _git(root, "rev-parse", "--verify", "--quiet", "HEAD").decode().strip()
+    except subprocess.CalledProcessError:
+        return EMPTY_TREE
+
+def changes_since(root, commit):
+    """Files in the work tree at root that differ from commit, including untracked files
+    that are not ignored.
+
+    Returns (changed, renamed): the absolute paths of files added, modified or deleted since
+    commit, and (old, new) absolute path pairs of files git detected as renamed. Raises
+    subprocess.CalledProcessError when commit is not known to the repository, e.g. after
+    its history was rewritten.
+    """
+    def absolute(path):
+        return os.path.join(root, *path.split("/"))
+
+    changed, renamed = set(), []
+    # Comparing a commit with the work tree covers both committed and uncommitted changes
+    fields = _git(root, "diff", "--name-status", "-M", "-z", "--no-ext-diff", commit, "--").decode(
+        "utf-8", "surrogateescape").split("\0")
+    i = 0
+    while i < len(fields) and fields[i]:
+        status = fields[i]
+        if status[0] in "RC":
+            old, new = fields[i + 1], fields[i + 2]
+            if status[0] == "R":
+                renamed.append((absolute(old), absolute(new)))
+            else:
+                changed.add(absolute(new))
+            i += 3
+        else:
+            changed.add(absolute(fields[i + 1]))
+            i += 2
+    untracked = _git(root, "ls-files", "--others", "--exclude-standard", "-z").decode("utf-8", "surrogateescape")
+    changed.update(absolute(path) for path in untracked.split("\0") if path)
+    return changed, renamed
+
+def work_tree_state(root):
+    """(commit, dirty): the checked out commit and the absolute paths of files that differ
+    from it, so a later changes_since(commit) plus dirty covers everything that may have
+    changed since now."""
+    commit = head_commit(root)
+    changed, renamed = changes_since(root, commit)
+    return commit, changed.union(*renamed)
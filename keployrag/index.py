@@ -1,72 +1,479 @@
 import os
+import time
+import hashlib
+import shutil
+import threading
 import faiss
 import numpy as np
-from keployrag.config import EMBEDDING_DIM, FAISS_INDEX_FILE, WATCHED_DIR
+from keployrag.config import (
+    FAISS_INDEX_FILE,
+    WATCHED_DIR,
+    METADATA_DB_FILE,
+    METADATA_COMPRESSION,
+    INDEX_LOG_MAX_ENTRIES,
+    INDEX_LOG_MAX_BYTES,
+    INDEX_CHECKPOINT_INTERVAL,
+    INDEX_TYPE,
+    INDEX_QUANTIZATION,
+    INDEX_TOMBSTONE_RATIO,
+    INDEX_SHARDING
+)
+from keployrag.metadata_store import MetadataStore
+from keployrag.index_log import encode_record, read_log
+from keployrag.index_types import (
+    build_index,
+    configure_search,
+    convert_index,
+    index_kind,
+    index_quantization,
+    live_vectors,
+    min_train_size,
+    search_index,
+    supports_remove
+)
+from keployrag.shards import ShardedIndex, load_manifest, shard_key, write_shards
 
-index = faiss.IndexFlatL2(EMBEDDING_DIM)
-metadata = []
+# Pickled metadata written by older versions next to the index; imported into the metadata store on load.
+METADATA_FILE = os.path.join(os.path.dirname(FAISS_INDEX_FILE), "metadata.npy")
+# Where the first versions saved it instead: relative to the working directory.
+WORKING_DIR_METADATA_FILE = "metadata.npy"
+# Written by save_index after the index file, so readers can tell
+# when the on-disk generation changed without re-reading it.
+VERSION_FILE = FAISS_INDEX_FILE + ".version"
+# Changes made since the last checkpoint, replayed on top of it when loading.
+LOG_FILE = FAISS_INDEX_FILE + ".log"
+# Read-only per-shard copies of each checkpoint, written when INDEX_SHARDING is enabled.
+SHARD_DIR = FAISS_INDEX_FILE + ".shards"
+
+def _new_index():
+    """Create an empty index addressed by explicit 64-bit vector IDs.
+
+    Index types (or int8 quantization) that need training start out as a float32 flat
+    index until there is enough data to train them.
+    """
+    if min_train_size(INDEX_TYPE):
+        return build_index("flat", quantization="none")
+    return build_index(INDEX_TYPE)
+
+index = _new_index()
+store = MetadataStore(METADATA_DB_FILE, compress=METADATA_COMPRESSION)
+# IDs removed from an index type that cannot delete in place (HNSW), masked out of searches
+_tombstones = set()
+# Files changed since the last checkpoint, so only their shards are rewritten
+_dirty_paths = set()
+_sharded = None
+
+_index_lock = threading.RLock()
+_loaded_generation = None
+_log_offset = 0
+_log_entries = 0
+_last_checkpoint = time.monotonic()
 
 def clear_index():
     """Delete the FAISS index and metadata files if they exist, and reinitialize the index."""
-    global index, metadata
-    
+    global index, _tombstones, _sharded, _loaded_generation, _log_offset, _log_entries, _last_checkpoint
+
     # Delete the FAISS index file
     if os.path.exists(FAISS_INDEX_FILE):
         os.remove(FAISS_INDEX_FILE)
         print(f"Deleted FAISS index file: {FAISS_INDEX_FILE}")
 
-    # Delete the metadata file
-    metadata_file = "metadata.npy"
-    if os.path.exists(metadata_file):
-        os.remove(metadata_file)
-        print(f"Deleted metadata file: {metadata_file}")
+    for path in (METADATA_FILE, WORKING_DIR_METADATA_FILE, VERSION_FILE, LOG_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(SHARD_DIR, ignore_errors=True)
 
     # Reinitialize the FAISS index and metadata
-    index = faiss.IndexFlatL2(EMBEDDING_DIM)
-    metadata = []
+    with _index_lock:
+        index = _new_index()
+        _tombstones = set()
+        _dirty_paths.clear()
+        # The sharded view still holds the deleted shards and log offset
+        _sharded = None
+        store.clear()
+        _loaded_generation = None
+        _log_offset = 0
+        _log_entries = 0
+        _last_checkpoint = time.monotonic()
     print("FAISS index and metadata cleared and reinitialized.")
 
-def add_to_index(embeddings, full_content, filename, filepath):
-    global index, metadata
-    
-    relative_filepath = os.path.relpath(filepath, WATCHED_DIR)
-    metadata = [m for m in metadata if m["filepath"] != relative_filepath]
+def add_to_index(embeddings, full_content, filename, filepath, chunks=None):
+    """Add a file's embeddings to the index, replacing any vectors it already had.
+
+    With chunks (as returned by chunking.chunk_text) there is one embedding per chunk and
+    each gets its own metadata row; otherwise every embedding describes the whole file.
+    The change is appended to the index log rather than rewriting the whole index;
+    call save_index() to force a checkpoint.
+    """
+    add_files_to_index([(embeddings, full_content, filename, filepath, chunks)])
+
+def _file_entries(embeddings, full_content, filename, filepath, chunks):
     if embeddings.shape[1] != index.d:
         raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match index dimension {index.d}")
-    index.add(embeddings)
-    metadata.append({
-        "content": full_content,
-        "filename": filename,
-        "filepath": relative_filepath
-    })
-    save_index()
+    if chunks is not None and len(chunks) != len(embeddings):
+        raise ValueError(f"Got {len(embeddings)} embeddings for {len(chunks)} chunks of {filepath}")
+
+    relative_filepath = os.path.relpath(filepath, WATCHED_DIR)
+    if chunks is None:
+        chunks = [{
+            "content": full_content,
+            "start_line": 1,
+            "end_line": full_content.count("\n") + 1,
+            "start_byte": 0,
+            "end_byte": len(full_content.encode("utf-8"))
+        }] * len(embeddings)
+    return relative_filepath, [dict(chunk, filename=filename, filepath=relative_filepath) for chunk in chunks]
+
+def content_hash(content):
+    """Hash of a file's text as recorded in the manifest."""
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def _stat(filepath):
+    try:
+        return os.stat(filepath)
+    except OSError:
+        return None
+
+def _manifest_entry(relative_filepath, full_content, stat):
+    if stat is None:
+        return None
+    return relative_filepath, stat.st_size, stat.st_mtime_ns, content_hash(full_content)
+
+def existing_chunks(filepath):
+    """Metadata rows, with content, currently indexed for a file, keyed by vector ID."""
+    return store.get(store.ids_for_path(os.path.relpath(filepath, WATCHED_DIR)), with_content=True)
+
+def add_files_to_index(files):
+    """Add several files at once, each given as (embeddings, full_content, filename, filepath, chunks)
+    like the arguments of add_to_index. The whole group is one metadata transaction and one log record.
+
+    An optional sixth item, {vector_id: chunk}, lists chunks whose content is unchanged since the
+    file was last indexed: they keep their existing vectors and only get their metadata (line and
+    byte offsets) updated. Every other vector the file had is replaced.
+
+    An optional seventh item is the file's os.stat taken before full_content was read, recorded in
+    the manifest with the content's hash; an edit made while the file was being embedded then
+    shows up as a change. None records no manifest entry (and drops the old one), so the next
+    reconciliation reads the file again. Without it, the file is stat'ed when committed.
+    """
+    # A file listed twice keeps its last version
+    by_path = {}
+    manifest = {}
+    for embeddings, full_content, filename, filepath, chunks, *rest in files:
+        relative_filepath, entries = _file_entries(embeddings, full_content, filename, filepath, chunks)
+        kept = {vector_id: dict(chunk, filename=filename, filepath=relative_filepath)
+                for vector_id, chunk in (rest[0] if rest else {}).items()}
+        by_path[relative_filepath] = (entries, np.ascontiguousarray(embeddings, dtype=np.float32), kept)
+        stat = rest[1] if len(rest) > 1 else _stat(filepath)
+        manifest[relative_filepath] = _manifest_entry(relative_filepath, full_content, stat)
+    if not by_path:
+        return
+    total = sum(len(vectors) for _, vectors, _ in by_path.values())
+    with _index_lock:
+        # Pick up anything another process checkpointed before mutating our copy.
+        get_index()
+        next_id = store.allocate_ids(total)
+        ids = np.arange(next_id, next_id + total, dtype=np.int64)
+        replacements = []
+        offset = 0
+        kept_ids = set()
+        for relative_filepath, (entries, vectors, kept) in by_path.items():
+            replacements.append((relative_filepath, ids[offset:offset + len(vectors)].tolist() + list(kept),
+                                 entries + list(kept.values())))
+            offset += len(vectors)
+            kept_ids.update(kept)
+        # Metadata is committed first: rows whose vectors never made it into the log are
+        # unreachable from search and get cleaned up by the file's next replace.
+        old_ids = store.replace_paths(replacements, [entry for entry in manifest.values() if entry])
+        _dirty_paths.update(by_path)
+        _commit({
+            "op": "replace",
+            "remove_ids": np.asarray([i for i in old_ids if i not in kept_ids], dtype=np.int64),
+            "ids": ids,
+            "vectors": np.vstack([vectors for _, vectors, _ in by_path.values()])
+        })
+
+def remove_from_index(filepath):
+    """Remove every vector belonging to a file, or to any file under it when it is a
+    directory. Returns the number of vectors removed."""
+    relative_filepath = os.path.relpath(filepath, WATCHED_DIR)
+    with _index_lock:
+        get_index()
+        _dirty_paths.update(store.paths_under(relative_filepath))
+        old_ids = store.delete_path(relative_filepath, recursive=True)
+        if old_ids:
+            _commit({"op": "remove", "remove_ids": np.asarray(old_ids, dtype=np.int64)})
+        return len(old_ids)
+
+def is_indexed(filepath):
+    """Whether the index holds any vectors for a file."""
+    return bool(store.ids_for_path(os.path.relpath(filepath, WATCHED_DIR)))
+
+def move_in_index(src_path, dest_path):
+    """Re-key a moved file, or every file under a moved directory, to its new path without
+    re-embedding. Vectors previously indexed at a destination path are removed.
+    Returns the number of entries moved."""
+    old_path = os.path.relpath(src_path, WATCHED_DIR)
+    new_path = os.path.relpath(dest_path, WATCHED_DIR)
+    with _index_lock:
+        get_index()
+        moved_paths = store.paths_under(old_path)
+        moved, replaced_ids = store.move_path(old_path, new_path)
+        # Moved vectors keep their IDs, but may now belong to another shard
+        _dirty_paths.update(moved_paths)
+        _dirty_paths.update(new_path + path[len(old_path):] for path in moved_paths)
+        if replaced_ids:
+            _commit({"op": "remove", "remove_ids": np.asarray(replaced_ids, dtype=np.int64)})
+        return moved
+
+def index_in_sync():
+    """Whether every metadata row has a live vector, i.e. no change was lost between
+    committing metadata and appending to the log."""
+    with _index_lock:
+        return get_index().ntotal - len(_tombstones) == store.count()
+
+def _commit(record):
+    _apply_record(record)
+    _append_log(record)
+    _maybe_checkpoint()
+
+def _apply_record(record):
+    if record["op"] in ("replace", "remove"):
+        if len(record["remove_ids"]):
+            if supports_remove(index):
+                index.remove_ids(record["remove_ids"])
+            else:
+                _tombstones.update(record["remove_ids"].tolist())
+        if record["op"] == "replace":
+            index.add_with_ids(record["vectors"], record["ids"])
+    else:
+        raise ValueError(f"Unknown index log operation: {record['op']}")
+
+def _start_log(generation):
+    """Replace the log with an empty one belonging to the given checkpoint generation."""
+    global _log_offset, _log_entries, _last_checkpoint
+    data = encode_record({"op": "header", "generation": generation, "tombstones": sorted(_tombstones)})
+    tmp_file = LOG_FILE + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file, LOG_FILE)
+    _log_offset = len(data)
+    _log_entries = 0
+    _last_checkpoint = time.monotonic()
+
+def _append_log(record):
+    global _log_offset, _log_entries
+    if _loaded_generation is None:
+        # Nothing on disk to append to yet; the first checkpoint already contains this change.
+        save_index()
+        return
+    data = encode_record(record)
+    with open(LOG_FILE, "ab") as f:
+        f.write(data)
+    _log_offset += len(data)
+    _log_entries += 1
+
+def _replay_log():
+    """Apply log records written since the last replay. Returns False if the log belongs to
+    a different checkpoint than the one in memory."""
+    global _log_offset, _log_entries, _tombstones
+    for record, end_offset in read_log(LOG_FILE, _log_offset):
+        if record["op"] == "header":
+            if record["generation"] != _loaded_generation:
+                return False
+            _tombstones = set(record.get("tombstones", ()))
+        else:
+            _apply_record(record)
+            _log_entries += 1
+        _log_offset = end_offset
+    return True
+
+def _maybe_checkpoint():
+    if (_log_entries >= INDEX_LOG_MAX_ENTRIES
+            or _log_offset >= INDEX_LOG_MAX_BYTES
+            or time.monotonic() - _last_checkpoint >= INDEX_CHECKPOINT_INTERVAL):
+        save_index()
+
+def _write_generation(generation):
+    """Stamp a new on-disk generation."""
+    tmp_file = VERSION_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
+        f.write(generation)
+    os.replace(tmp_file, VERSION_FILE)
+
+def _read_generation():
+    """Return the on-disk generation, or None if no index has been saved yet.
+
+    Falls back to the index file mtime for indexes saved before version stamps existed.
+    """
+    try:
+        with open(VERSION_FILE) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    try:
+        return f"mtime-{os.stat(FAISS_INDEX_FILE).st_mtime_ns}"
+    except FileNotFoundError:
+        return None
 
 def save_index():
-    faiss.write_index(index, FAISS_INDEX_FILE)
-    with open("metadata.npy", "wb") as f:
-        np.save(f, metadata)
+    """Checkpoint the in-memory index, compacting the log. Metadata is already durable
+    in the metadata store."""
+    global _loaded_generation
+    with _index_lock:
+        _compact()
+        generation = f"{time.time_ns()}-{os.getpid()}"
+        faiss.write_index(index, FAISS_INDEX_FILE + ".tmp")
+        os.replace(FAISS_INDEX_FILE + ".tmp", FAISS_INDEX_FILE)
+        if INDEX_SHARDING != "none":
+            # Shards written for the checkpoint we started from only need the changed files redone
+            previous = load_manifest(SHARD_DIR)
+            in_sync = previous is not None and previous["generation"] == _loaded_generation
+            write_shards(
+                index, store.id_paths(), SHARD_DIR, generation,
+                dirty_keys={shard_key(p) for p in _dirty_paths} if in_sync else None,
+                exclude=_tombstones
+            )
+        # The in-memory copy is what was just written, so this process never reloads it.
+        # A log left over from the previous generation is ignored by readers until replaced.
+        _write_generation(generation)
+        _loaded_generation = generation
+        _dirty_paths.clear()
+        _start_log(generation)
+
+def _compact():
+    """Migrate a float32 flat index to the configured type and quantization once it can be
+    trained, and rebuild HNSW once too many of its vectors are tombstones. Other conversions
+    go through migrate_index."""
+    global index, _tombstones
+    kind = target = index_kind(index)
+    quantization = target_quantization = index_quantization(index)
+    configured = (INDEX_TYPE, INDEX_QUANTIZATION)
+    if (kind, quantization) == ("flat", "none") != configured and index.ntotal >= max(min_train_size(INDEX_TYPE), 1):
+        target, target_quantization = configured
+        print(f"Migrating {kind} index with {index.ntotal} vectors to {target} ({target_quantization} quantization)")
+    elif _tombstones and len(_tombstones) > INDEX_TOMBSTONE_RATIO * index.ntotal:
+        print(f"Rebuilding {kind} index to drop {len(_tombstones)} removed vectors")
+    else:
+        return
+    index = convert_index(index, target, exclude=_tombstones, quantization=target_quantization)
+    _tombstones = set()
+
+def migrate_index(index_type=INDEX_TYPE, quantization=INDEX_QUANTIZATION):
+    """Rebuild the current index as the given type and quantization and checkpoint it."""
+    global index, _tombstones
+    with _index_lock:
+        get_index()
+        index = convert_index(index, index_type, exclude=_tombstones, quantization=quantization)
+        _tombstones = set()
+        save_index()
+        return index
+
+def _import_legacy_metadata(loaded_index, metadata_file):
+    """Move a pickled metadata.npy written by older versions into the metadata store.
+
+    Indexes saved before vector IDs existed kept metadata as a positional list, and dropped a
+    replaced file's entry while its vectors stayed in the index: after any edit, orphaned
+    vectors sit between live ones and positions no longer line up. Such an index is only
+    imported when it has exactly one vector per entry; otherwise it is discarded along with
+    the metadata, leaving an empty index and no manifest so the next start rebuilds it.
+    """
+    with open(metadata_file, "rb") as f:
+        legacy = np.load(f, allow_pickle=True)
+    legacy = legacy.item() if legacy.ndim == 0 else dict(enumerate(legacy.tolist()))
+    if not isinstance(loaded_index, faiss.IndexIDMap2):
+        upgraded = _new_index()
+        if loaded_index.ntotal != len(legacy):
+            store.clear()
+            os.remove(metadata_file)
+            print(f"Discarded a legacy index of {loaded_index.ntotal} vectors for {len(legacy)} metadata "
+                  f"entries in {metadata_file}; the index has to be rebuilt")
+            return upgraded
+        ids = np.arange(len(legacy), dtype=np.int64)
+        if len(ids):
+            upgraded.add_with_ids(loaded_index.reconstruct_n(0, len(ids)), ids)
+        loaded_index = upgraded
+    for vector_id, entry in legacy.items():
+        store.replace_path(entry["filepath"], [vector_id], [entry])
+    os.remove(metadata_file)
+    print(f"Imported {len(legacy)} metadata entries from {metadata_file} into {store.path}")
+    return loaded_index
 
 def load_index():
-    global index, metadata
-    index = faiss.read_index(FAISS_INDEX_FILE)
-    with open("metadata.npy", "rb") as f:
-        metadata = np.load(f, allow_pickle=True).tolist()
-    return index
+    """Load the last checkpoint from disk and replay the log on top of it."""
+    global index, _tombstones, _loaded_generation, _log_offset, _log_entries
+    with _index_lock:
+        generation = _read_generation()
+        index = configure_search(faiss.read_index(FAISS_INDEX_FILE))
+        _tombstones = set()
+        _loaded_generation = generation
+        _log_offset = 0
+        _log_entries = 0
+        for metadata_file in (METADATA_FILE, WORKING_DIR_METADATA_FILE):
+            if os.path.exists(metadata_file):
+                index = _import_legacy_metadata(index, metadata_file)
+                save_index()
+                return index
+        _replay_log()
+        return index
+
+def get_index():
+    """Return the resident index, reloading from disk only when a newer generation was saved
+    and replaying only the log records appended since the last call."""
+    with _index_lock:
+        generation = _read_generation()
+        if generation is not None and generation != _loaded_generation:
+            load_index()
+        elif generation is not None and os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > _log_offset:
+            _replay_log()
+        return index
+
+def _sharded_index():
+    global _sharded
+    if _sharded is None:
+        _sharded = ShardedIndex(SHARD_DIR, LOG_FILE)
+    return _sharded
+
+def search_vectors(query_embedding, k=5):
+    """Search the index, returning (distances, ids) like faiss.Index.search.
+
+    With INDEX_SHARDING enabled this reads the memory-mapped shards instead of loading
+    the whole index.
+    """
+    if INDEX_SHARDING != "none":
+        return _sharded_index().search(query_embedding, k)
+    with _index_lock:
+        return search_index(get_index(), query_embedding, k, exclude=_tombstones)
+
+def index_size():
+    """Number of live vectors available to search_vectors."""
+    if INDEX_SHARDING != "none":
+        sharded = _sharded_index()
+        sharded.refresh()
+        return sharded.ntotal
+    with _index_lock:
+        return get_index().ntotal - len(_tombstones)
+
+def get_metadata(ids=None, with_content=False):
+    """Return metadata entries keyed by vector ID, for the given IDs or the whole index.
+
+    File content is only read from the store when with_content is set.
+    """
+    if ids is None:
+        return dict(store.entries(with_content=with_content))
+    return store.get(ids, with_content=with_content)
 
-def get_metadata():
-    return metadata
+def find_identifiers(names, limit=None):
+    """(defined, used) lookups of exact identifiers, as MetadataStore.find_identifiers."""
+    return store.find_identifiers(names, limit)
 
 def retrieve_vectors(n=5):
-    n = min(n, index.ntotal)
-    vectors = np.zeros((n, EMBEDDING_DIM), dtype=np.float32)
-    for i in range(n):
-        vectors[i] = index.reconstruct(i)
-    return vectors
+    _, vectors = live_vectors(index, exclude=_tombstones)
+    return vectors[:n]
 
 def inspect_metadata(n=5):
-    metadata = get_metadata()
     print(f"Inspecting the first {n} metadata entries:")
-    for i, data in enumerate(metadata[:n]):
+    for i, data in store.entries(limit=n, with_content=True):
         print(f"Entry {i}:")
         print(f"Filename: {data['filename']}")
         print(f"Filepath: {data['filepath']}")
@@ -0,0 +1,32 @@
+import pickle
+import struct
+
+_RECORD_HEADER = struct.Struct(">Q")
+
+def encode_record(record):
+    """Frame a log record as a length-prefixed pickle."""
+    payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    return _RECORD_HEADER.pack(len(payload)) + payload
+
+def read_log(path, offset=0):
+    """Yield (record, end_offset) pairs from an index log, starting at offset.
+
+    The first record of a log is its header; a torn record at the tail (a crash mid-append)
+    ends the replay.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(offset)
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            (length,) = _RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            offset += _RECORD_HEADER.size + length
+            yield pickle.loads(payload), offset
@@ -0,0 +1,214 @@
+import faiss
+import numpy as np
+from keployrag.config import (
+    EMBEDDING_DIM,
+    INDEX_NLIST,
+    INDEX_NPROBE,
+    INDEX_PQ_M,
+    INDEX_PQ_NBITS,
+    INDEX_HNSW_M,
+    INDEX_HNSW_EF_CONSTRUCTION,
+    INDEX_HNSW_EF_SEARCH,
+    INDEX_TRAIN_SIZE,
+    INDEX_QUANTIZATION,
+    INDEX_SQ_TRAIN_SIZE
+)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+QUANTIZATIONS = ("none", "fp16", "int8")
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+def build_index(index_type, dim=EMBEDDING_DIM, quantization=INDEX_QUANTIZATION):
+    """Create an empty (possibly untrained) index of the given type, addressed by 64-bit IDs.
+
+    Flat, ivf_flat and hnsw indexes store scalar-quantized vectors unless quantization is
+    "none"; ivf_pq is already compressed and ignores it.
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}; expected one of {', '.join(QUANTIZATIONS)}")
+    sq_type = _SQ_TYPES.get(quantization)
+    if index_type == "flat":
+        if sq_type is None:
+            return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+        return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, sq_type, faiss.METRIC_L2))
+    if index_type == "hnsw":
+        if sq_type is None:
+            hnsw = faiss.IndexHNSWFlat(dim, INDEX_HNSW_M)
+        else:
+            hnsw = faiss.IndexHNSWSQ(dim, sq_type, INDEX_HNSW_M)
+        hnsw.hnsw.efConstruction = INDEX_HNSW_EF_CONSTRUCTION
+        return configure_search(faiss.IndexIDMap2(hnsw))
+
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat" and sq_type is None:
+        ivf = faiss.IndexIVFFlat(quantizer, dim, INDEX_NLIST)
+    elif index_type == "ivf_flat":
+        ivf = faiss.IndexIVFScalarQuantizer(quantizer, dim, INDEX_NLIST, sq_type, faiss.METRIC_L2)
+    elif index_type == "ivf_pq":
+        if dim % INDEX_PQ_M:
+            raise ValueError(f"INDEX_PQ_M={INDEX_PQ_M} must divide the embedding dimension {dim}")
+        ivf = faiss.IndexIVFPQ(quantizer, dim, INDEX_NLIST, INDEX_PQ_M, INDEX_PQ_NBITS)
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    # IVF indexes store IDs natively; the hashtable lets them reconstruct and remove by ID.
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return configure_search(ivf)
+
+def index_kind(index):
+    """Return which of INDEX_TYPES an index is."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, (faiss.IndexIVFFlat, faiss.IndexIVFScalarQuantizer)):
+        return "ivf_flat"
+    return "flat"
+
+def _layers(index):
+    """The index and every index it wraps: IndexIDMap2 -> IndexHNSW -> storage, etc."""
+    layers = [faiss.downcast_index(index)]
+    while True:
+        inner = getattr(layers[-1], "index", None) or getattr(layers[-1], "storage", None)
+        if inner is None or isinstance(layers[-1], faiss.IndexIVF):
+            return layers
+        layers.append(faiss.downcast_index(inner))
+
+def _scalar_quantizer(index):
+    for layer in _layers(index):
+        if isinstance(layer, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+            return layer.sq
+    return None
+
+def index_quantization(index):
+    """Return which of QUANTIZATIONS an index stores its vectors with."""
+    sq = _scalar_quantizer(index)
+    if sq is None:
+        return "none"
+    return next(name for name, sq_type in _SQ_TYPES.items() if sq.qtype == sq_type)
+
+def min_train_size(index_type, quantization=INDEX_QUANTIZATION):
+    """Number of vectors needed before an index of this type can be trained (0 if it needs none)."""
+    if index_type == "ivf_flat":
+        return 39 * INDEX_NLIST
+    if index_type == "ivf_pq":
+        return 39 * max(INDEX_NLIST, 2 ** INDEX_PQ_NBITS)
+    if quantization == "int8":
+        # int8 learns a value range per dimension from a sample of the vectors
+        return INDEX_SQ_TRAIN_SIZE
+    return 0
+
+def supports_remove(index):
+    return index_kind(index) != "hnsw"
+
+def configure_search(index):
+    """Apply the nprobe / efSearch settings to a freshly built or loaded index."""
+    kind = index_kind(index)
+    if kind in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = INDEX_NPROBE
+    elif kind == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = INDEX_HNSW_EF_SEARCH
+    return index
+
+def index_ids(index):
+    """Return the IDs of every vector stored in the index."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map)
+    invlists = faiss.extract_index_ivf(index).invlists
+    chunks = [
+        faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+        for list_no in range(invlists.nlist) if invlists.list_size(list_no)
+    ]
+    return np.concatenate(chunks).astype(np.int64) if chunks else np.zeros(0, dtype=np.int64)
+
+def live_vectors(index, exclude=()):
+    """Return (ids, vectors) for every vector in the index, skipping the excluded IDs."""
+    ids = index_ids(index)
+    if isinstance(index, faiss.IndexIDMap):
+        # Positions in the wrapped index line up with id_map, so no per-ID lookups are needed
+        vectors = index.index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+    else:
+        vectors = index.reconstruct_batch(ids) if len(ids) else np.zeros((0, index.d), dtype=np.float32)
+    if exclude:
+        keep = ~np.isin(ids, np.fromiter(exclude, dtype=np.int64))
+        ids, vectors = ids[keep], vectors[keep]
+    return ids, vectors
+
+def convert_index(index, index_type, exclude=(), quantization=INDEX_QUANTIZATION):
+    """Rebuild an index as the given type, training it on a sample of its own vectors.
+
+    Converting to ivf_pq or a scalar quantization is lossy; converting back keeps the
+    quantized vectors.
+    """
+    ids, vectors = live_vectors(index, exclude)
+    converted = build_index(index_type, index.d, quantization)
+    if not converted.is_trained:
+        required = INDEX_NLIST if index_type in ("ivf_flat", "ivf_pq") else 1
+        if len(vectors) < required:
+            raise ValueError(f"Need at least {required} vectors to train a {index_type} index, have {len(vectors)}")
+        sample = vectors
+        if len(vectors) > INDEX_TRAIN_SIZE:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), INDEX_TRAIN_SIZE, replace=False)]
+        converted.train(np.ascontiguousarray(sample))
+    if len(ids):
+        converted.add_with_ids(np.ascontiguousarray(vectors), ids)
+    return converted
+
+def quantize_flat(index, quantization):
+    """Copy a plain (non-ID-mapped) flat index, as kept by LangChain's FAISS store, into one with
+    the given quantization, keeping every vector at the same position."""
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+    if quantization == "none":
+        quantized = faiss.IndexFlatL2(index.d)
+    else:
+        quantized = faiss.IndexScalarQuantizer(index.d, _SQ_TYPES[quantization], faiss.METRIC_L2)
+    if not quantized.is_trained:
+        if not len(vectors):
+            raise ValueError(f"Need at least one vector to train a {quantization} index")
+        sample = vectors
+        if len(vectors) > INDEX_TRAIN_SIZE:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), INDEX_TRAIN_SIZE, replace=False)]
+        quantized.train(np.ascontiguousarray(sample))
+    if len(vectors):
+        quantized.add(np.ascontiguousarray(vectors))
+    return quantized
+
+def empty_like(index):
+    """Return an empty index of the same type and training as the given one."""
+    kind = index_kind(index)
+    if kind in ("flat", "hnsw"):
+        empty = build_index(kind, index.d, index_quantization(index))
+        if not empty.is_trained:
+            # Reuse the trained int8 ranges instead of copying every vector just to reset them
+            faiss.copy_array_to_vector(faiss.vector_to_array(_scalar_quantizer(index).trained), _scalar_quantizer(empty).trained)
+            for layer in _layers(empty):
+                layer.is_trained = True
+        return empty
+    empty = faiss.clone_index(index)
+    empty.reset()
+    return configure_search(empty)
+
+def mmap_flags(kind):
+    """faiss.read_index flags that open an index of this type memory-mapped and read-only."""
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # Older faiss builds cannot map flat codes and read them into memory instead.
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+def search_index(index, query_embedding, k, exclude=()):
+    """Search an index, leaving out the excluded IDs (vectors HNSW cannot delete, or ones
+    replaced since a read-only shard was written)."""
+    if not exclude:
+        return index.search(query_embedding, k)
+    excluded = faiss.IDSelectorBatch(np.fromiter(exclude, dtype=np.int64))
+    selector = faiss.IDSelectorNot(excluded)
+    kind = index_kind(index)
+    if kind == "hnsw":
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=INDEX_HNSW_EF_SEARCH)
+    elif kind in ("ivf_flat", "ivf_pq"):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=INDEX_NPROBE)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return index.search(query_embedding, k, params=params)
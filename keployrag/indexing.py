@@ -0,0 +1,85 @@
+import os
+import logging
+from keployrag.chunking import chunk_file
+from keployrag.index import add_files_to_index, existing_chunks
+
+def read_file(filepath):
+    """Read a file as a (filepath, filename, content, stat) item for index_contents.
+
+    The stat is taken before reading, so an edit made while the file is being indexed leaves the
+    manifest with an older stat than the file's, and the file is read again.
+    """
+    stat = os.stat(filepath)
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return filepath, os.path.basename(filepath), f.read(), stat
+
+def index_contents(pending, embed):
+    """Chunk and embed a group of (filepath, filename, content[, stat]), e.g. from read_file, and
+    add them to the index as one change.
+
+    embed takes a list of texts and returns (embeddings, failed) like
+    embeddings.generate_embeddings_batch. Chunks that fail to embed are logged and left out;
+    a file none of whose changed chunks embedded keeps its previous vectors. A file with chunks
+    left out gets no manifest entry, so it is indexed again by the next reconciliation. Returns
+    the number of files indexed.
+    """
+    prepared = [prepare_chunks(filepath, content) for filepath, _, content, *_ in pending]
+    embeddings, failed = embed(chunk_texts([chunks for chunks, _ in prepared]))
+    return add_embedded(pending, prepared, embeddings, failed)
+
+def _chunk_key(chunk):
+    return chunk["content"], chunk.get("kind"), chunk.get("symbol"), chunk.get("class_name")
+
+def prepare_chunks(filepath, content):
+    """Chunk a file and split the chunks into (to_embed, kept).
+
+    Chunks identical to one already indexed for the file (same content and symbol) are kept
+    as {vector_id: chunk}: their vectors are reused, so editing one function only re-embeds
+    that function. An empty or whitespace-only file has no chunks at all.
+    """
+    if not content.strip():
+        # Nothing to embed: the file is added with no chunks, which drops the vectors it had
+        return [], {}
+    existing = {}
+    for vector_id, entry in existing_chunks(filepath).items():
+        existing.setdefault(_chunk_key(entry), []).append(vector_id)
+    to_embed, kept = [], {}
+    for chunk in chunk_file(content, filepath):
+        reusable = existing.get(_chunk_key(chunk))
+        if reusable:
+            kept[reusable.pop()] = chunk
+        else:
+            to_embed.append(chunk)
+    return to_embed, kept
+
+def chunk_texts(file_chunks):
+    """The texts to embed for a group of files' chunks, in order."""
+    return [chunk["content"] for chunks in file_chunks for chunk in chunks]
+
+def add_embedded(pending, prepared, embeddings, failed):
+    """Add a group of files, with their (to_embed, kept) chunks from prepare_chunks, to the index
+    given the (embeddings, failed) for the chunk_texts of their to_embed chunks. Returns the
+    number of files indexed."""
+    files = []
+    position = 0
+    for (filepath, filename, content, *stat), (chunks, kept) in zip(pending, prepared):
+        positions = range(position, position + len(chunks))
+        position += len(chunks)
+        for i in positions:
+            if i in failed:
+                chunk = chunks[i - positions.start]
+                logging.warning(f"Failed to generate embeddings for {filepath} lines "
+                                f"{chunk['start_line']}-{chunk['end_line']}: {failed[i]}")
+        embedded = [i for i in positions if i not in failed]
+        if len(embedded) < len(chunks):
+            # Not recorded in the manifest, so the chunks left out are retried later
+            stat = [None]
+        if embedded or not chunks:
+            files.append((embeddings[embedded], content, filename, filepath,
+                          [chunks[i - positions.start] for i in embedded], kept, *stat))
+    try:
+        add_files_to_index(files)
+    except Exception as e:
+        logging.error(f"Error indexing {len(files)} files: {e}")
+        return 0
+    return len(files)
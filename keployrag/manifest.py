@@ -0,0 +1,177 @@
+import os
+import json
+import subprocess
+from keployrag.config import (
+    WATCHED_DIR,
+    EMBEDDING_DIM,
+    INDEX_GRANULARITY,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    INDEX_SYNC_MODE
+)
+from keployrag.embeddings import cache_key
+from keployrag.index import store, content_hash, index_in_sync
+from keployrag.pathfilter import default_path_filter
+from keployrag.git_changes import repo_root, changes_since, work_tree_state
+
+SETTINGS_KEY = "manifest_settings"
+GIT_STATE_KEY = "git_state"
+
+def index_settings():
+    """Everything the stored vectors depend on besides file content."""
+    return json.dumps({
+        "embedder": cache_key(),
+        "dim": EMBEDDING_DIM,
+        "granularity": INDEX_GRANULARITY,
+        "chunk_max_tokens": CHUNK_MAX_TOKENS,
+        "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        # Indexes built before symbol chunks recorded their references have no symbol graph, and
+        # those built before the identifier index have no exact identifier lookups
+        "symbol_graph": 2,
+        "identifier_index": 1
+    }, sort_keys=True)
+
+def record_settings():
+    """Mark the manifest as describing an index built with the current settings."""
+    store.set_setting(SETTINGS_KEY, index_settings())
+
+def rebuild_reason():
+    """Why the manifest cannot be trusted to update the index incrementally, or None if it can."""
+    recorded = store.get_setting(SETTINGS_KEY)
+    if recorded is None:
+        return "no manifest from a completed index build"
+    if recorded != index_settings():
+        return "embedding or chunking settings changed"
+    if not index_in_sync():
+        return "index and metadata are out of sync"
+    return None
+
+def source_files(root=WATCHED_DIR):
+    """Every indexable file under root, skipping ignored directories without entering them."""
+    for dirpath, _, files in default_path_filter().walk(root):
+        for file in files:
+            if file.endswith(".py"):
+                yield os.path.join(dirpath, file)
+
+def _is_source_file(path):
+    return path.endswith(".py") and not default_path_filter().ignores(path, is_dir=False)
+
+def _classify(paths):
+    """Split existing files into (added, changed) against the manifest, skipping unchanged ones.
+
+    A file whose size and mtime match the manifest is taken as unchanged without reading it;
+    one whose stat changed but whose content hash did not only gets its recorded stat refreshed.
+    Returns the relative paths seen as well.
+    """
+    by_relative_path = {os.path.relpath(path, WATCHED_DIR): path for path in paths}
+    manifest = store.manifest(by_relative_path)
+    indexed = store.indexed_paths(by_relative_path)
+    added, changed, touched = [], [], []
+    current = set()
+    for relative_path, path in by_relative_path.items():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        current.add(relative_path)
+        recorded = manifest.get(relative_path)
+        if recorded is None or relative_path not in indexed:
+            added.append(path)
+        elif (stat.st_size, stat.st_mtime_ns) != tuple(recorded[:2]):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    unchanged = content_hash(f.read()) == recorded[2]
+            except (OSError, UnicodeDecodeError):
+                unchanged = False
+            if unchanged:
+                touched.append((relative_path, stat.st_size, stat.st_mtime_ns))
+            else:
+                changed.append(path)
+    if touched:
+        store.update_file_stats(touched)
+    return added, changed, current
+
+def diff_tree(root=WATCHED_DIR):
+    """Compare every file under root with the manifest.
+
+    Returns (added, changed, removed) lists of absolute paths.
+    """
+    added, changed, current = _classify(source_files(root))
+    removed = [os.path.join(WATCHED_DIR, p) for p in sorted((store.indexed_paths() | set(store.manifest())) - current)]
+    return added, changed, removed
+
+def _watched_path(path):
+    """Map a path reported by git (under the repository's real path) to the same file under
+    WATCHED_DIR, or None when it is outside WATCHED_DIR."""
+    relative_path = os.path.relpath(os.path.realpath(path), os.path.realpath(WATCHED_DIR))
+    if relative_path == os.pardir or relative_path.startswith(os.pardir + os.sep):
+        return None
+    return os.path.join(WATCHED_DIR, relative_path)
+
+def git_state(root=WATCHED_DIR):
+    """Snapshot of the git work tree containing root, to record with record_git_state once the
+    index reflects it. None when root is not in a git repository or INDEX_SYNC_MODE is manifest."""
+    if INDEX_SYNC_MODE != "auto":
+        return None
+    repo = repo_root(root)
+    if repo is None:
+        return None
+    commit, dirty = work_tree_state(repo)
+    return repo, commit, dirty
+
+def record_git_state(state):
+    """Remember the commit and uncommitted paths the index was brought up to date with."""
+    if state is None:
+        return
+    repo, commit, dirty = state
+    store.set_setting(GIT_STATE_KEY, json.dumps({
+        "repo": repo,
+        "commit": commit,
+        "dirty": sorted(os.path.relpath(path, repo) for path in dirty)
+    }))
+
+def git_changes(root=WATCHED_DIR):
+    """Files that may have changed since the recorded git state, worked out from git instead of
+    stating every file.
+
+    Returns (moved, candidates): (old, new) absolute paths of renamed files whose vectors can
+    be re-keyed, and the absolute paths to check with diff_paths once the moves are applied.
+    Returns None when there is no usable recorded state (not a git repository, nothing
+    recorded yet, or the recorded commit no longer exists); callers fall back to diff_tree.
+    """
+    recorded = store.get_setting(GIT_STATE_KEY)
+    repo = repo_root(root) if INDEX_SYNC_MODE == "auto" and recorded else None
+    if repo is None:
+        return None
+    recorded = json.loads(recorded)
+    if recorded["repo"] != repo:
+        return None
+    try:
+        changed, renamed = changes_since(repo, recorded["commit"])
+    except subprocess.CalledProcessError:
+        return None
+    # Files that were uncommitted when the index was updated may since have been reverted
+    changed.update(os.path.join(repo, path) for path in recorded["dirty"])
+
+    candidates = {p for p in map(_watched_path, changed) if p and _is_source_file(p)}
+    moved = []
+    for old, new in renamed:
+        old, new = _watched_path(old), _watched_path(new)
+        old = old if old and _is_source_file(old) else None
+        new = new if new and _is_source_file(new) else None
+        if old and new:
+            moved.append((old, new))
+        # A renamed file can be edited too; diff_paths tells from its content hash
+        candidates.update(p for p in (old, new) if p)
+    return moved, sorted(candidates)
+
+def diff_paths(paths):
+    """Compare the given files with the manifest, like diff_tree but only for these paths.
+
+    Returns (added, changed, removed) lists of absolute paths; a path that no longer exists
+    is removed if anything was recorded for it.
+    """
+    added, changed, current = _classify(p for p in paths if os.path.isfile(p))
+    gone = {os.path.relpath(p, WATCHED_DIR) for p in paths} - current
+    removed = sorted(os.path.join(WATCHED_DIR, p) for p in store.indexed_paths(gone) | set(store.manifest(gone)))
+    return added, changed, removed
@@ -0,0 +1,450 @@
+import os
+import re
+import zlib
+import sqlite3
+import threading
+
+_COLUMNS = ("filename", "filepath", "start_line", "end_line", "start_byte", "end_byte", "kind", "symbol", "class_name")
+# Columns added after the first release, created on open for older databases
+_ADDED_COLUMNS = {"kind": "TEXT", "symbol": "TEXT", "class_name": "TEXT"}
+# Paths per IN (...) lookup, well under SQLite's bound parameter limit
+_LOOKUP_BATCH = 500
+# Words of chunk content recorded in the identifier index; shorter ones are too common to narrow a search
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+# Tables of per-row data keyed by chunk ID, deleted along with their rows
+_ROW_TABLES = ("symbol_refs", "identifiers")
+
+class MetadataStore:
+    """SQLite-backed metadata for the code index, keyed by vector ID.
+
+    Filenames, paths and offsets live in indexed columns so they are cheap to query;
+    the (optionally zlib-compressed) content is only read for the rows that ask for it.
+    A manifest of each indexed file's size, mtime and content hash is kept alongside, so
+    startup can tell which files changed since they were indexed. Symbol chunks also record
+    the names they call, the edges of the symbol graph: rows are the definitions, found by
+    name through an index on symbol, and references are indexed both by the chunk they come
+    from and the name they use. An inverted index maps every identifier in a row's content to
+    the row, for exact identifier lookups that need no embedding.
+    """
+
+    def __init__(self, path, compress=True):
+        self.path = path
+        self.compress = compress
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            # WAL lets the search process read while the indexer writes.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    filepath TEXT NOT NULL,
+                    start_line INTEGER,
+                    end_line INTEGER,
+                    start_byte INTEGER,
+                    end_byte INTEGER,
+                    kind TEXT,
+                    symbol TEXT,
+                    class_name TEXT,
+                    compressed INTEGER NOT NULL DEFAULT 0,
+                    content BLOB
+                )
+            """)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+            for column, column_type in _ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE chunks ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_filepath ON chunks (filepath)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_symbol ON chunks (symbol)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS symbol_refs (
+                    chunk_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    line INTEGER NOT NULL,
+                    qualifier TEXT
+                )
+            """)
+            if "qualifier" not in {row[1] for row in conn.execute("PRAGMA table_info(symbol_refs)")}:
+                conn.execute("ALTER TABLE symbol_refs ADD COLUMN qualifier TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS symbol_refs_chunk ON symbol_refs (chunk_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS symbol_refs_name ON symbol_refs (name)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS identifiers (
+                    name TEXT NOT NULL,
+                    chunk_id INTEGER NOT NULL,
+                    PRIMARY KEY (name, chunk_id)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS identifiers_chunk ON identifiers (chunk_id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    filepath TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _encode(self, content):
+        data = content.encode("utf-8")
+        if self.compress:
+            return 1, zlib.compress(data)
+        return 0, data
+
+    @staticmethod
+    def _decode(compressed, data):
+        if data is None:
+            return None
+        if compressed:
+            data = zlib.decompress(data)
+        return data.decode("utf-8")
+
+    def replace_path(self, filepath, ids, entries):
+        """Replace every row of a file with the given entries. Returns the IDs that were removed."""
+        return self.replace_paths([(filepath, ids, entries)])
+
+    def replace_paths(self, files, manifest=()):
+        """Replace the rows of several files, given as (filepath, ids, entries), in one
+        transaction, recording the (filepath, size, mtime_ns, content_hash) manifest entries
+        with them; a file without one loses its old entry. Returns the IDs that were removed."""
+        rows = []
+        references = []
+        identifiers = []
+        for _, ids, entries in files:
+            for vector_id, entry in zip(ids, entries):
+                compressed, content = self._encode(entry["content"])
+                rows.append((int(vector_id),) + tuple(entry.get(c) for c in _COLUMNS) + (compressed, content))
+                references.extend((int(vector_id), *reference) for reference in entry.get("references") or ())
+                identifiers.extend((name, int(vector_id)) for name in set(IDENTIFIER_PATTERN.findall(entry["content"])))
+        old_ids = []
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for filepath, _, _ in files:
+                    old_ids.extend(self._delete_path(conn, filepath))
+                    conn.execute("DELETE FROM files WHERE filepath = ?", (filepath,))
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO chunks (id, {', '.join(_COLUMNS)}, compressed, content) "
+                    f"VALUES ({', '.join('?' * (len(_COLUMNS) + 3))})",
+                    rows
+                )
+                conn.executemany("INSERT INTO symbol_refs (chunk_id, name, line, qualifier) VALUES (?, ?, ?, ?)",
+                                 references)
+                conn.executemany("INSERT OR REPLACE INTO identifiers VALUES (?, ?)", identifiers)
+                conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", manifest)
+        return old_ids
+
+    def delete_path(self, filepath, recursive=False):
+        """Remove every row of a file, or with recursive also of every file under it as a
+        directory. Returns the IDs that were removed."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                old_ids = self._delete_path(conn, filepath)
+                conn.execute("DELETE FROM files WHERE filepath = ?", (filepath,))
+                if recursive:
+                    below = [vector_id for vector_id, _ in self._rows_under(conn, filepath)]
+                    conn.executemany("DELETE FROM chunks WHERE id = ?", [(vector_id,) for vector_id in below])
+                    self._delete_row_data(conn, below)
+                    old_ids.extend(below)
+                    conn.execute("DELETE FROM files WHERE filepath >= ? AND filepath < ?", self._range_under(filepath))
+                return old_ids
+
+    @classmethod
+    def _delete_path(cls, conn, filepath):
+        old_ids = [row[0] for row in conn.execute("SELECT id FROM chunks WHERE filepath = ?", (filepath,))]
+        if old_ids:
+            conn.execute("DELETE FROM chunks WHERE filepath = ?", (filepath,))
+            cls._delete_row_data(conn, old_ids)
+        return old_ids
+
+    @staticmethod
+    def _delete_row_data(conn, ids):
+        for table in _ROW_TABLES:
+            conn.executemany(f"DELETE FROM {table} WHERE chunk_id = ?", [(vector_id,) for vector_id in ids])
+
+    @staticmethod
+    def _range_under(directory):
+        """Bounds of the paths below directory: every path starting with the directory and a
+        separator sorts between that prefix and the prefix with the separator bumped."""
+        prefix = directory.rstrip(os.sep) + os.sep
+        return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    @classmethod
+    def _rows_under(cls, conn, directory):
+        """(id, filepath) of every row in a file below directory."""
+        return conn.execute(
+            "SELECT id, filepath FROM chunks WHERE filepath >= ? AND filepath < ?", cls._range_under(directory)
+        ).fetchall()
+
+    def move_path(self, old_path, new_path):
+        """Re-key the rows of a file, or of every file under a directory, to a new path.
+
+        Rows already stored at a destination path are replaced. Returns (moved, removed_ids):
+        the number of rows moved and the IDs of the rows that were replaced.
+        """
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                rows = conn.execute("SELECT id, filepath FROM chunks WHERE filepath = ?", (old_path,)).fetchall()
+                rows += self._rows_under(conn, old_path)
+                if not rows:
+                    return 0, []
+                renamed = {path: new_path + path[len(old_path):] for _, path in rows}
+                moved_ids = {vector_id for vector_id, _ in rows}
+                removed_ids = []
+                for path in renamed.values():
+                    removed_ids.extend(vector_id for (vector_id,) in conn.execute(
+                        "SELECT id FROM chunks WHERE filepath = ?", (path,)) if vector_id not in moved_ids)
+                conn.executemany("DELETE FROM chunks WHERE id = ?", [(vector_id,) for vector_id in removed_ids])
+                self._delete_row_data(conn, removed_ids)
+                conn.executemany(
+                    "UPDATE chunks SET filepath = ?, filename = ? WHERE id = ?",
+                    [(renamed[path], os.path.basename(renamed[path]), vector_id) for vector_id, path in rows]
+                )
+                conn.executemany("DELETE FROM files WHERE filepath = ?", [(path,) for path in renamed.values()])
+                conn.executemany("UPDATE files SET filepath = ? WHERE filepath = ?",
+                                 [(new, old) for old, new in renamed.items()])
+        return len(rows), removed_ids
+
+    def paths_under(self, path):
+        """The indexed file paths equal to path or below it as a directory."""
+        with self._lock:
+            conn = self._connection()
+            paths = {row[0] for row in conn.execute("SELECT filepath FROM chunks WHERE filepath = ? LIMIT 1", (path,))}
+            return paths | {filepath for _, filepath in self._rows_under(conn, path)}
+
+    def _select_paths(self, query, paths):
+        """Run query (with a {paths} placeholder for the filepath condition) over every row, or
+        only the rows for the given paths."""
+        with self._lock:
+            conn = self._connection()
+            if paths is None:
+                return conn.execute(query.format(paths="1")).fetchall()
+            paths = list(paths)
+            rows = []
+            for i in range(0, len(paths), _LOOKUP_BATCH):
+                batch = paths[i:i + _LOOKUP_BATCH]
+                rows += conn.execute(query.format(paths=f"filepath IN ({', '.join('?' * len(batch))})"), batch).fetchall()
+            return rows
+
+    def manifest(self, paths=None):
+        """{filepath: (size, mtime_ns, content_hash)} for every file recorded as indexed, or
+        only for the given paths."""
+        rows = self._select_paths("SELECT filepath, size, mtime_ns, content_hash FROM files WHERE {paths}", paths)
+        return {row[0]: row[1:] for row in rows}
+
+    def update_file_stats(self, stats):
+        """Record new (size, mtime_ns) for files whose content is unchanged, given as
+        (filepath, size, mtime_ns)."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("UPDATE files SET size = ?, mtime_ns = ? WHERE filepath = ?",
+                                 [(size, mtime_ns, filepath) for filepath, size, mtime_ns in stats])
+
+    def indexed_paths(self, paths=None):
+        """Every file path with at least one row, or those of the given paths that have one."""
+        return {row[0] for row in self._select_paths("SELECT DISTINCT filepath FROM chunks WHERE {paths}", paths)}
+
+    def get_setting(self, name):
+        with self._lock:
+            row = self._connection().execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, name, value):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)", (name, value))
+
+    def ids_for_path(self, filepath):
+        with self._lock:
+            return [row[0] for row in self._connection().execute(
+                "SELECT id FROM chunks WHERE filepath = ?", (filepath,))]
+
+    def id_paths(self):
+        """Return (id, filepath) for every row."""
+        with self._lock:
+            return self._connection().execute("SELECT id, filepath FROM chunks").fetchall()
+
+    def get(self, ids, with_content=False):
+        """Return {id: entry} for the given IDs; content is only read when asked for."""
+        ids = [int(i) for i in ids]
+        columns = ", ".join(("id",) + _COLUMNS + (("compressed", "content") if with_content else ()))
+        rows = []
+        with self._lock:
+            conn = self._connection()
+            for i in range(0, len(ids), _LOOKUP_BATCH):
+                batch = ids[i:i + _LOOKUP_BATCH]
+                rows += conn.execute(
+                    f"SELECT {columns} FROM chunks WHERE id IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+        return {row[0]: self._row_to_entry(row, with_content) for row in rows}
+
+    def entries(self, limit=None, with_content=False):
+        """Return (id, entry) pairs in ID order."""
+        columns = ", ".join(("id",) + _COLUMNS + (("compressed", "content") if with_content else ()))
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {columns} FROM chunks ORDER BY id LIMIT ?", (-1 if limit is None else limit,)
+            ).fetchall()
+        return [(row[0], self._row_to_entry(row, with_content)) for row in rows]
+
+    def definitions(self, name, class_name=None, with_content=False):
+        """{id: entry} of the classes, methods and functions named name, only those of class_name
+        when given."""
+        query = "SELECT id FROM chunks WHERE symbol = ? AND kind != 'module'"
+        params = [name]
+        if class_name is not None:
+            query += " AND class_name = ?"
+            params.append(class_name)
+        with self._lock:
+            ids = [row[0] for row in self._connection().execute(query, params)]
+        return self.get(ids, with_content=with_content)
+
+    def references_to(self, name, class_name=None, exclude=(), limit=None):
+        """[(chunk_id, [line])] of the chunks that call or construct name, best matches first.
+
+        With class_name, a call through self/this in that class or through the class itself
+        ranks first, calls through an unknown receiver follow, and calls that resolve to another
+        class (self/this elsewhere, or another indexed class name) are left out. Chunks in
+        exclude are skipped and at most limit chunks are returned.
+        """
+        rank, params = "0", []
+        conditions = ["r.name = ?"]
+        if class_name is not None:
+            rank = ("CASE WHEN r.qualifier = ? OR (r.qualifier IN ('self', 'this') AND c.class_name = ?) "
+                    "THEN 0 ELSE 1 END")
+            params += [class_name, class_name]
+            conditions += [
+                "NOT (COALESCE(r.qualifier, '') IN ('self', 'this') AND c.class_name IS NOT ?)",
+                "NOT (COALESCE(r.qualifier, '') != ? AND COALESCE(r.qualifier, '') IN "
+                "(SELECT symbol FROM chunks WHERE kind = 'class'))"
+            ]
+        params.append(name)
+        if class_name is not None:
+            params += [class_name, class_name]
+        exclude = [int(i) for i in exclude]
+        if exclude:
+            conditions.append(f"r.chunk_id NOT IN ({', '.join('?' * len(exclude))})")
+            params += exclude
+        params.append(-1 if limit is None else limit)
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT r.chunk_id, GROUP_CONCAT(r.line), MIN({rank}) AS best "
+                f"FROM symbol_refs AS r JOIN chunks AS c ON c.id = r.chunk_id "
+                f"WHERE {' AND '.join(conditions)} GROUP BY r.chunk_id ORDER BY best, r.chunk_id LIMIT ?",
+                params).fetchall()
+        return [(chunk_id, sorted(int(line) for line in lines.split(","))) for chunk_id, lines, _ in rows]
+
+    def references_from(self, ids):
+        """{chunk_id: [(name, line)]}: what the given chunks call or construct."""
+        ids = [int(i) for i in ids]
+        references = {}
+        rows = []
+        with self._lock:
+            conn = self._connection()
+            for i in range(0, len(ids), _LOOKUP_BATCH):
+                batch = ids[i:i + _LOOKUP_BATCH]
+                rows += conn.execute(
+                    f"SELECT chunk_id, name, line FROM symbol_refs WHERE chunk_id IN ({', '.join('?' * len(batch))}) "
+                    f"ORDER BY chunk_id, line", batch).fetchall()
+        for chunk_id, name, line in rows:
+            references.setdefault(chunk_id, []).append((name, line))
+        return references
+
+    def find_identifiers(self, names, limit=None):
+        """Exact lookups in the identifier index, for search without embeddings.
+
+        Returns (defined, used): {name: [id]} of the classes, methods and functions with one
+        of the names, and {id: {names}} of up to limit rows whose content uses any of them, best
+        matches first: definitions of a name, then rows using more of the names, then classes,
+        methods and functions before module code and plain chunks.
+        """
+        names = list(dict.fromkeys(names))
+        defined, used = {}, {}
+        if not names:
+            return defined, used
+        placeholders = ", ".join("?" * len(names))
+        with self._lock:
+            conn = self._connection()
+            for vector_id, symbol in conn.execute(
+                    f"SELECT id, symbol FROM chunks WHERE symbol IN ({placeholders}) AND kind != 'module' ORDER BY id",
+                    names):
+                defined.setdefault(symbol, []).append(vector_id)
+            for vector_id, matched in conn.execute(
+                    f"SELECT i.chunk_id, GROUP_CONCAT(i.name, ' ') FROM identifiers AS i "
+                    f"JOIN chunks AS c ON c.id = i.chunk_id WHERE i.name IN ({placeholders}) "
+                    f"GROUP BY i.chunk_id ORDER BY "
+                    f"MAX(c.symbol IN ({placeholders}) AND c.kind != 'module') DESC, COUNT(*) DESC, "
+                    f"MAX(c.kind IN ('class', 'method', 'function')) DESC, i.chunk_id LIMIT ?",
+                    names + names + [-1 if limit is None else limit]):
+                used[vector_id] = set(matched.split(" "))
+        return defined, used
+
+    def chunks_for_path(self, filepath, with_content=False):
+        """(id, entry) of a file's rows, in file order."""
+        columns = ", ".join(("id",) + _COLUMNS + (("compressed", "content") if with_content else ()))
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {columns} FROM chunks WHERE filepath = ? ORDER BY start_byte, id", (filepath,)).fetchall()
+        return [(row[0], self._row_to_entry(row, with_content)) for row in rows]
+
+    def _row_to_entry(self, row, with_content):
+        entry = dict(zip(_COLUMNS, row[1:len(_COLUMNS) + 1]))
+        if with_content:
+            entry["content"] = self._decode(row[-2], row[-1])
+        return entry
+
+    def allocate_ids(self, count):
+        """Reserve count new vector IDs and return the first. IDs are never reused, so a
+        vector that could not be deleted from the index never resolves to a newer row."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                row = conn.execute("SELECT value FROM counters WHERE name = 'next_id'").fetchone()
+                (max_id,) = conn.execute("SELECT MAX(id) FROM chunks").fetchone()
+                start = max(row[0] if row else 0, -1 if max_id is None else max_id + 1)
+                conn.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('next_id', ?)", (start + count,))
+        return start
+
+    def max_id(self):
+        with self._lock:
+            (value,) = self._connection().execute("SELECT MAX(id) FROM chunks").fetchone()
+        return -1 if value is None else value
+
+    def count(self):
+        with self._lock:
+            (value,) = self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()
+        return value
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM chunks")
+                conn.execute("DELETE FROM symbol_refs")
+                conn.execute("DELETE FROM identifiers")
+                conn.execute("DELETE FROM counters")
+                conn.execute("DELETE FROM files")
+                conn.execute("DELETE FROM settings")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -1,48 +1,260 @@
 import time
 import os
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from keployrag.index import add_to_index, save_index
-from keployrag.embeddings import generate_embeddings
-from keployrag.config import WATCHED_DIR, IGNORE_PATHS
-
-def should_ignore_path(path):
-    """Check if the given path should be ignored based on the IGNORE_PATHS list."""
-    normalized_path = os.path.normpath(path)
-    for ignore_path in IGNORE_PATHS:
-        normalized_ignore = os.path.normpath(ignore_path)
-        if normalized_ignore in normalized_path:
-            return True
-        if "__pycache__" in normalized_path:
-            return True
-    return False
+from keployrag.index import remove_from_index, move_in_index, is_indexed
+from keployrag.indexing import index_contents, read_file
+from keployrag.embeddings import generate_embeddings_batch
+from keployrag.pathfilter import default_path_filter
+from keployrag.config import (
+    WATCHED_DIR,
+    WATCH_DEBOUNCE_SECONDS,
+    WATCH_MAX_DELAY_SECONDS,
+    WATCH_BATCH_SIZE,
+    WATCH_WORKERS,
+    WATCH_STATS_INTERVAL
+)
+
+def should_ignore_path(path, is_dir=None):
+    """Check if the given path should be ignored by IGNORE_PATHS or a .gitignore file."""
+    return default_path_filter().ignores(path, is_dir)
+
+def _is_under(path, directory):
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+def process_changes(changes):
+    """Apply a batch of queued (path, op) changes: deletions first, then one indexing pass."""
+    for path, op in changes:
+        if op == "delete":
+            removed = remove_from_index(path)
+            print(f"Removed {removed} vectors for deleted path: {path}")
+    index_paths([path for path, op in changes if op == "index"])
+
+def index_paths(paths):
+    """Read, embed and index a batch of changed files with a single index commit."""
+    pending = []
+    for path in paths:
+        try:
+            pending.append(read_file(path))
+        except FileNotFoundError:
+            # Deleted again before we got to it
+            continue
+        except Exception as e:
+            print(f"Error reading {path}: {e}")
+    if pending:
+        indexed = index_contents(pending, generate_embeddings_batch)
+        print(f"Updated FAISS index for {indexed} of {len(pending)} changed files")
+
+class IndexingQueue:
+    """Coalescing, debounced queue of changed paths drained by a pool of worker threads.
+
+    Each path is queued with the latest operation seen for it ("index" or "delete").
+    Repeated events for a path only move its deadline: the path is handed to a worker once it
+    has been quiet for `debounce` seconds, or has been waiting `max_delay` seconds. A path is
+    never processed by two workers at once; a change that arrives while it is being indexed
+    queues it again.
+    """
+
+    def __init__(self, process=process_changes, move=move_in_index, debounce=WATCH_DEBOUNCE_SECONDS,
+                 max_delay=WATCH_MAX_DELAY_SECONDS, batch_size=WATCH_BATCH_SIZE, workers=WATCH_WORKERS):
+        self.process = process
+        self.apply_move = move
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self._pending = {}  # path -> (first event time, last event time, op)
+        self._in_flight = set()
+        self._moving = set()  # source and destination paths of moves being applied
+        self._stopping = False
+        self._condition = threading.Condition()
+        self.processed = 0
+        self.batches = 0
+        self._workers = [threading.Thread(target=self._run, name=f"keployrag-indexer-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def put(self, path, op="index"):
+        now = time.monotonic()
+        with self._condition:
+            first_seen, _, _ = self._pending.get(path, (now, now, op))
+            if op == "delete":
+                # Deleting a directory supersedes changes queued for files inside it
+                for queued in [p for p in self._pending if p != path and _is_under(p, path)]:
+                    del self._pending[queued]
+            self._pending[path] = (first_seen, now, op)
+            self._condition.notify()
+
+    def _is_moving(self, path):
+        return any(_is_under(path, moving) for moving in self._moving)
+
+    def _busy(self, path):
+        """Whether a path under path is being indexed, or path overlaps a move being applied."""
+        return (any(_is_under(p, path) for p in self._in_flight)
+                or any(_is_under(path, moving) or _is_under(moving, path) for moving in self._moving))
+
+    def move(self, src_path, dest_path):
+        """Re-key a moved file or directory right away, carrying any queued changes along.
+
+        Waits for in-flight work under the source and destination paths first, so a batch that
+        is still embedding the old path cannot re-add it after the move. The move itself runs
+        without holding the queue's lock; paths under either side are not handed to workers
+        until it is done.
+        """
+        with self._condition:
+            while self._busy(src_path) or self._busy(dest_path):
+                self._condition.wait()
+            carried = {path: self._pending.pop(path) for path in [p for p in self._pending if _is_under(p, src_path)]}
+            self._moving.update((src_path, dest_path))
+        try:
+            # Index I/O, possibly a checkpoint: producers and other workers carry on meanwhile
+            return self.apply_move(src_path, dest_path)
+        finally:
+            with self._condition:
+                self._moving.difference_update((src_path, dest_path))
+                for path, entry in carried.items():
+                    # A change queued at the destination during the move is newer
+                    self._pending.setdefault(dest_path + path[len(src_path):], entry)
+                self._condition.notify_all()
+
+    def _ready_at(self, entry):
+        first_seen, last_event, _ = entry
+        return min(last_event + self.debounce, first_seen + self.max_delay)
+
+    def _take(self):
+        """Block until a batch of paths is due; returns None once stopped and drained."""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                waiting = {p: t for p, t in self._pending.items() if p not in self._in_flight and not self._is_moving(p)}
+                due = sorted((p for p, t in waiting.items() if self._stopping or self._ready_at(t) <= now),
+                             key=lambda p: waiting[p][0])[:self.batch_size]
+                if due:
+                    batch = [(path, self._pending.pop(path)[2]) for path in due]
+                    self._in_flight.update(due)
+                    return batch
+                if self._stopping and not self._pending and not self._in_flight and not self._moving:
+                    return None
+                timeout = min((self._ready_at(t) for t in waiting.values()), default=now + 1) - now
+                self._condition.wait(max(timeout, 0.01))
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            try:
+                self.process(batch)
+            except Exception as e:
+                print(f"Error indexing {len(batch)} changed files: {e}")
+            finally:
+                with self._condition:
+                    self._in_flight.difference_update(path for path, _ in batch)
+                    self.processed += len(batch)
+                    self.batches += 1
+                    self._condition.notify_all()
+
+    def stats(self):
+        """Queue depth (paths waiting and being indexed) and lag (age of the oldest waiting change)."""
+        now = time.monotonic()
+        with self._condition:
+            oldest = min((first_seen for first_seen, _, _ in self._pending.values()), default=None)
+            return {
+                "depth": len(self._pending),
+                "in_flight": len(self._in_flight),
+                "lag": now - oldest if oldest is not None else 0.0,
+                "processed": self.processed,
+                "batches": self.batches
+            }
+
+    def stop(self, timeout=None):
+        """Index everything still queued without waiting for the debounce, then stop the workers."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+
+def _is_indexable(path):
+    return path.endswith(".py") and not should_ignore_path(path, is_dir=False)
 
 class CodeChangeHandler(FileSystemEventHandler):
-    def on_modified(self, event):
-        if event.is_directory or should_ignore_path(event.src_path):
-            return
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+
+    def dispatch(self, event):
+        # Decisions cached from the old .gitignore are stale once it changes
+        if any(os.path.basename(p) == ".gitignore" for p in (event.src_path, getattr(event, "dest_path", ""))):
+            default_path_filter().invalidate()
+        super().dispatch(event)
 
-        if event.src_path.endswith(".py"):
+    def on_modified(self, event):
+        if not event.is_directory and _is_indexable(event.src_path):
             print(f"Detected change in file: {event.src_path}")
-            with open(event.src_path, 'r', encoding='utf-8') as f:
-                full_content = f.read()
-            embeddings = generate_embeddings(full_content)
-            if embeddings is not None and len(embeddings) > 0:
-                filename = os.path.basename(event.src_path)
-                add_to_index(embeddings, full_content, filename, event.src_path)
-                save_index()
-                print(f"Updated FAISS index for file: {event.src_path}")
+            self.queue.put(event.src_path)
+
+    def on_created(self, event):
+        if not event.is_directory and _is_indexable(event.src_path):
+            print(f"Detected new file: {event.src_path}")
+            self.queue.put(event.src_path)
+
+    def on_deleted(self, event):
+        # A deleted directory takes every indexed file below it along
+        if event.is_directory or _is_indexable(event.src_path):
+            print(f"Detected deletion: {event.src_path}")
+            self.queue.put(event.src_path, op="delete")
+
+    def on_moved(self, event):
+        src, dest = event.src_path, event.dest_path
+        if event.is_directory:
+            if should_ignore_path(dest, is_dir=True):
+                self.queue.put(src, op="delete")
+            elif should_ignore_path(src, is_dir=True):
+                # Moved out of an ignored directory: nothing was indexed, so index what arrived
+                for root, _, files in default_path_filter().walk(dest):
+                    for file in files:
+                        if _is_indexable(os.path.join(root, file)):
+                            self.queue.put(os.path.join(root, file))
+            else:
+                print(f"Detected move: {src} -> {dest}")
+                self.queue.move(src, dest)
+        elif _is_indexable(src) and _is_indexable(dest):
+            print(f"Detected move: {src} -> {dest}")
+            # Nothing was re-keyed if the source was never indexed, or a directory move already moved it
+            if not self.queue.move(src, dest) and not is_indexed(dest):
+                self.queue.put(dest)
+        elif _is_indexable(src):
+            self.queue.put(src, op="delete")
+        elif _is_indexable(dest):
+            self.queue.put(dest)
+
+indexing_queue = None
+
+def watcher_stats():
+    """Depth and lag of the watcher's indexing queue, or None when the watcher is not running."""
+    return indexing_queue.stats() if indexing_queue is not None else None
 
 def start_monitoring():
-    event_handler = CodeChangeHandler()
+    global indexing_queue
+    indexing_queue = IndexingQueue()
+    event_handler = CodeChangeHandler(indexing_queue)
     observer = Observer()
     observer.schedule(event_handler, path=WATCHED_DIR, recursive=True)
     observer.start()
     print(f"Started monitoring {WATCHED_DIR}... now run the streamlit server")
 
     try:
+        last_report = time.monotonic()
         while True:
             time.sleep(1)
+            stats = indexing_queue.stats()
+            if (stats["depth"] or stats["in_flight"]) and time.monotonic() - last_report >= WATCH_STATS_INTERVAL:
+                print(f"Indexing queue: {stats['depth']} waiting, {stats['in_flight']} in flight, "
+                      f"lag {stats['lag']:.1f}s, {stats['processed']} files indexed")
+                last_report = time.monotonic()
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    indexing_queue.stop()
@@ -0,0 +1,183 @@
+import os
+import re
+import threading
+from keployrag.config import WATCHED_DIR, IGNORE_PATHS, USE_GITIGNORE
+
+def _translate(pattern):
+    """Translate one gitignore glob (without negation or trailing slash) into a regex."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        at_segment_start = i == 0 or pattern[i - 1] == "/"
+        if at_segment_start and pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif at_segment_start and pattern.startswith("**", i) and i + 2 == n:
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            while i < n and pattern[i] == "*":
+                i += 1
+            continue
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            out.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+def _parse(line):
+    """Return (regex source, negate, dir_only) for one pattern line, or None for blanks and comments."""
+    line = re.sub(r"(?<!\\) +$", "", line.rstrip("\n\r"))
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    elif line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # A pattern with a slash before its end is relative to its file's directory; otherwise it
+    # matches a name at any depth
+    anchored = "/" in line
+    line = line.lstrip("/")
+    regex = _translate(line)
+    return (regex if anchored else "(?:.*/)?" + regex), negate, dir_only
+
+class IgnoreRules:
+    """Compiled patterns from one ignore file; the last matching pattern decides, as in git.
+
+    Consecutive patterns with the same effect are joined into a single regex, so matching a
+    path costs one regex per run of include or exclude patterns rather than one per pattern.
+    """
+
+    def __init__(self, lines):
+        parsed = [rule for rule in map(_parse, lines) if rule is not None]
+        self.groups = []  # (compiled alternation, negate, dir_only), in file order
+        for regex, negate, dir_only in parsed:
+            if self.groups and self.groups[-1][1:] == (negate, dir_only):
+                self.groups[-1][0].append(regex)
+            else:
+                self.groups.append(([regex], negate, dir_only))
+        self.groups = [(re.compile("|".join(f"(?:{r})" for r in regexes)), negate, dir_only)
+                       for regexes, negate, dir_only in self.groups]
+
+    def __bool__(self):
+        return bool(self.groups)
+
+    def match(self, relpath, is_dir):
+        """True if ignored, False if explicitly re-included, None if no pattern matches."""
+        for regex, negate, dir_only in reversed(self.groups):
+            if (is_dir or not dir_only) and regex.fullmatch(relpath):
+                return not negate
+        return None
+
+class PathFilter:
+    """Decides which paths under root are ignored, from patterns plus .gitignore files.
+
+    patterns are gitignore-style and relative to root (absolute paths under root are accepted
+    too). They behave like git's exclude file: a .gitignore closer to the path takes precedence.
+    A path inside an ignored directory is ignored; walk() prunes such directories instead of
+    descending into them.
+    """
+
+    def __init__(self, root, patterns=(), use_gitignore=True):
+        self.root = os.path.abspath(root)
+        prefix = self.root.rstrip(os.sep) + os.sep
+        self.patterns = IgnoreRules(
+            "/" + os.path.relpath(p, self.root).replace(os.sep, "/") if p.startswith(prefix) else p
+            for p in patterns
+        )
+        self.use_gitignore = use_gitignore
+        self._gitignores = {}  # directory parts -> IgnoreRules
+        self._ignored_dirs = {}  # directory parts -> bool
+        self._lock = threading.Lock()
+
+    def _gitignore(self, dir_parts):
+        rules = self._gitignores.get(dir_parts)
+        if rules is None:
+            try:
+                with open(os.path.join(self.root, *dir_parts, ".gitignore"), encoding="utf-8") as f:
+                    rules = IgnoreRules(f.readlines())
+            except (OSError, UnicodeDecodeError):
+                rules = IgnoreRules([])
+            with self._lock:
+                self._gitignores[dir_parts] = rules
+        return rules
+
+    def _match(self, parts, is_dir):
+        """Whether parts itself matches, assuming none of its parent directories is ignored."""
+        if self.use_gitignore:
+            for depth in range(len(parts) - 1, -1, -1):
+                rules = self._gitignore(parts[:depth])
+                decision = rules.match("/".join(parts[depth:]), is_dir) if rules else None
+                if decision is not None:
+                    return decision
+        return bool(self.patterns.match("/".join(parts), is_dir))
+
+    def _dir_ignored(self, parts):
+        ignored = self._ignored_dirs.get(parts)
+        if ignored is None:
+            ignored = (len(parts) > 1 and self._dir_ignored(parts[:-1])) or self._match(parts, True)
+            with self._lock:
+                self._ignored_dirs[parts] = ignored
+        return ignored
+
+    def _parts(self, path):
+        rel = os.path.relpath(os.path.abspath(path), self.root)
+        if rel == "." or rel == ".." or rel.startswith(".." + os.sep):
+            return None
+        return tuple(rel.split(os.sep))
+
+    def ignores(self, path, is_dir=None):
+        """Whether path is ignored; is_dir is looked up on disk when not given. Paths outside
+        root are never ignored."""
+        parts = self._parts(path)
+        if parts is None:
+            return False
+        if is_dir is None:
+            is_dir = os.path.isdir(path)
+        if len(parts) > 1 and self._dir_ignored(parts[:-1]):
+            return True
+        return self._dir_ignored(parts) if is_dir else self._match(parts, False)
+
+    def walk(self, top=None):
+        """os.walk over top (default root) that never descends into ignored directories and
+        leaves ignored files out."""
+        top = self.root if top is None else top
+        if self.ignores(top, is_dir=True):
+            return
+        for dirpath, dirnames, filenames in os.walk(top):
+            base = self._parts(dirpath) or ()
+            dirnames[:] = [d for d in dirnames if not self._dir_ignored(base + (d,))]
+            yield dirpath, dirnames, [f for f in filenames if not self._match(base + (f,), False)]
+
+    def invalidate(self):
+        """Forget cached .gitignore contents and decisions, e.g. after a .gitignore changed."""
+        with self._lock:
+            self._gitignores.clear()
+            self._ignored_dirs.clear()
+
+_default_filter = None
+
+def default_path_filter():
+    """The filter for WATCHED_DIR, shared by full reindexing and the watcher."""
+    global _default_filter
+    if _default_filter is None:
+        _default_filter = PathFilter(WATCHED_DIR, IGNORE_PATHS, use_gitignore=USE_GITIGNORE)
+    return _default_filter
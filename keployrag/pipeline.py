@@ -0,0 +1,133 @@
+import time
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from keployrag.indexing import read_file, prepare_chunks, chunk_texts, add_embedded
+from keployrag.async_embeddings import create_client, generate_embeddings_batch_async
+from keployrag.embedding_backends import get_local_backend
+from keployrag.config import (
+    REINDEX_READ_WORKERS,
+    REINDEX_GROUP_FILES,
+    REINDEX_EMBED_GROUPS,
+    REINDEX_QUEUE_SIZE,
+    REINDEX_PROGRESS_INTERVAL
+)
+
+class PipelineStats:
+    """Counters updated by the pipeline stages, for progress reports."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.read = 0
+        self.read_errors = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.indexed = 0
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (f"{self.read} files read, {self.embedded} embedded ({self.chunks} chunks), {self.indexed} indexed "
+                f"in {elapsed:.1f}s ({self.indexed / elapsed:.1f} files/s, {self.chunks / elapsed:.1f} chunks/s)")
+
+def _read_file(filepath):
+    """Read and chunk one file; runs on the reader pool."""
+    item = read_file(filepath)
+    return item, prepare_chunks(filepath, item[2])
+
+async def _read_stage(paths, executor, groups, stats, read_workers, group_files, embed_groups):
+    loop = asyncio.get_running_loop()
+    # Reads in flight, collected in submission order; the window bounds how far reading runs ahead
+    window = collections.deque()
+    group = []
+
+    async def collect():
+        nonlocal group
+        filepath, future = window.popleft()
+        try:
+            group.append(await future)
+            stats.read += 1
+        except Exception as e:
+            print(f"Error reading {filepath}: {e}")
+            stats.read_errors += 1
+        if len(group) >= group_files:
+            # Blocks while the embedding stage is behind
+            await groups.put(group)
+            group = []
+
+    for filepath in paths:
+        window.append((filepath, loop.run_in_executor(executor, _read_file, filepath)))
+        if len(window) >= read_workers * 2:
+            await collect()
+    while window:
+        await collect()
+    if group:
+        await groups.put(group)
+    for _ in range(embed_groups):
+        await groups.put(None)
+
+async def _embed_stage(groups, written, client, stats):
+    while True:
+        group = await groups.get()
+        if group is None:
+            await written.put(None)
+            return
+        pending = [item for item, _ in group]
+        prepared = [chunks for _, chunks in group]
+        try:
+            embeddings, failed = await generate_embeddings_batch_async(
+                chunk_texts([to_embed for to_embed, _ in prepared]), client=client)
+        except Exception as e:
+            print(f"Error embedding {len(group)} files: {e}")
+            continue
+        stats.chunks += len(embeddings)
+        stats.embedded += len(group)
+        await written.put((pending, prepared, embeddings, failed))
+
+async def _write_stage(written, stats, embed_groups):
+    # The only stage that touches the index, so commits never contend with each other
+    finished = 0
+    while finished < embed_groups:
+        item = await written.get()
+        if item is None:
+            finished += 1
+            continue
+        stats.indexed += await asyncio.to_thread(add_embedded, *item)
+
+async def _report_progress(stats, groups, written, interval):
+    while True:
+        await asyncio.sleep(interval)
+        print(f"Reindex progress: {stats.summary()}; "
+              f"{groups.qsize()} groups waiting to embed, {written.qsize()} waiting to be indexed")
+
+async def _run(paths, read_workers, group_files, embed_groups, queue_size, progress_interval):
+    stats = PipelineStats()
+    groups = asyncio.Queue(maxsize=queue_size)
+    written = asyncio.Queue(maxsize=queue_size)
+    # One client (and one set of rate limit buckets) for every group in flight
+    client = create_client() if get_local_backend() is None else None
+    reporter = asyncio.ensure_future(_report_progress(stats, groups, written, progress_interval))
+    try:
+        with ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="keployrag-reader") as executor:
+            await asyncio.gather(
+                _read_stage(paths, executor, groups, stats, read_workers, group_files, embed_groups),
+                *(_embed_stage(groups, written, client, stats) for _ in range(embed_groups)),
+                _write_stage(written, stats, embed_groups)
+            )
+    finally:
+        reporter.cancel()
+        if client is not None:
+            await client.close()
+    return stats
+
+def run_pipeline(paths, read_workers=REINDEX_READ_WORKERS, group_files=REINDEX_GROUP_FILES,
+                 embed_groups=REINDEX_EMBED_GROUPS, queue_size=REINDEX_QUEUE_SIZE,
+                 progress_interval=REINDEX_PROGRESS_INTERVAL):
+    """Read, chunk, embed and index files through concurrent stages joined by bounded queues.
+
+    A pool of read_workers threads reads and chunks files into groups of group_files, up to
+    embed_groups groups are embedded at once, and a single writer adds each embedded group
+    to the index. Returns the PipelineStats.
+    """
+    stats = asyncio.run(_run(paths, read_workers, group_files, embed_groups, queue_size, progress_interval))
+    print(f"Reindex finished: {stats.summary()}")
+    return stats
@@ -1,44 +1,117 @@
+import re
 import numpy as np
-from keployrag.index import load_index, get_metadata
+from keployrag.index import index_size, get_metadata, search_vectors, find_identifiers
 from keployrag.embeddings import generate_embeddings
+from keployrag.metadata_store import IDENTIFIER_PATTERN
+from keployrag.config import SEARCH_EXACT_FAST_PATH
+
+# Rank offset of reciprocal rank fusion: larger values weigh lower-ranked hits closer to the top ones
+FUSION_RANK_OFFSET = 60
+# Rows using a query's identifiers considered for ranking, per result asked for
+EXACT_CANDIDATES_PER_RESULT = 20
+
+_QUOTED = re.compile(r"`([^`]*)`")
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_.]*")
+_CAMEL_CASE = re.compile(r"[a-z0-9][A-Z]")
+
+def query_identifiers(query):
+    """Identifiers named in a query: everything in `backticks`, plus words shaped like code
+    (snake_case, camelCase or dotted names, which contribute each part)."""
+    identifiers = []
+    for quoted in _QUOTED.findall(query):
+        identifiers += IDENTIFIER_PATTERN.findall(quoted)
+    for word in _WORD.findall(_QUOTED.sub(" ", query)):
+        word = word.strip(".")
+        if "_" in word or "." in word or _CAMEL_CASE.search(word):
+            identifiers += IDENTIFIER_PATTERN.findall(word)
+    return list(dict.fromkeys(identifiers))
+
+def _result(vector_id, file_data, distance=None):
+    return {
+        "id": int(vector_id),
+        "filename": file_data["filename"],
+        "filepath": file_data["filepath"],
+        "start_line": file_data["start_line"],
+        "end_line": file_data["end_line"],
+        "kind": file_data["kind"],
+        "symbol": file_data["symbol"],
+        "class_name": file_data["class_name"],
+        "content": file_data["content"],
+        "distance": distance
+    }
+
+def exact_search(identifiers, k=5):
+    """Hits for identifiers from the identifier index, without embeddings: their definitions
+    first, then the rows using them, ranked by MetadataStore.find_identifiers.
+
+    Returns (results, all_defined), where all_defined tells whether every identifier names a
+    class, method or function in the index.
+    """
+    defined, used = find_identifiers(identifiers, limit=k * EXACT_CANDIDATES_PER_RESULT)
+    ranked = [vector_id for name in identifiers for vector_id in defined.get(name, [])]
+    # Rows using the identifiers come from the store best match first
+    ranked += list(used)
+    ranked = list(dict.fromkeys(ranked))[:k]
+    metadata_list = get_metadata(ranked, with_content=True)
+    results = [_result(vector_id, metadata_list[vector_id]) for vector_id in ranked if vector_id in metadata_list]
+    return results, all(name in defined for name in identifiers)
+
+def _vector_search(query, k):
+    query_embedding = generate_embeddings(query)
+
+    # Perform the search in FAISS
+    distances, indices = search_vectors(query_embedding, k)
+
+    if len(indices) == 0 or len(indices[0]) == 0:
+        print("No search results found")
+        return []
+
+    results = []
+    # Content is only loaded for the hits being returned; -1 pads results when fewer than k matched
+    metadata_list = get_metadata([idx for idx in indices[0] if idx >= 0], with_content=True)
+
+    if not metadata_list:
+        print("Metadata is empty")
+        return []
+
+    for i, idx in enumerate(indices[0]):
+        file_data = metadata_list.get(int(idx))
+        if file_data is not None:
+            results.append(_result(idx, file_data, distances[0][i]))
+
+    return results
+
+def _fuse(rankings, k):
+    """Merge ranked result lists by reciprocal rank fusion; a hit found by several lists keeps
+    the fields (and distance) from the first list that has it."""
+    scores, merged = {}, {}
+    for results in rankings:
+        for rank, result in enumerate(results):
+            scores[result["id"]] = scores.get(result["id"], 0.0) + 1.0 / (FUSION_RANK_OFFSET + rank + 1)
+            merged.setdefault(result["id"], result)
+    return [merged[vector_id] for vector_id in sorted(merged, key=lambda vector_id: -scores[vector_id])][:k]
 
 def search_code(query, k=5):
-    """Search the FAISS index using a text query."""
+    """Search the FAISS index using a text query.
+
+    Identifiers in the query are looked up in the identifier index first. When each names a
+    definition, those hits are the answer and the query is never embedded; otherwise they
+    are fused with the vector search hits.
+    """
     try:
-        index = load_index()  # Load the FAISS index
-        
-        if index.ntotal == 0:
+        # Resident (or memory-mapped, when sharded) index, reloaded only when the on-disk generation changes
+        if index_size() == 0:
             print("FAISS index is empty")
             return []
-            
-        query_embedding = generate_embeddings(query)
-
-        # Perform the search in FAISS
-        distances, indices = index.search(query_embedding, k)
-        
-        if len(indices) == 0 or len(indices[0]) == 0:
-            print("No search results found")
-            return []
 
-        results = []
-        metadata_list = get_metadata()
-        
-        if not metadata_list:
-            print("Metadata is empty")
-            return []
+        identifiers = query_identifiers(query)
+        exact, all_defined = exact_search(identifiers, k) if identifiers else ([], False)
+        if exact and all_defined and SEARCH_EXACT_FAST_PATH:
+            return exact
+
+        results = _vector_search(query, k)
+        return _fuse([results, exact], k) if exact else results
 
-        for i, idx in enumerate(indices[0]):
-            if idx < len(metadata_list):
-                file_data = metadata_list[idx]
-                results.append({
-                    "filename": file_data["filename"],
-                    "filepath": file_data["filepath"],
-                    "content": file_data["content"],
-                    "distance": distances[0][i]
-                })
-
-        return results
-        
     except Exception as e:
         print(f"Error in search_code: {str(e)}")
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,179 @@
+import os
+import json
+import zlib
+import threading
+import faiss
+import numpy as np
+from keployrag.config import (
+    EMBEDDING_DIM,
+    INDEX_SHARDING,
+    INDEX_SHARD_DEPTH,
+    INDEX_SHARD_COUNT,
+    INDEX_MMAP
+)
+from keployrag.index_log import read_log
+from keployrag.index_types import (
+    build_index,
+    configure_search,
+    empty_like,
+    index_ids,
+    index_kind,
+    mmap_flags,
+    search_index
+)
+
+MANIFEST_FILE = "manifest.json"
+
+def shard_key(filepath):
+    """Return the shard a file (path relative to WATCHED_DIR) belongs to."""
+    if INDEX_SHARDING == "directory":
+        parts = [p for p in os.path.normpath(os.path.dirname(filepath)).split(os.sep) if p not in ("", ".")]
+        return "/".join(parts[:INDEX_SHARD_DEPTH]) or "."
+    if INDEX_SHARDING == "hash":
+        return f"{zlib.crc32(filepath.encode('utf-8')) % INDEX_SHARD_COUNT:04d}"
+    raise ValueError(f"Unknown INDEX_SHARDING {INDEX_SHARDING!r}; expected none, directory or hash")
+
+def _shard_filename(key):
+    return f"shard-{zlib.crc32(key.encode('utf-8')):08x}.faiss"
+
+def load_manifest(shard_dir):
+    try:
+        with open(os.path.join(shard_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_shards(index, id_paths, shard_dir, generation, dirty_keys=None, exclude=()):
+    """Split a checkpointed index into one file per shard and write the shard manifest.
+
+    id_paths is an iterable of (vector_id, filepath). Only shards in dirty_keys are rewritten
+    when the existing shards were written from the same kind of index; pass None to rewrite all.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    previous = load_manifest(shard_dir) or {}
+    kind = index_kind(index)
+    if previous.get("kind") != kind:
+        dirty_keys = None
+
+    live_ids = set(index_ids(index).tolist()) - set(exclude)
+    ids_by_shard = {}
+    for vector_id, filepath in id_paths:
+        if vector_id in live_ids:
+            ids_by_shard.setdefault(shard_key(filepath), []).append(vector_id)
+
+    template = empty_like(index)
+    shards = {}
+    for key, ids in ids_by_shard.items():
+        filename = shards[key] = _shard_filename(key)
+        path = os.path.join(shard_dir, filename)
+        if dirty_keys is not None and key not in dirty_keys and os.path.exists(path):
+            continue
+        ids = np.asarray(sorted(ids), dtype=np.int64)
+        shard = faiss.clone_index(template)
+        shard.add_with_ids(index.reconstruct_batch(ids), ids)
+        faiss.write_index(shard, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    for key, filename in previous.get("shards", {}).items():
+        if key not in shards and os.path.exists(os.path.join(shard_dir, filename)):
+            os.remove(os.path.join(shard_dir, filename))
+
+    manifest_path = os.path.join(shard_dir, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump({"generation": generation, "kind": kind, "shards": shards}, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+class ShardedIndex:
+    """Read-only view over the shard files of the last checkpoint.
+
+    Shards are opened memory-mapped, so only the pages a query touches are read. Changes
+    logged since the checkpoint are replayed into a small in-memory delta index, and the
+    IDs they replaced are masked out of the shard results.
+    """
+
+    def __init__(self, shard_dir, log_file, mmap=INDEX_MMAP):
+        self.shard_dir = shard_dir
+        self.log_file = log_file
+        self.mmap = mmap
+        self._lock = threading.RLock()
+        self._generation = None
+        self._shards = {}
+        self._delta = build_index("flat", EMBEDDING_DIM, quantization="none")
+        self._delta_ids = set()
+        # IDs removed from the shards since the checkpoint; delta removals are deleted outright
+        self._removed = set()
+        self._log_offset = 0
+
+    def refresh(self):
+        """Reopen the shards if a newer checkpoint was written, then replay new log records."""
+        with self._lock:
+            manifest = load_manifest(self.shard_dir)
+            if manifest is None:
+                return
+            if manifest["generation"] != self._generation:
+                flags = mmap_flags(manifest["kind"]) if self.mmap else 0
+                self._shards = {
+                    key: configure_search(faiss.read_index(os.path.join(self.shard_dir, filename), flags))
+                    for key, filename in manifest["shards"].items()
+                }
+                self._generation = manifest["generation"]
+                self._delta = build_index("flat", EMBEDDING_DIM, quantization="none")
+                self._delta_ids = set()
+                self._removed = set()
+                self._log_offset = 0
+            for record, end_offset in read_log(self.log_file, self._log_offset):
+                if record["op"] == "header":
+                    if record["generation"] != self._generation:
+                        # The log already belongs to a checkpoint whose shards are still being written
+                        return
+                else:
+                    removed = record["remove_ids"].tolist()
+                    in_delta = [vector_id for vector_id in removed if vector_id in self._delta_ids]
+                    if in_delta:
+                        self._delta.remove_ids(np.asarray(in_delta, dtype=np.int64))
+                        self._delta_ids.difference_update(in_delta)
+                    self._removed.update(vector_id for vector_id in removed if vector_id not in in_delta)
+                    if record["op"] == "replace":
+                        self._delta.add_with_ids(record["vectors"], record["ids"])
+                        self._delta_ids.update(record["ids"].tolist())
+                self._log_offset = end_offset
+
+    @property
+    def ntotal(self):
+        with self._lock:
+            return sum(s.ntotal for s in self._shards.values()) + self._delta.ntotal - len(self._removed)
+
+    def search(self, query_embedding, k):
+        """Fan the query out over every shard plus the delta and merge into one top-k."""
+        with self._lock:
+            self.refresh()
+            all_distances, all_ids = [], []
+            for shard in list(self._shards.values()) + [self._delta]:
+                if shard.ntotal == 0:
+                    continue
+                distances, ids = search_index(shard, query_embedding, k, exclude=self._removed)
+                all_distances.append(distances)
+                all_ids.append(ids)
+
+        nq = len(query_embedding)
+        merged_distances = np.full((nq, k), np.inf, dtype=np.float32)
+        merged_ids = np.full((nq, k), -1, dtype=np.int64)
+        if not all_ids:
+            return merged_distances, merged_ids
+        distances = np.hstack(all_distances)
+        ids = np.hstack(all_ids)
+        for q in range(nq):
+            seen = set()
+            n = 0
+            for position in np.argsort(distances[q], kind="stable"):
+                vector_id = int(ids[q, position])
+                # A shard rewritten mid-refresh can hold a vector that is also in the delta
+                if vector_id < 0 or vector_id in seen:
+                    continue
+                seen.add(vector_id)
+                merged_distances[q, n] = distances[q, position]
+                merged_ids[q, n] = vector_id
+                n += 1
+                if n == k:
+                    break
+        return merged_distances, merged_ids
@@ -0,0 +1,60 @@
+import os
+from keployrag.config import WATCHED_DIR, GRAPH_CONTEXT_CALLERS
+from keployrag.index import store
+
+def _split(name):
+    """("Class", "method") for a qualified "Class.method", (None, name) otherwise."""
+    class_name, _, symbol = name.rpartition(".")
+    return class_name or None, symbol
+
+def _with_id(vector_id, entry, **extra):
+    return dict(entry, id=vector_id, **extra)
+
+def definitions(name, with_content=False):
+    """Classes, methods and functions named name ("Class.method" narrows to one class)."""
+    class_name, symbol = _split(name)
+    return [_with_id(vector_id, entry)
+            for vector_id, entry in sorted(store.definitions(symbol, class_name, with_content).items())]
+
+def callers(name, with_content=False, exclude=(), limit=None):
+    """Chunks that call or construct name, each with the lines of those calls.
+
+    For "Class.method", calls through self/this in the class or through the class name come
+    first, then calls through receivers of unknown type; calls that resolve to another class
+    are left out. Chunks in exclude are skipped, and only the first limit are loaded.
+    """
+    class_name, symbol = _split(name)
+    found = store.references_to(symbol, class_name, exclude=exclude, limit=limit)
+    entries = store.get([chunk_id for chunk_id, _ in found], with_content=with_content)
+    return [_with_id(chunk_id, entries[chunk_id], lines=lines) for chunk_id, lines in found if chunk_id in entries]
+
+def callees(vector_id, with_content=False):
+    """Definitions of the names a chunk calls or constructs, in order of first use."""
+    names = dict.fromkeys(name for name, _ in store.references_from([vector_id]).get(vector_id, []))
+    found = []
+    for name in names:
+        found.extend(definitions(name, with_content))
+    return found
+
+def symbols_in_file(filepath, with_content=False):
+    """The indexed chunks of a file (absolute, or relative to WATCHED_DIR), in file order."""
+    if os.path.isabs(filepath):
+        filepath = os.path.relpath(filepath, WATCHED_DIR)
+    return [_with_id(vector_id, entry) for vector_id, entry in store.chunks_for_path(filepath, with_content)]
+
+def related_context(results, limit=GRAPH_CONTEXT_CALLERS):
+    """Callers of the symbols in search results, to show how the found code is used.
+
+    Up to limit callers per result, leaving out chunks that are results themselves; each
+    comes with the symbol it calls as "calls". Only the callers shown are read with content.
+    """
+    seen = {result["id"] for result in results if result.get("id") is not None}
+    related = []
+    for result in results:
+        if not result.get("symbol") or result.get("kind") == "module":
+            continue
+        name = f"{result['class_name']}.{result['symbol']}" if result.get("kind") == "method" else result["symbol"]
+        for caller in callers(name, with_content=True, exclude=seen, limit=limit):
+            seen.add(caller["id"])
+            related.append(dict(caller, calls=result["symbol"]))
+    return related
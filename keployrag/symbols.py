@@ -0,0 +1,183 @@
+import os
+import bisect
+import threading
+from parsing.treesitter import Treesitter, TreeCache
+from parsing.preprocessing import get_language_from_extension
+from keployrag.chunking import chunk_text
+from keployrag.config import CHUNK_MAX_TOKENS, TREE_CACHE_SIZE
+from keployrag.tokens import count_tokens
+
+# One parser per language and thread, so the pipeline's read workers and the watcher parse in parallel
+_local = threading.local()
+# Striped by path: the same file is never extracted by two threads at once, as an incremental
+# re-parse edits the tree the cache handed out for its previous version
+_path_locks = [threading.Lock() for _ in range(64)]
+tree_cache = TreeCache(TREE_CACHE_SIZE)
+
+# Call-like node types and the field naming what they call or construct
+_CALL_TARGETS = {
+    "call": "function",
+    "call_expression": "function",
+    "method_invocation": "name",
+    "object_creation_expression": "type",
+    "new_expression": "constructor"
+}
+
+def _parser(language):
+    parsers = getattr(_local, "parsers", None)
+    if parsers is None:
+        parsers = _local.parsers = {}
+    if language not in parsers:
+        parsers[language] = Treesitter.create_treesitter(language)
+    return parsers[language]
+
+def _outer_node(node):
+    # Include decorators in a decorated Python definition
+    if node.parent is not None and node.parent.type == "decorated_definition":
+        return node.parent
+    return node
+
+def _contains(outer, inner):
+    return outer[0] <= inner[0] and inner[1] <= outer[1] and outer != inner
+
+def _line_start(source, start):
+    """Move start back over the indentation before a definition."""
+    line_start = source.rfind(b"\n", 0, start) + 1
+    return line_start if not source[line_start:start].strip() else start
+
+def _trim(source, start, end):
+    """Shrink [start, end) to whole lines, dropping leading and trailing blank lines."""
+    text = source[start:end]
+    stripped = text.strip()
+    if not stripped:
+        return None
+    first = start + text.index(stripped)
+    first = source.rfind(b"\n", start, first) + 1 or start
+    return first, first + len(source[first:end].rstrip())
+
+def _symbol_spans(source, classes, methods):
+    """Return (start_byte, end_byte, kind, symbol, class_name) for every indexed symbol.
+
+    Methods and functions cover their whole definition (nested functions stay part of
+    their enclosing one), a class covers its header up to its first method, and code
+    outside any definition is grouped into module-level spans.
+    """
+    functions = []
+    for method in methods:
+        node = _outer_node(method.node)
+        kind = "method" if method.class_name else "function"
+        functions.append((_line_start(source, node.start_byte), node.end_byte, kind, method.name, method.class_name))
+    functions = [f for f in functions if not any(_contains(other[:2], f[:2]) for other in functions)]
+
+    spans = list(functions)
+    definitions = [f[:2] for f in functions]
+    for cls in classes:
+        node = _outer_node(cls.node)
+        span = (_line_start(source, node.start_byte), node.end_byte)
+        first_method = min((f[0] for f in functions if _contains(span, f[:2])), default=span[1])
+        header = _trim(source, span[0], first_method)
+        if header:
+            spans.append(header + ("class", cls.name, cls.name))
+        definitions.append(span)
+
+    # Everything outside the top-level definitions is module-level code (imports, constants, scripts)
+    top_level = sorted(d for d in definitions if not any(_contains(other, d) for other in definitions))
+    position = 0
+    for start, end in top_level + [(len(source), len(source))]:
+        if start > position:
+            gap = _trim(source, position, start)
+            if gap:
+                spans.append(gap + ("module", None, None))
+        position = max(position, end)
+    return sorted(spans)
+
+def _target_name(node):
+    """Name called through a callee node: the identifier itself, or the last identifier of an
+    attribute, member, path or generic type (obj.method, pkg::func, Foo<T>)."""
+    while node is not None and not (node.type.endswith("identifier") and node.named_child_count == 0):
+        node = next((child for child in reversed(node.named_children) if child.type.endswith("identifier")
+                     or child.type in ("attribute", "member_expression", "field_expression")), None)
+    return node.text.decode("utf-8", "replace") if node is not None else None
+
+def _qualifier(call, callee):
+    """The receiver or path a call goes through (self.add, store.add, Store::new, Store.create),
+    when it is a plain name or self/this; None otherwise."""
+    target = call if call.type == "method_invocation" else callee
+    for field in ("object", "value", "path"):
+        node = target.child_by_field_name(field) if target is not None else None
+        if node is not None:
+            if node.type in ("identifier", "type_identifier", "self", "this"):
+                return node.text.decode("utf-8", "replace")
+            return None
+    return None
+
+def _references(root):
+    """(start_byte, name, line, qualifier) of every call or construction under root, in source order."""
+    references = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        field = _CALL_TARGETS.get(node.type)
+        if field:
+            callee = node.child_by_field_name(field)
+            name = _target_name(callee)
+            if name:
+                references.append((node.start_byte, name, node.start_point[0] + 1, _qualifier(node, callee)))
+        stack.extend(reversed(node.children))
+    return references
+
+def extract_symbol_chunks(content, filepath, max_tokens=CHUNK_MAX_TOKENS):
+    """Split a source file into one chunk per class, method, function and block of module code.
+
+    Chunks have the same fields as chunking.chunk_text plus kind, symbol and class_name, and
+    references: the (name, line, qualifier) of every call or construction in the chunk, with the
+    receiver it goes through as qualifier when that is a plain name; the edges of the
+    symbol graph. Symbols over max_tokens are further split into windows. Returns None when the file's
+    language is not supported by the tree-sitter parser.
+
+    Only the parse is incremental, through tree_cache: symbols and references are extracted
+    from the whole file each time, and unchanged chunks are skipped later, at embedding.
+    """
+    language = get_language_from_extension(os.path.splitext(filepath)[1])
+    if language is None:
+        return None
+    source = content.encode("utf-8")
+    with _path_locks[hash(filepath) % len(_path_locks)]:
+        treesitter = _parser(language)
+        tree = tree_cache.parse(treesitter, filepath, source)
+        classes, methods = treesitter.parse(source, tree=tree)
+        references = _references(tree.root_node)
+
+    line_starts = [0] + [i + 1 for i, byte in enumerate(source) if byte == 0x0A]
+    chunks = []
+    for start, end, kind, symbol, class_name in _symbol_spans(source, classes, methods):
+        text = source[start:end].decode("utf-8")
+        start_line = bisect.bisect_right(line_starts, start)
+        if count_tokens(text) <= max_tokens:
+            pieces = [{
+                "content": text,
+                "start_line": start_line,
+                "end_line": start_line + text.count("\n"),
+                "start_byte": start,
+                "end_byte": end
+            }]
+        else:
+            pieces = chunk_text(text, max_tokens=max_tokens)
+            for piece in pieces:
+                piece["start_line"] += start_line - 1
+                piece["end_line"] += start_line - 1
+                piece["start_byte"] += start
+                piece["end_byte"] += start
+        for piece in pieces:
+            piece.update(kind=kind, symbol=symbol, class_name=class_name)
+        chunks.extend(pieces)
+
+    starts = [chunk["start_byte"] for chunk in chunks]
+    for chunk in chunks:
+        chunk["references"] = []
+    for start_byte, name, line, qualifier in references:
+        # Overlapping windows of a long symbol: the reference goes to the last one starting before it
+        i = bisect.bisect_right(starts, start_byte) - 1
+        if i >= 0 and start_byte < chunks[i]["end_byte"]:
+            chunks[i]["references"].append((name, line, qualifier))
+    return chunks
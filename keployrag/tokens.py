@@ -0,0 +1,28 @@
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a conservative estimate
+    tiktoken = None
+
+# Encoding used by the OpenAI embedding models (text-embedding-ada-002, text-embedding-3-*)
+_ENCODING_NAME = "cl100k_base"
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(_ENCODING_NAME)
+        except Exception as e:
+            print(f"Could not load tiktoken encoding {_ENCODING_NAME}, estimating token counts: {e}")
+            return None
+    return _encoding
+
+def count_tokens(text):
+    """Count the tokens the embedding model will see for text.
+
+    Without tiktoken this over-estimates (roughly 3 characters per token) so budgets stay safe.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 3 + 1
@@ -1,11 +1,23 @@
 import os
 import logging
+import argparse
 import atexit
 import warnings
-from keployrag.index import clear_index, add_to_index, save_index
-from keployrag.embeddings import generate_embeddings
+from keployrag.index import clear_index, save_index, remove_from_index, move_in_index
+from keployrag.pipeline import run_pipeline
+from keployrag.embeddings import cache_stats
 from keployrag.config import WATCHED_DIR
-from keployrag.monitor import start_monitoring, should_ignore_path
+from keployrag.monitor import start_monitoring
+from keployrag.manifest import (
+    diff_paths,
+    diff_tree,
+    git_changes,
+    git_state,
+    rebuild_reason,
+    record_git_state,
+    record_settings,
+    source_files
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -13,45 +25,72 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Suppress transformers warnings
 warnings.filterwarnings("ignore", category=FutureWarning, module="transformers.tokenization_utils_base")
 
+def _log_cache_stats():
+    stats = cache_stats()
+    if stats:
+        logging.info(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+                     f"({stats['hit_rate']:.0%} hit rate), {stats['evictions']} evictions")
+
 def full_reindex():
     """Perform a full reindex of the entire codebase."""
     logging.info("Starting full reindexing of the codebase...")
-    files_processed = 0
-    for root, _, files in os.walk(WATCHED_DIR):
-        if should_ignore_path(root):  # Check if the directory should be ignored
-            logging.info(f"Ignoring directory: {root}")
-            continue
-
-        for file in files:
-            filepath = os.path.join(root, file)
-            if should_ignore_path(filepath):  # Check if the file should be ignored
-                logging.info(f"Ignoring file: {filepath}")
-                continue
-
-            if file.endswith(".py"):
-                logging.info(f"Processing file: {filepath}")
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        full_content = f.read()
-
-                    embeddings = generate_embeddings(full_content)  # Generate embeddings
-                    if embeddings is not None:
-                        add_to_index(embeddings, full_content, file, filepath)
-                    else:
-                        logging.warning(f"Failed to generate embeddings for {filepath}")
-                    files_processed += 1
-                except Exception as e:
-                    logging.error(f"Error processing file {filepath}: {e}")
+    # Taken first, so changes made while indexing are picked up on the next start
+    state = git_state(WATCHED_DIR)
+    stats = run_pipeline(source_files(WATCHED_DIR))
+    save_index()
+    record_settings()
+    record_git_state(state)
+    logging.info(f"Full reindexing completed. {stats.read} files processed.")
+    _log_cache_stats()
 
+def reconcile_index():
+    """Bring the index up to date with the codebase, processing only the files added, changed,
+    moved or removed since they were last indexed. In a git repository the candidates come from
+    the commit diff since the last run; otherwise every file is checked against the manifest.
+    Falls back to a full reindex when the manifest cannot be trusted."""
+    reason = rebuild_reason()
+    if reason:
+        logging.info(f"Rebuilding the index from scratch: {reason}")
+        clear_index()
+        full_reindex()
+        return
+
+    state = git_state(WATCHED_DIR)
+    changes = git_changes(WATCHED_DIR)
+    if changes is not None:
+        moved, candidates = changes
+        for src_path, dest_path in moved:
+            move_in_index(src_path, dest_path)
+        added, changed, removed = diff_paths(candidates)
+        logging.info(f"Reconciling index with git changes: {len(candidates)} changed paths, {len(moved)} renames")
+    else:
+        added, changed, removed = diff_tree(WATCHED_DIR)
+    logging.info(f"Reconciling index with the codebase: {len(added)} added, {len(changed)} changed, "
+                 f"{len(removed)} removed files")
+    for filepath in removed:
+        remove_from_index(filepath)
+    if added or changed:
+        run_pipeline(added + changed)
     save_index()
-    logging.info(f"Full reindexing completed. {files_processed} files processed.")
+    record_git_state(state)
+    logging.info("Index reconciliation completed.")
+    _log_cache_stats()
 
 def main():
-    # Completely clear the FAISS index and metadata
-    clear_index()
+    parser = argparse.ArgumentParser(description="Index the codebase and keep the index updated as files change.")
+    parser.add_argument("--full", action="store_true",
+                        help="clear the index and re-embed every file instead of only the files that changed")
+    args = parser.parse_args()
+
+    # Checkpoint whatever is still only in the index log on the way out
+    atexit.register(save_index)
 
-    # Perform a full reindex of the codebase
-    full_reindex()
+    if args.full:
+        # Completely clear the FAISS index and metadata and reindex the codebase
+        clear_index()
+        full_reindex()
+    else:
+        reconcile_index()
 
     # Start monitoring the directory for changes
     start_monitoring()
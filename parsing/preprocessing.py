@@ -1,13 +1,13 @@
 import os
 import sys
-from treesitter import Treesitter, LanguageEnum
-from collections import defaultdict
-import csv
-from typing import List, Dict
-from tree_sitter import Node
-from tree_sitter_languages import get_language, get_parser
-
-# Define your BLACKLIST_DIR, WHITELIST_FILES, NODE_TYPES, and REFERENCE_IDENTIFIERS here
+from parsing.treesitter import Treesitter, LanguageEnum
+from keployrag.pathfilter import PathFilter
+from keployrag.git_changes import repo_root, changes_since
+from parsing.symbol_store import SymbolStore
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Define your BLACKLIST_DIR and WHITELIST_FILES here
 BLACKLIST_DIR = [
     "__pycache__",
     ".pytest_cache",
@@ -30,50 +30,6 @@ BLACKLIST_DIR = [
 WHITELIST_FILES = [".java", ".py", ".js", ".rs"]
 BLACKLIST_FILES = ["docker-compose.yml"]
 
-NODE_TYPES = {
-    "python": {
-        "class": "class_definition",
-        "method": "function_definition"
-    },
-    "java": {
-        "class": "class_declaration",
-        "method": "method_declaration"
-    },
-    "rust": {
-        "class": "struct_item",
-        "method": "function_item"
-    },
-    "javascript": {
-        "class": "class_declaration",
-        "method": "method_definition"
-    },
-    # Add other languages as needed
-}
-
-REFERENCE_IDENTIFIERS = {
-    "python": {
-        "class": "identifier",
-        "method": "call",
-        "child_field_name": "function"
-    },
-    "java": {
-        "class": "identifier",
-        "method": "method_invocation",
-        "child_field_name": "name"
-    },
-    "javascript": {
-        "class": "identifier",
-        "method": "call_expression",
-        "child_field_name": "function"
-    },
-    "rust": {
-        "class": "identifier",
-        "method": "call_expression",
-        "child_field_name": "function"
-    },
-    # Add other languages as needed
-}
-
 def get_language_from_extension(file_ext):
     FILE_EXTENSION_LANGUAGE_MAP = {
         ".java": LanguageEnum.JAVA,
@@ -84,119 +40,175 @@ def get_language_from_extension(file_ext):
     }
     return FILE_EXTENSION_LANGUAGE_MAP.get(file_ext)
 
-def load_files(codebase_path):
+def _source_language(file_path):
+    file_ext = os.path.splitext(file_path)[1]
+    if file_ext not in WHITELIST_FILES:
+        return None
+    language = get_language_from_extension(file_ext)
+    if not language:
+        print(f"Unsupported file extension {file_ext} in file {file_path}. Skipping.")
+    return language
+
+def load_files(codebase_path, since=None):
+    """List (file_path, language) for the source files under codebase_path.
+
+    With since (a commit), only files added, modified or renamed since that commit,
+    committed or not, are listed, found from git instead of walking the tree.
+    """
     file_list = []
-    for root, dirs, files in os.walk(codebase_path):
-        dirs[:] = [d for d in dirs if d not in BLACKLIST_DIR]
+    # Blacklisted names are ignored at any depth, along with anything the repo's .gitignore files exclude
+    path_filter = PathFilter(codebase_path, [d + "/" for d in BLACKLIST_DIR] + BLACKLIST_FILES)
+    if since is not None:
+        repo = repo_root(codebase_path)
+        if repo is None:
+            raise ValueError(f"{codebase_path} is not in a git repository")
+        changed, renamed = changes_since(repo, since)
+        root = os.path.realpath(codebase_path)
+        for file_path in sorted(changed.union(new for _, new in renamed)):
+            inside = file_path.startswith(root.rstrip(os.sep) + os.sep)
+            if inside and os.path.isfile(file_path) and not path_filter.ignores(file_path, is_dir=False):
+                language = _source_language(file_path)
+                if language:
+                    file_list.append((file_path, language))
+        return file_list
+    for root, _, files in path_filter.walk():
         for file in files:
-            file_ext = os.path.splitext(file)[1]
-            if file_ext in WHITELIST_FILES:
-                if file not in BLACKLIST_FILES:
-                    file_path = os.path.join(root, file)
-                    language = get_language_from_extension(file_ext)
-                    if language:
-                        file_list.append((file_path, language))
-                    else:
-                        print(f"Unsupported file extension {file_ext} in file {file_path}. Skipping.")
+            file_path = os.path.join(root, file)
+            language = _source_language(file_path)
+            if language:
+                file_list.append((file_path, language))
     return file_list
 
-def parse_code_files(file_list):
-    class_data = []
-    method_data = []
-
-    all_class_names = set()
-    all_method_names = set()
-
-    files_by_language = defaultdict(list)
-    for file_path, language in file_list:
-        files_by_language[language].append(file_path)
-
-    for language, files in files_by_language.items():
-        treesitter_parser = Treesitter.create_treesitter(language)
-        for file_path in files:
-            with open(file_path, "r", encoding="utf-8") as file:
-                code = file.read()
-                file_bytes = code.encode()
-                class_nodes, method_nodes = treesitter_parser.parse(file_bytes)
-
-                # Process class nodes
-                for class_node in class_nodes:
-                    class_name = class_node.name
-                    all_class_names.add(class_name)
-                    class_data.append({
-                        "file_path": file_path,
-                        "class_name": class_name,
-                        "constructor_declaration": "",  # Extract if needed
-                        "method_declarations": "\n-----\n".join(class_node.method_declarations) if class_node.method_declarations else "",
-                        "source_code": class_node.source_code,
-                        "references": []  # Will populate later
-                    })
-
-                # Process method nodes
-                for method_node in method_nodes:
-                    method_name = method_node.name
-                    all_method_names.add(method_name)
-                    method_data.append({
-                        "file_path": file_path,
-                        "class_name": method_node.class_name if method_node.class_name else "",
-                        "name": method_name,
-                        "doc_comment": method_node.doc_comment,
-                        "source_code": method_node.method_source_code,
-                        "references": []  # Will populate later
-                    })
-
-    return class_data, method_data, all_class_names, all_method_names
-
-def find_references(file_list, class_names, method_names):
+# Parsers of the current process (each pool worker builds its own), by language
+_parsers = {}
+
+def _parser_for(language):
+    if language not in _parsers:
+        _parsers[language] = Treesitter.create_treesitter(language)
+    return _parsers[language]
+
+def parse_file(file_path, language):
+    """Parse one file once, extracting its classes, methods and candidate references.
+
+    Candidate references are identifiers used as a type, constructor or call target; which
+    of them refer to a known class or method is only decided once every file is parsed.
+    Returns (class_data, method_data, candidates) with candidates as {"class": [(name, ref)],
+    "method": [(name, ref)]}.
+    """
+    treesitter_parser = _parser_for(language)
+    with open(file_path, "r", encoding="utf-8") as file:
+        file_bytes = file.read().encode()
+    tree = treesitter_parser.parser.parse(file_bytes)
+    class_nodes, method_nodes = treesitter_parser.parse(file_bytes, tree=tree)
+
+    class_data = [{
+        "file_path": file_path,
+        "class_name": class_node.name,
+        "constructor_declaration": "",  # Extract if needed
+        "method_declarations": "\n-----\n".join(class_node.method_declarations) if class_node.method_declarations else "",
+        "source_code": class_node.source_code,
+        "references": []  # Will populate later
+    } for class_node in class_nodes]
+    method_data = [{
+        "file_path": file_path,
+        "class_name": method_node.class_name if method_node.class_name else "",
+        "name": method_node.name,
+        "doc_comment": method_node.doc_comment,
+        "source_code": method_node.method_source_code,
+        "references": []  # Will populate later
+    } for method_node in method_nodes]
+
+    candidates = {"class": [], "method": []}
+    stack = [(tree.root_node, None)]
+    while stack:
+        node, parent = stack.pop()
+        if node.type == 'identifier' and parent:
+            kind = None
+            if parent.type in ['type', 'class_type', 'object_creation_expression']:
+                kind = "class"
+            elif parent.type in ['call_expression', 'method_invocation']:
+                kind = "method"
+            if kind:
+                candidates[kind].append((node.text.decode(), {
+                    "file": file_path,
+                    "line": node.start_point[0] + 1,
+                    "column": node.start_point[1] + 1,
+                    "text": parent.text.decode()
+                }))
+        # Add children to stack with their parent
+        stack.extend((child, node) for child in node.children)
+    return class_data, method_data, candidates
+
+def _parse_file_task(item):
+    file_path, language = item
+    try:
+        return (file_path, *parse_file(file_path, language))
+    except Exception as e:
+        print(f"Error parsing {file_path}: {e}")
+        return file_path, [], [], {"class": [], "method": []}
+
+def _parse_batch_task(items):
+    return [_parse_file_task(item) for item in items]
+
+def iter_parsed_files(file_list, workers=None, batch_files=16):
+    """Parse every file once across a pool of worker processes, yielding
+    (file_path, class_data, method_data, candidates) per file in file_list order.
+
+    Files go to the workers batch_files at a time, and only a few batches per worker are in
+    flight at once, so results never pile up faster than the caller consumes them.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(file_list) <= 1:
+        for item in file_list:
+            yield _parse_file_task(item)
+        return
+    batches = (file_list[i:i + batch_files] for i in range(0, len(file_list), batch_files))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append(pool.submit(_parse_batch_task, batch))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+def parse_files(file_list, workers=None):
+    """Parse every file with iter_parsed_files and resolve references, keeping everything in memory.
+
+    Returns (class_data, method_data, references), where references maps each known class
+    and method name to the places it is used, as {"class": {name: [ref]}, "method": {name: [ref]}}.
+    For large codebases, write_symbol_store streams the same data to disk instead.
+    """
+    class_data, method_data = [], []
+    candidates = {"class": [], "method": []}
+    for _, file_classes, file_methods, file_candidates in iter_parsed_files(file_list, workers=workers):
+        class_data.extend(file_classes)
+        method_data.extend(file_methods)
+        for kind in candidates:
+            candidates[kind].extend(file_candidates[kind])
+
+    # Resolve candidates against the symbols defined anywhere in the codebase
+    names = {
+        "class": {cd["class_name"] for cd in class_data},
+        "method": {md["name"] for md in method_data}
+    }
     references = {'class': defaultdict(list), 'method': defaultdict(list)}
-    files_by_language = defaultdict(list)
-    
-    # Convert names to sets for O(1) lookup
-    class_names = set(class_names)
-    method_names = set(method_names)
-
-    for file_path, language in file_list:
-        files_by_language[language].append(file_path)
-
-    for language, files in files_by_language.items():
-        treesitter_parser = Treesitter.create_treesitter(language)
-        for file_path in files:
-            with open(file_path, "r", encoding="utf-8") as file:
-                code = file.read()
-                file_bytes = code.encode()
-                tree = treesitter_parser.parser.parse(file_bytes)
-                
-                # Single pass through the AST
-                stack = [(tree.root_node, None)]
-                while stack:
-                    node, parent = stack.pop()
-                    
-                    # Check for identifiers
-                    if node.type == 'identifier':
-                        name = node.text.decode()
-                        
-                        # Check if it's a class reference
-                        if name in class_names and parent and parent.type in ['type', 'class_type', 'object_creation_expression']:
-                            references['class'][name].append({
-                                "file": file_path,
-                                "line": node.start_point[0] + 1,
-                                "column": node.start_point[1] + 1,
-                                "text": parent.text.decode()
-                            })
-                        
-                        # Check if it's a method reference
-                        if name in method_names and parent and parent.type in ['call_expression', 'method_invocation']:
-                            references['method'][name].append({
-                                "file": file_path,
-                                "line": node.start_point[0] + 1,
-                                "column": node.start_point[1] + 1,
-                                "text": parent.text.decode()
-                            })
-                    
-                    # Add children to stack with their parent
-                    stack.extend((child, node) for child in node.children)
-
-    return references
+    for kind, kind_candidates in candidates.items():
+        for name, ref in kind_candidates:
+            if name in names[kind]:
+                references[kind][name].append(ref)
+    return class_data, method_data, references
+
+def write_symbol_store(file_list, store, workers=None):
+    """Parse file_list and stream each file's classes, methods and candidate references into a
+    SymbolStore as it is parsed; references are resolved by the store's views when read.
+    Returns the number of files written."""
+    written = 0
+    for file_path, class_data, method_data, candidates in iter_parsed_files(file_list, workers=workers):
+        store.add_file(file_path, class_data, method_data, candidates)
+        written += 1
+    store.flush()
+    return written
 
 def create_output_directory(codebase_path):
     normalized_path = os.path.normpath(os.path.abspath(codebase_path))
@@ -205,60 +217,24 @@ def create_output_directory(codebase_path):
     os.makedirs(output_directory, exist_ok=True)
     return output_directory
 
-def write_class_data_to_csv(class_data, output_directory):
-    output_file = os.path.join(output_directory, "class_data.csv")
-    fieldnames = ["file_path", "class_name", "constructor_declaration", "method_declarations", "source_code", "references"]
-    with open(output_file, "w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in class_data:
-            references = row.get("references", [])
-            row["references"] = "; ".join([f"{ref['file']}:{ref['line']}:{ref['column']}" for ref in references])
-            writer.writerow(row)
-    print(f"Class data written to {output_file}")
-
-def write_method_data_to_csv(method_data, output_directory):
-    output_file = os.path.join(output_directory, "method_data.csv")
-    fieldnames = ["file_path", "class_name", "name", "doc_comment", "source_code", "references"]
-    with open(output_file, "w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in method_data:
-            references = row.get("references", [])
-            row["references"] = "; ".join([f"{ref['file']}:{ref['line']}:{ref['column']}" for ref in references])
-            writer.writerow(row)
-    print(f"Method data written to {output_file}")
-
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Please provide the codebase path as an argument.")
         sys.exit(1)
     codebase_path = sys.argv[1]
-
-    files = load_files(codebase_path)
-    class_data, method_data, class_names, method_names = parse_code_files(files)
-
-    # Find references
-    references = find_references(files, class_names, method_names)
-
-    # Map references back to class and method data
-    class_data_dict = {cd['class_name']: cd for cd in class_data}
-    method_data_dict = {(md['class_name'], md['name']): md for md in method_data}
-
-    for class_name, refs in references['class'].items():
-        if class_name in class_data_dict:
-            class_data_dict[class_name]['references'] = refs
-
-    for method_name, refs in references['method'].items():
-        # Find all methods with this name (since methods might have the same name in different classes)
-        for key in method_data_dict:
-            if key[1] == method_name:
-                method_data_dict[key]['references'] = refs
-
-    # Convert dictionaries back to lists
-    class_data = list(class_data_dict.values())
-    method_data = list(method_data_dict.values())
-
-    output_directory = create_output_directory(codebase_path)
-    write_class_data_to_csv(class_data, output_directory)
-    write_method_data_to_csv(method_data, output_directory)
+    # --since COMMIT only parses the files changed since that commit
+    since = sys.argv[sys.argv.index("--since") + 1] if "--since" in sys.argv[2:-1] else None
+    # --workers N parses in N processes (default: one per CPU)
+    workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv[2:-1] else None
+
+    files = load_files(codebase_path, since=since)
+    output_file = os.path.join(create_output_directory(codebase_path), "symbols.db")
+    store = SymbolStore(output_file)
+    if since is None:
+        store.clear()
+    written = write_symbol_store(files, store, workers=workers)
+    if since is not None:
+        # Files deleted since the commit are not listed, so drop whatever no longer exists
+        store.remove_missing_files()
+    store.close()
+    print(f"Classes, methods and references of {written} files written to {output_file}")
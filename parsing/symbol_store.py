@@ -0,0 +1,159 @@
+import os
+import sqlite3
+
+# Rows buffered before they are inserted and committed together
+ROW_GROUP_SIZE = 2000
+
+# Columns of each table, besides the id and the dictionary-encoded file_id
+COLUMNS = {
+    "classes": ("class_name", "constructor_declaration", "method_declarations", "source_code"),
+    "methods": ("class_name", "name", "doc_comment", "source_code"),
+    # Every identifier used as a type, constructor or call target; the class_references and
+    # method_references views keep those naming a known class or method
+    "symbol_references": ("kind", "name", "line", "column", "text")
+}
+
+class SymbolStore:
+    """SQLite output of preprocessing: the classes, methods and references of a codebase.
+
+    Rows are written in groups of row_group_size as files are parsed, so memory stays bounded
+    however large the codebase is. File paths are dictionary-encoded: each is stored once in the
+    files table and rows refer to it by ID. Each field is a column of its own, so a reader can
+    load only what it needs, e.g. names without source code.
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self._conn = None
+        self._file_ids = None  # path -> id, loaded on first write
+        self._pending = {table: [] for table in COLUMNS}
+        self._pending_rows = 0
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE)")
+            for table, columns in COLUMNS.items():
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        id INTEGER PRIMARY KEY,
+                        file_id INTEGER NOT NULL REFERENCES files (id),
+                        {", ".join(f'"{column}"' for column in columns)}
+                    )
+                """)
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_file_id ON {table} (file_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS classes_name ON classes (class_name)")
+            conn.execute("CREATE INDEX IF NOT EXISTS methods_name ON methods (name)")
+            conn.execute("CREATE INDEX IF NOT EXISTS symbol_references_name ON symbol_references (kind, name)")
+            conn.execute("""
+                CREATE VIEW IF NOT EXISTS class_references AS
+                SELECT * FROM symbol_references
+                WHERE kind = 'class' AND name IN (SELECT class_name FROM classes)
+            """)
+            conn.execute("""
+                CREATE VIEW IF NOT EXISTS method_references AS
+                SELECT * FROM symbol_references
+                WHERE kind = 'method' AND name IN (SELECT name FROM methods)
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _load_file_ids(self, conn):
+        if self._file_ids is None:
+            self._file_ids = {path: file_id for file_id, path in conn.execute("SELECT id, path FROM files")}
+        return self._file_ids
+
+    def _file_id(self, conn, file_path):
+        file_id = self._load_file_ids(conn).get(file_path)
+        if file_id is None:
+            file_id = conn.execute("INSERT INTO files (path) VALUES (?)", (file_path,)).lastrowid
+            self._file_ids[file_path] = file_id
+        return file_id
+
+    def add_file(self, file_path, class_data, method_data, candidates):
+        """Queue one file's parse results (as returned by preprocessing.parse_file), replacing
+        anything stored for it before; rows are written once a row group fills up."""
+        conn = self._connection()
+        known = file_path in self._load_file_ids(conn)
+        file_id = self._file_id(conn, file_path)
+        if known:
+            self.flush()
+            for table in COLUMNS:
+                conn.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
+        self._pending["classes"].extend(
+            (file_id, cd["class_name"], cd["constructor_declaration"], cd["method_declarations"], cd["source_code"])
+            for cd in class_data)
+        self._pending["methods"].extend(
+            (file_id, md["class_name"], md["name"], md["doc_comment"], md["source_code"])
+            for md in method_data)
+        self._pending["symbol_references"].extend(
+            (file_id, kind, name, ref["line"], ref["column"], ref["text"])
+            for kind, kind_candidates in candidates.items() for name, ref in kind_candidates)
+        self._pending_rows += len(class_data) + len(method_data) + sum(map(len, candidates.values()))
+        if self._pending_rows >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """Write and commit the queued rows."""
+        conn = self._connection()
+        for table, rows in self._pending.items():
+            if rows:
+                placeholders = ", ".join("?" * (len(COLUMNS[table]) + 1))
+                columns = ", ".join(f'"{column}"' for column in COLUMNS[table])
+                conn.executemany(f"INSERT INTO {table} (file_id, {columns}) VALUES ({placeholders})", rows)
+                rows.clear()
+        conn.commit()
+        self._pending_rows = 0
+
+    def remove_missing_files(self):
+        """Drop the rows of stored files that no longer exist on disk; returns their paths."""
+        conn = self._connection()
+        self.flush()
+        missing = [(file_id, path) for file_id, path in conn.execute("SELECT id, path FROM files")
+                   if not os.path.exists(path)]
+        for table in COLUMNS:
+            conn.executemany(f"DELETE FROM {table} WHERE file_id = ?", [(file_id,) for file_id, _ in missing])
+        conn.executemany("DELETE FROM files WHERE id = ?", [(file_id,) for file_id, _ in missing])
+        conn.commit()
+        self._file_ids = None
+        return [path for _, path in missing]
+
+    def rows(self, table, columns=None):
+        """Yield the rows of a table or view as dicts, with file_path in place of file_id.
+
+        columns selects which fields to load (file_path included); by default all of them.
+        """
+        known = COLUMNS["symbol_references" if table.endswith("_references") else table]
+        columns = list(columns) if columns is not None else ["file_path", *known]
+        unknown = set(columns) - {"file_path", *known}
+        if unknown:
+            raise ValueError(f"Unknown columns for {table}: {sorted(unknown)}")
+        self.flush()
+        selected = ", ".join("files.path" if column == "file_path" else f't."{column}"' for column in columns)
+        cursor = self._connection().execute(
+            f"SELECT {selected} FROM {table} AS t JOIN files ON files.id = t.file_id ORDER BY t.id")
+        for row in cursor:
+            yield dict(zip(columns, row))
+
+    def clear(self):
+        conn = self._connection()
+        for table in self._pending:
+            self._pending[table].clear()
+        self._pending_rows = 0
+        for table in (*COLUMNS, "files"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+        self._file_ids = {}
+
+    def close(self):
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
@@ -1,4 +1,6 @@
 from abc import ABC
+from collections import OrderedDict
+import threading
 from tree_sitter import Language, Parser
 from tree_sitter_languages import get_language, get_parser
 from enum import Enum
@@ -77,6 +79,9 @@ LANGUAGE_QUERIES = {
     # Add other languages as needed - Golang will be added for testing it on Keploy codebase.
 }
 
+# Node types that can sit between a definition and the documentation comments above it
+COMMENT_NODE_TYPES = ("comment", "block_comment", "line_comment")
+
 class TreesitterMethodNode:
     def __init__(
         self,
@@ -104,6 +109,87 @@ class TreesitterClassNode:
         self.method_declarations = method_declarations
         self.node = node
 
+def _common_prefix(a: bytes, b: bytes) -> int:
+    """Length of the longest common prefix, by binary search over slice comparisons."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def _point(source: bytes, offset: int) -> tuple:
+    """(row, column) of a byte offset, as tree-sitter counts them."""
+    row = source.count(b"\n", 0, offset)
+    return row, offset - (source.rfind(b"\n", 0, offset) + 1)
+
+def source_edit(old: bytes, new: bytes) -> dict:
+    """The single edit turning old into new: the changed region between their common prefix
+    and common suffix, as keyword arguments for tree_sitter.Tree.edit."""
+    start = _common_prefix(old, new)
+    suffix = _common_prefix(old[start:][::-1], new[start:][::-1])
+    old_end, new_end = len(old) - suffix, len(new) - suffix
+    return {
+        "start_byte": start,
+        "old_end_byte": old_end,
+        "new_end_byte": new_end,
+        "start_point": _point(new, start),
+        "old_end_point": _point(old, old_end),
+        "new_end_point": _point(new, new_end)
+    }
+
+class TreeCache:
+    """Bounded LRU cache of the last (source bytes, tree) parsed for each path.
+
+    A file parsed again after a change is re-parsed incrementally: the byte difference
+    becomes a tree edit, and tree-sitter reuses every subtree outside the edited region.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.incremental = 0
+        self.misses = 0
+
+    def parse(self, treesitter: "Treesitter", path: str, file_bytes: bytes):
+        """Return the tree for file_bytes, re-using or incrementally updating the cached one.
+
+        Parsing runs outside the cache's lock, so different paths parse in parallel. An
+        incremental re-parse edits the tree returned for the path before, so callers must not
+        parse the same path from two threads at once.
+        """
+        key = (path, treesitter.language_enum)
+        with self._lock:
+            cached = self._entries.pop(key, None)
+            if cached is not None and cached[0] == file_bytes:
+                self.hits += 1
+            elif cached is not None:
+                self.incremental += 1
+            else:
+                self.misses += 1
+        if cached is not None and cached[0] == file_bytes:
+            tree = cached[1]
+        elif cached is not None:
+            old_source, old_tree = cached
+            old_tree.edit(**source_edit(old_source, file_bytes))
+            tree = treesitter.parser.parse(file_bytes, old_tree)
+        else:
+            tree = treesitter.parser.parse(file_bytes)
+        with self._lock:
+            self._entries[key] = (file_bytes, tree)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return tree
+
+    def discard(self, path: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                del self._entries[key]
+
 class Treesitter(ABC):
     def __init__(self, language: LanguageEnum):
         self.language_enum = language
@@ -122,79 +208,87 @@ class Treesitter(ABC):
     def create_treesitter(language: LanguageEnum) -> "Treesitter":
         return Treesitter(language)
 
-    def parse(self, file_bytes: bytes) -> tuple[list[TreesitterClassNode], list[TreesitterMethodNode]]:
-        tree = self.parser.parse(file_bytes)
+    def parse(self, file_bytes: bytes, tree=None) -> tuple[list[TreesitterClassNode], list[TreesitterMethodNode]]:
+        """Extract the classes and methods of a file in time linear in its size.
+
+        Each query runs once over the whole tree; enclosing classes and the method
+        declarations of each class are then assigned in one sweep over the definitions in
+        source order, keeping a stack of the classes whose byte range is still open.
+        """
+        # Callers that also walk the tree themselves pass it in, so the file is only parsed once
+        if tree is None:
+            tree = self.parser.parse(file_bytes)
         root_node = tree.root_node
 
+        class_names = [node for node, capture_name in self.class_query.captures(root_node)
+                       if capture_name == 'class.name']
+        method_names = [node for node, capture_name in self.method_query.captures(root_node)
+                        if capture_name in ['method.name', 'function.name']]
+        class_nodes = [node.parent for node in class_names]
+        method_nodes = [node.parent for node in method_names]
+        docs = self._doc_comments(root_node)
+
         class_results = []
-        method_results = []
+        for name_node, class_node in zip(class_names, class_nodes):
+            class_name = name_node.text.decode()
+            logging.info(f"Found class: {class_name}")
+            class_results.append(TreesitterClassNode(class_name, [], class_node))
+
+        # Classes sort before methods starting at the same byte, so a method never sees itself as a class
+        definitions = sorted(
+            [(node.start_byte, 0, i) for i, node in enumerate(class_nodes)]
+            + [(node.start_byte, 1, i) for i, node in enumerate(method_nodes)]
+        )
+        method_classes = [None] * len(method_nodes)
+        open_classes = []
+        for start_byte, kind, i in definitions:
+            while open_classes and class_nodes[open_classes[-1]].end_byte <= start_byte:
+                open_classes.pop()
+            if kind == 0:
+                open_classes.append(i)
+                continue
+            method_source_code = method_nodes[i].text.decode()
+            for class_index in open_classes:
+                class_results[class_index].method_declarations.append(method_source_code)
+            if open_classes:
+                # Methods of nested classes (and functions nested in methods) belong to the outermost class
+                method_classes[i] = class_results[open_classes[0]].name
 
-        class_name_by_node = {}
-        class_captures = self.class_query.captures(root_node)
-        class_nodes = []
-        for node, capture_name in class_captures:
-            if capture_name == 'class.name':
-                class_name = node.text.decode()
-                class_node = node.parent
-                logging.info(f"Found class: {class_name}")
-                class_name_by_node[class_node.id] = class_name
-                method_declarations = self._extract_methods_in_class(class_node)
-                class_results.append(TreesitterClassNode(class_name, method_declarations, class_node))
-                class_nodes.append(class_node)
-
-        method_captures = self.method_query.captures(root_node)
-        for node, capture_name in method_captures:
-            if capture_name in ['method.name', 'function.name']:
-                method_name = node.text.decode()
-                method_node = node.parent
-                method_source_code = method_node.text.decode()
-                doc_comment = self._extract_doc_comment(method_node)
-                parent_class_name = None
-                for class_node in class_nodes:
-                    if self._is_descendant_of(method_node, class_node):
-                        parent_class_name = class_name_by_node[class_node.id]
-                        break
-                method_results.append(TreesitterMethodNode(
-                    name=method_name,
-                    doc_comment=doc_comment,
-                    method_source_code=method_source_code,
-                    node=method_node,
-                    class_name=parent_class_name
-                ))
+        method_results = []
+        for name_node, method_node, parent_class_name in zip(method_names, method_nodes, method_classes):
+            method_results.append(TreesitterMethodNode(
+                name=name_node.text.decode(),
+                doc_comment=self._extract_doc_comment(method_node, docs),
+                method_source_code=method_node.text.decode(),
+                node=method_node,
+                class_name=parent_class_name
+            ))
 
         return class_results, method_results
 
-    def _extract_methods_in_class(self, class_node):
-        method_declarations = []
-        # Apply method_query to the class_node
-        method_captures = self.method_query.captures(class_node)
-        for node, capture_name in method_captures:
-            if capture_name in ['method.name', 'function.name']:
-                method_declaration = node.parent.text.decode()
-                method_declarations.append(method_declaration)
-        return method_declarations
-
-    def _extract_doc_comment(self, node):
-        # Search for doc comments preceding the node
-        doc_comment = ''
-        current_node = node.prev_sibling
-        while current_node:
-            captures = self.doc_query.captures(current_node)
-            if captures:
-                for cap_node, cap_name in captures:
-                    if cap_name == 'comment':
-                        doc_comment = cap_node.text.decode() + '\n' + doc_comment
-            elif current_node.type not in ['comment', 'block_comment', 'line_comment', 'expression_statement']:
-                # Stop if we reach a node that's not a comment
-                break
+    def _doc_comments(self, root_node):
+        """Map the id of each node carrying documentation (a comment, or a statement holding a
+        docstring) to its text, from a single run of the doc query."""
+        docs = {}
+        for node, capture_name in self.doc_query.captures(root_node):
+            if capture_name == 'comment':
+                carrier = node if node.type in COMMENT_NODE_TYPES else node.parent
+                docs[carrier.id] = node.text.decode()
+        return docs
+
+    def _extract_doc_comment(self, node, docs):
+        # Comments directly preceding the definition (or its decorators)
+        outer = node.parent if node.parent is not None and node.parent.type == "decorated_definition" else node
+        comments = []
+        current_node = outer.prev_sibling
+        while current_node is not None and current_node.type in COMMENT_NODE_TYPES:
+            if current_node.id in docs:
+                comments.append(docs[current_node.id])
             current_node = current_node.prev_sibling
-        return doc_comment.strip()
-
-    def _is_descendant_of(self, node, ancestor):
-        # Check if 'node' is a descendant of 'ancestor'
-        current = node.parent
-        while current:
-            if current == ancestor:
-                return True
-            current = current.parent
-        return False
+        comments.reverse()
+        # A docstring: the first statement of the body
+        body = node.child_by_field_name("body")
+        first_statement = body.named_child(0) if body is not None and body.named_child_count else None
+        if first_statement is not None and first_statement.id in docs:
+            comments.append(docs[first_statement.id])
+        return "\n".join(comments).strip()
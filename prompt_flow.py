@@ -6,6 +6,7 @@ from keployrag.config import (
     AZURE_CHAT_DEPLOYMENT
 )
 from keployrag.search import search_code
+from keployrag.symbol_graph import related_context
 
 client = AzureOpenAI(
     api_key=AZURE_OPENAI_API_KEY,
@@ -28,6 +29,17 @@ Retrieved Code Context:
 Your response:
 """
 
+def _symbol_label(result):
+    if not result.get("symbol"):
+        return ""
+    if result["kind"] == "method":
+        return f", {result['kind']} {result['class_name']}.{result['symbol']}"
+    return f", {result['kind']} {result['symbol']}"
+
+def _format_result(result):
+    return (f"File: {result['filename']} (lines {result['start_line']}-{result['end_line']})"
+            f"{_symbol_label(result)}\n{result['content']}")
+
 def execute_rag_flow(user_query):
     try:
         search_results = search_code(user_query)
@@ -35,10 +47,12 @@ def execute_rag_flow(user_query):
         if not search_results:
             return "No relevant code found for your query."
         
-        code_context = "\n\n".join([
-            f"File: {result['filename']}\n{result['content']}"
-            for result in search_results[:3]
-        ])
+        code_context = "\n\n".join(_format_result(result) for result in search_results[:3])
+        # Callers of the retrieved symbols, from the symbol graph
+        related = related_context(search_results[:3])
+        if related:
+            code_context += "\n\nRelated Code:\n" + "\n\n".join(
+                f"Calls {result['calls']}: {_format_result(result)}" for result in related)
         
         full_prompt = PRE_PROMPT.format(query=user_query, code_context=code_context)
         
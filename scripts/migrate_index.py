@@ -0,0 +1,16 @@
+import sys
+from keployrag.config import INDEX_TYPE, INDEX_QUANTIZATION
+from keployrag.index import migrate_index
+from keployrag.index_types import INDEX_TYPES, QUANTIZATIONS
+
+def main():
+    index_type = sys.argv[1] if len(sys.argv) > 1 else INDEX_TYPE
+    quantization = sys.argv[2] if len(sys.argv) > 2 else INDEX_QUANTIZATION
+    if index_type not in INDEX_TYPES or quantization not in QUANTIZATIONS:
+        print(f"Usage: python scripts/migrate_index.py [{'|'.join(INDEX_TYPES)}] [{'|'.join(QUANTIZATIONS)}]")
+        sys.exit(1)
+    index = migrate_index(index_type, quantization)
+    print(f"FAISS index migrated to {index_type} with {quantization} quantization ({index.ntotal} vectors).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+import argparse
+import faiss
+import numpy as np
+from keployrag.config import FAISS_INDEX_FILE
+from keployrag.index import migrate_index
+from keployrag.index_types import (
+    QUANTIZATIONS,
+    convert_index,
+    index_kind,
+    index_quantization,
+    live_vectors,
+    quantize_flat
+)
+
+def _quantize(index, quantization):
+    if isinstance(index, faiss.IndexIDMap):
+        return convert_index(index, index_kind(index), quantization=quantization)
+    if not isinstance(faiss.downcast_index(index), (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+        raise ValueError(f"Cannot quantize a {type(faiss.downcast_index(index)).__name__}")
+    return quantize_flat(index, quantization)
+
+def recall_at_k(reference, candidate, queries, k):
+    """Share of the reference index's top-k results the candidate index also returns."""
+    _, expected = reference.search(queries, k)
+    _, found = candidate.search(queries, k)
+    hits = sum(len(set(e[e >= 0]) & set(f[f >= 0])) for e, f in zip(expected, found))
+    return hits / max(1, int((expected >= 0).sum()))
+
+def _sample_queries(index, n):
+    """Stored vectors with a little noise, so queries look like real ones near the data."""
+    if isinstance(index, faiss.IndexIDMap):
+        _, vectors = live_vectors(index)
+    else:
+        vectors = index.reconstruct_n(0, index.ntotal)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(n, len(vectors)), replace=False)]
+    noise = rng.standard_normal(queries.shape).astype(np.float32) * queries.std() * 0.1
+    return np.ascontiguousarray(queries + noise)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert FAISS index files to scalar-quantized storage "
+                                                 "and report recall against the original vectors.")
+    parser.add_argument("paths", nargs="*", default=[FAISS_INDEX_FILE],
+                        help="index files to convert (default: the keployrag code index)")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default="fp16")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled queries for the recall check")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--dry-run", action="store_true", help="only report recall and size")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        original = faiss.read_index(path)
+        if original.ntotal == 0:
+            print(f"{path}: empty, skipped")
+            continue
+        if index_quantization(original) != "none":
+            print(f"{path}: already {index_quantization(original)}; recall is measured against its decoded vectors")
+        quantized = _quantize(original, args.quantization)
+
+        queries = _sample_queries(original, args.queries)
+        # Exact float32 search over the original vectors is the baseline for every index type
+        if isinstance(original, faiss.IndexIDMap):
+            baseline = convert_index(original, "flat", quantization="none")
+        else:
+            baseline = quantize_flat(original, "none")
+        recall = recall_at_k(baseline, quantized, queries, min(args.k, original.ntotal))
+        before = len(faiss.serialize_index(original))
+        after = len(faiss.serialize_index(quantized))
+        print(f"{path}: {original.ntotal} vectors, {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+              f"({before / after:.1f}x smaller), recall@{args.k} {recall:.3f}")
+        if args.dry_run:
+            continue
+
+        if os.path.abspath(path) == os.path.abspath(FAISS_INDEX_FILE):
+            # The live code index also has a log and generation stamp to keep consistent
+            migrate_index(index_kind(original), args.quantization)
+        else:
+            faiss.write_index(quantized, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        print(f"{path}: written with {args.quantization} quantization")
+
+if __name__ == "__main__":
+    main()
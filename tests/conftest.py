@@ -0,0 +1,22 @@
+import pytest
+from keployrag import index as keployrag_index
+from keployrag import manifest, symbol_graph
+from keployrag.metadata_store import MetadataStore
+
+@pytest.fixture
+def index_files(tmp_path, monkeypatch):
+    """An empty index whose files, shards and metadata store all live under tmp_path."""
+    index_file = str(tmp_path / "index.faiss")
+    monkeypatch.setattr(keployrag_index, "FAISS_INDEX_FILE", index_file)
+    monkeypatch.setattr(keployrag_index, "METADATA_FILE", str(tmp_path / "metadata.npy"))
+    monkeypatch.setattr(keployrag_index, "WORKING_DIR_METADATA_FILE", str(tmp_path / "cwd" / "metadata.npy"))
+    monkeypatch.setattr(keployrag_index, "VERSION_FILE", index_file + ".version")
+    monkeypatch.setattr(keployrag_index, "LOG_FILE", index_file + ".log")
+    monkeypatch.setattr(keployrag_index, "SHARD_DIR", index_file + ".shards")
+    monkeypatch.setattr(keployrag_index, "_sharded", None)
+    monkeypatch.setattr(keployrag_index, "store", MetadataStore(str(tmp_path / "metadata.db")))
+    # Modules that imported the store by name
+    for module in (manifest, symbol_graph):
+        monkeypatch.setattr(module, "store", keployrag_index.store)
+    keployrag_index.clear_index()
+    return tmp_path
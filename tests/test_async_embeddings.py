@@ -0,0 +1,80 @@
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from keployrag import embeddings
+from keployrag.async_embeddings import create_client, generate_embeddings_batch_async
+from keployrag.config import EMBEDDING_DIM
+
+class StandInEmbeddingsHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Azure OpenAI embeddings endpoint.
+
+    Inputs containing "throttle" are rate limited the first time they are seen and
+    inputs containing "reject" always fail; everything else embeds to its length.
+    """
+    throttled = set()
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        inputs = body["input"]
+        self.requests.append(inputs)
+        key = tuple(inputs)
+        if any("throttle" in text for text in inputs) and key not in self.throttled:
+            self.throttled.add(key)
+            return self._reply(429, {"error": {"message": "Rate limit exceeded"}}, {"Retry-After": "0"})
+        if any("reject" in text for text in inputs):
+            return self._reply(400, {"error": {"message": "Invalid input"}})
+        data = [{"object": "embedding", "index": i, "embedding": [float(len(text))] * EMBEDDING_DIM}
+                for i, text in enumerate(inputs)]
+        self._reply(200, {"object": "list", "data": data, "model": "stand-in",
+                          "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stand_in_server(monkeypatch):
+    monkeypatch.setattr(embeddings, "cache", None)
+    StandInEmbeddingsHandler.throttled = set()
+    StandInEmbeddingsHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInEmbeddingsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+def _embed(endpoint, texts, concurrency=4):
+    async def run():
+        client = create_client(api_key="test", azure_endpoint=endpoint)
+        try:
+            return await generate_embeddings_batch_async(texts, client=client, concurrency=concurrency)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+def test_rate_limited_requests_are_retried(stand_in_server, monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBEDDING_BATCH_SIZE", 2)
+    texts = ["a", "bb", "throttle me", "dddd", "eeeee"]
+    result, failed = _embed(stand_in_server, texts)
+
+    assert failed == {}
+    assert result[:, 0].tolist() == [float(len(text)) for text in texts]
+    assert len(StandInEmbeddingsHandler.requests) == 4
+
+def test_failures_are_reported_per_item(stand_in_server):
+    texts = ["ok", "", "reject this", "fine"]
+    result, failed = _embed(stand_in_server, texts)
+
+    assert sorted(failed) == [1, 2]
+    assert result[0, 0] == 2 and result[3, 0] == 4
@@ -0,0 +1,25 @@
+from keployrag.chunking import chunk_text
+from keployrag.tokens import count_tokens
+
+SOURCE = "".join(
+    f"def function_{i}(value):\n    total = value * {i}\n    return total + len('ü' * {i})\n\n"
+    for i in range(60)
+)
+
+def test_small_content_is_one_chunk():
+    chunks = chunk_text("x = 1\ny = 2", max_tokens=100)
+    assert chunks == [{"content": "x = 1\ny = 2", "start_line": 1, "end_line": 2, "start_byte": 0, "end_byte": 11}]
+
+def test_chunks_stay_within_budget_overlap_and_locate_their_content():
+    chunks = chunk_text(SOURCE, max_tokens=120, overlap_tokens=20)
+    lines = SOURCE.splitlines(keepends=True)
+    encoded = SOURCE.encode("utf-8")
+
+    assert len(chunks) > 1
+    assert chunks[0]["start_line"] == 1 and chunks[-1]["end_line"] == len(lines)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous["start_line"] < chunk["start_line"] <= previous["end_line"] + 1
+    for chunk in chunks:
+        assert count_tokens(chunk["content"]) <= 120
+        assert "".join(lines[chunk["start_line"] - 1:chunk["end_line"]]) == chunk["content"]
+        assert encoded[chunk["start_byte"]:chunk["end_byte"]].decode("utf-8") == chunk["content"]
@@ -0,0 +1,24 @@
+import numpy as np
+from keployrag import embeddings, embedding_backends
+from keployrag.embedding_backends import HashingEmbedder
+from keployrag.embedding_cache import EmbeddingCache
+
+def test_hashing_embeddings_are_normalised_and_match_related_identifiers():
+    embedder = HashingEmbedder(dim=256)
+    vectors = embedder.embed(["def get_user_name(user):", "getUserName(user)", "parse tcp packet header"])
+
+    assert vectors.shape == (3, 256) and vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert np.array_equal(vectors, embedder.embed(["def get_user_name(user):", "getUserName(user)", "parse tcp packet header"]))
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+
+def test_local_backend_is_used_for_batches_and_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_backends, "EMBEDDING_BACKEND", "hashing")
+    monkeypatch.setattr(embeddings, "cache", EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=1024 * 1024))
+
+    result, failed = embeddings.generate_embeddings_batch(["a = 1", "", "b = 2"])
+    assert list(failed) == [1]
+    assert np.array_equal(result[[0, 2]], embedding_backends.get_local_backend().embed(["a = 1", "b = 2"]))
+
+    embeddings.generate_embeddings_batch(["b = 2"])
+    assert embeddings.cache_stats()["hits"] == 1
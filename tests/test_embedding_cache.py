@@ -0,0 +1,27 @@
+import numpy as np
+from keployrag.embedding_cache import EmbeddingCache
+
+DIM = 8
+
+def _vector(value):
+    return np.full(DIM, value, dtype=np.float32)
+
+def test_cache_hits_are_keyed_by_deployment_and_content(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=1024 * 1024)
+    cache.put_many("ada", ["a = 1", "b = 2"], [_vector(1), _vector(2)])
+
+    found = cache.get_many("ada", ["b = 2", "c = 3", "a = 1"], DIM)
+    assert sorted(found) == [0, 2]
+    assert found[0][0] == 2 and found[2][0] == 1
+    assert cache.get_many("text-embedding-3-small", ["a = 1"], DIM) == {}
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    # Room for three vectors; eviction goes down to 90% of the cap, i.e. two vectors
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=3 * DIM * 4)
+    cache.put_many("ada", ["a", "b", "c"], [_vector(1), _vector(2), _vector(3)])
+    cache.get_many("ada", ["a"], DIM)
+    cache.put_many("ada", ["d"], [_vector(4)])
+
+    assert sorted(cache.get_many("ada", ["a", "b", "c", "d"], DIM)) == [0, 3]
+    assert cache.stats()["evictions"] == 2
@@ -1,7 +1,7 @@
 import faiss
 import os
 from keployrag.index import load_index, retrieve_vectors, inspect_metadata, add_to_index, save_index, clear_index
-from keployrag.embeddings import generate_embeddings
+from keployrag.embeddings import generate_embeddings_batch
 from keployrag.monitor import should_ignore_path
 
 def test_faiss_index():
@@ -12,6 +12,7 @@ def test_faiss_index():
     codebase_dir = os.getenv("WATCHED_DIR")
     files_processed = 0
     
+    pending = []
     for root, _, files in os.walk(codebase_dir):
         if should_ignore_path(root):
             continue
@@ -24,24 +25,23 @@ def test_faiss_index():
             if should_ignore_path(filepath):
                 continue
                 
-            # Read and process each file
+            # Read each file; embeddings are generated for all of them in batched requests
             try:
                 with open(filepath, 'r', encoding='utf-8') as f:
-                    file_content = f.read()
-                
-                # Generate embeddings
-                embeddings = generate_embeddings(file_content)
-                if embeddings is None:
-                    print(f"Embedding generation failed for {filepath}")
-                    continue
-
-                # Add to index
-                add_to_index(embeddings, file_content, file, filepath)
-                files_processed += 1
-                print(f"Indexed file: {filepath}")
-            
+                    pending.append((filepath, file, f.read()))
             except Exception as e:
-                print(f"Error processing {filepath}: {e}")
+                print(f"Error reading {filepath}: {e}")
+
+    embeddings, failed = generate_embeddings_batch([content for _, _, content in pending])
+    for i, (filepath, file, file_content) in enumerate(pending):
+        if i in failed:
+            print(f"Embedding generation failed for {filepath}: {failed[i]}")
+            continue
+
+        # Add to index
+        add_to_index(embeddings[i:i + 1], file_content, file, filepath)
+        files_processed += 1
+        print(f"Indexed file: {filepath}")
     
     save_index()
     print(f"Processed {files_processed} files")
@@ -0,0 +1,206 @@
+import os
+import sqlite3
+import faiss
+import numpy as np
+import pytest
+from keployrag import index as keployrag_index
+from keployrag.config import EMBEDDING_DIM, WATCHED_DIR
+from keployrag.index_types import build_index, index_kind, index_quantization
+from keployrag import shards
+from keployrag.indexing import index_contents
+
+def _vectors(n=1, seed=0):
+    return np.random.default_rng(seed).random((n, EMBEDDING_DIM), dtype=np.float32)
+
+def _path(name):
+    return f"{WATCHED_DIR}/{name}"
+
+def test_replacing_a_file_keeps_index_size(index_files):
+    keployrag_index.add_to_index(_vectors(seed=1), "a = 1", "a.py", _path("a.py"))
+    keployrag_index.add_to_index(_vectors(seed=2), "b = 1", "b.py", _path("b.py"))
+    keployrag_index.add_to_index(_vectors(seed=3), "a = 2", "a.py", _path("a.py"))
+
+    index = keployrag_index.get_index()
+    assert index.ntotal == 2
+    contents = sorted(m["content"] for m in keployrag_index.get_metadata(with_content=True).values())
+    assert contents == ["a = 2", "b = 1"]
+
+def test_search_ids_resolve_to_metadata(index_files):
+    vectors = _vectors(3, seed=4)
+    for i, name in enumerate(["a.py", "b.py", "c.py"]):
+        keployrag_index.add_to_index(vectors[i:i + 1], name, name, _path(name))
+    keployrag_index.remove_from_index(_path("a.py"))
+
+    _, ids = keployrag_index.get_index().search(vectors[2:3], 1)
+    assert keployrag_index.get_metadata()[int(ids[0][0])]["filename"] == "c.py"
+    assert keployrag_index.get_index().ntotal == 2
+
+def test_log_is_replayed_on_top_of_checkpoint(index_files):
+    keployrag_index.add_to_index(_vectors(seed=5), "a", "a.py", _path("a.py"))
+    keployrag_index.save_index()
+    keployrag_index.add_to_index(_vectors(seed=6), "b", "b.py", _path("b.py"))
+    keployrag_index.add_to_index(_vectors(seed=7), "a2", "a.py", _path("a.py"))
+
+    index = keployrag_index.load_index()
+    assert index.ntotal == 2
+    assert sorted(m["content"] for m in keployrag_index.get_metadata(with_content=True).values()) == ["a2", "b"]
+
+def test_hnsw_masks_removed_vectors_until_compaction(index_files, monkeypatch):
+    monkeypatch.setattr(keployrag_index, "INDEX_TYPE", "hnsw")
+    monkeypatch.setattr(keployrag_index, "index", build_index("hnsw"))
+    vectors = _vectors(3, seed=8)
+    for i, name in enumerate(["a.py", "b.py", "c.py"]):
+        keployrag_index.add_to_index(vectors[i:i + 1], name, name, _path(name))
+    keployrag_index.remove_from_index(_path("a.py"))
+
+    _, ids = keployrag_index.search_vectors(vectors[0:1], 3)
+    assert set(ids[0].tolist()) - {-1} == set(keployrag_index.get_metadata())
+
+    keployrag_index.save_index()
+    assert keployrag_index.get_index().ntotal == 2
+    assert index_kind(keployrag_index.get_index()) == "hnsw"
+
+def test_sharded_search_merges_shards_and_log(index_files, monkeypatch):
+    monkeypatch.setattr(keployrag_index, "INDEX_SHARDING", "directory")
+    monkeypatch.setattr(shards, "INDEX_SHARDING", "directory")
+    vectors = _vectors(4, seed=9)
+    for i, name in enumerate(["pkg/a.py", "pkg/b.py", "lib/c.py"]):
+        keployrag_index.add_to_index(vectors[i:i + 1], name, name, _path(name))
+    keployrag_index.save_index()
+    assert len(shards.load_manifest(keployrag_index.SHARD_DIR)["shards"]) == 2
+
+    # Logged after the checkpoint: served from the delta, with the replaced vector masked out
+    keployrag_index.add_to_index(vectors[3:4], "c2", "c.py", _path("lib/c.py"))
+    keployrag_index.remove_from_index(_path("pkg/a.py"))
+
+    assert keployrag_index.index_size() == 2
+    _, ids = keployrag_index.search_vectors(vectors[2:4], 1)
+    assert keployrag_index.get_metadata([ids[1][0]], with_content=True)[ids[1][0]]["content"] == "c2"
+    _, ids = keployrag_index.search_vectors(vectors[0:1], 3)
+    assert {m["filepath"] for m in keployrag_index.get_metadata(ids[0][ids[0] >= 0]).values()} == {"pkg/b.py", "lib/c.py"}
+
+def test_sharded_size_counts_edits_after_checkpoint_once(index_files, monkeypatch):
+    monkeypatch.setattr(keployrag_index, "INDEX_SHARDING", "directory")
+    monkeypatch.setattr(shards, "INDEX_SHARDING", "directory")
+    vectors = _vectors(3, seed=15)
+    keployrag_index.add_to_index(vectors[0:1], "a1", "a.py", _path("pkg/a.py"))
+    keployrag_index.save_index()
+
+    # The second edit removes a vector that only ever lived in the delta
+    keployrag_index.add_to_index(vectors[1:2], "a2", "a.py", _path("pkg/a.py"))
+    keployrag_index.add_to_index(vectors[2:3], "a3", "a.py", _path("pkg/a.py"))
+
+    assert keployrag_index.index_size() == 1
+    _, ids = keployrag_index.search_vectors(vectors[2:3], 3)
+    assert keployrag_index.get_metadata(ids[0][ids[0] >= 0], with_content=True)[ids[0][0]]["content"] == "a3"
+
+def test_chunks_get_their_own_rows(index_files):
+    chunks = [
+        {"content": "def a():\n    pass\n", "start_line": 1, "end_line": 2, "start_byte": 0, "end_byte": 18},
+        {"content": "def b():\n    pass\n", "start_line": 3, "end_line": 4, "start_byte": 18, "end_byte": 36}
+    ]
+    keployrag_index.add_to_index(_vectors(2, seed=9), "".join(c["content"] for c in chunks), "a.py", _path("a.py"), chunks=chunks)
+    keployrag_index.add_to_index(_vectors(1, seed=10), "def a():\n    pass\n", "a.py", _path("a.py"), chunks=chunks[:1])
+
+    assert keployrag_index.index_size() == 1
+    [entry] = keployrag_index.get_metadata(with_content=True).values()
+    assert (entry["start_line"], entry["end_line"], entry["content"]) == (1, 2, chunks[0]["content"])
+
+def test_quantized_index_keeps_search_results(index_files):
+    vectors = _vectors(20, seed=11)
+    for i in range(20):
+        keployrag_index.add_to_index(vectors[i:i + 1], f"f{i}", f"f{i}.py", _path(f"f{i}.py"))
+    keployrag_index.migrate_index("flat", "int8")
+    keployrag_index.add_to_index(_vectors(seed=12), "g", "g.py", _path("g.py"))
+
+    index = keployrag_index.load_index()
+    assert index_quantization(index) == "int8"
+    _, ids = keployrag_index.search_vectors(vectors[3:4], 1)
+    assert keployrag_index.get_metadata([ids[0][0]])[ids[0][0]]["filename"] == "f3.py"
+
+def test_moves_rekey_metadata_and_deletes_remove_vectors(index_files):
+    vectors = _vectors(3, seed=13)
+    keployrag_index.add_to_index(vectors[0:1], "a", "a.py", _path("pkg/a.py"))
+    keployrag_index.add_to_index(vectors[1:2], "b", "b.py", _path("pkg/sub/b.py"))
+    keployrag_index.add_to_index(vectors[2:3], "c", "c.py", _path("lib/sub/b.py"))
+
+    assert keployrag_index.move_in_index(_path("pkg/a.py"), _path("pkg/renamed.py")) == 1
+    assert keployrag_index.move_in_index(_path("pkg/sub"), _path("lib/sub")) == 1
+    assert keployrag_index.index_size() == 2
+    _, ids = keployrag_index.search_vectors(vectors[1:2], 1)
+    assert keployrag_index.get_metadata([ids[0][0]])[ids[0][0]]["filepath"] == "lib/sub/b.py"
+    assert sorted((m["filename"], m["filepath"]) for m in keployrag_index.get_metadata().values()) == [
+        ("b.py", "lib/sub/b.py"), ("renamed.py", "pkg/renamed.py")]
+
+    assert keployrag_index.remove_from_index(_path("lib")) == 1
+    assert keployrag_index.index_size() == 1
+
+def test_clear_index_drops_sharded_state(index_files, monkeypatch):
+    monkeypatch.setattr(keployrag_index, "INDEX_SHARDING", "directory")
+    monkeypatch.setattr(shards, "INDEX_SHARDING", "directory")
+    keployrag_index.add_to_index(_vectors(seed=14), "a", "a.py", _path("pkg/a.py"))
+    keployrag_index.save_index()
+    assert keployrag_index.index_size() == 1
+
+    keployrag_index.clear_index()
+    assert keployrag_index._sharded is None and not keployrag_index._dirty_paths
+    assert keployrag_index.index_size() == 0
+
+def test_metadata_lookups_are_batched_under_the_variable_limit(index_files):
+    conn = keployrag_index.store._connection()
+    if not hasattr(conn, "setlimit"):
+        pytest.skip("needs Python 3.11 to lower SQLite's variable limit")
+    conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    count = 2000
+    keployrag_index.store.replace_paths([("big.py", list(range(count)), [
+        {"content": str(i), "filename": "big.py", "filepath": "big.py"} for i in range(count)])])
+
+    assert len(keployrag_index.get_metadata(range(count))) == count
+
+def test_emptying_a_file_removes_its_vectors(index_files):
+    def embed(texts):
+        # Like the Azure API, which rejects empty input
+        return _vectors(len(texts), seed=16), {i: "empty input" for i, text in enumerate(texts) if not text.strip()}
+
+    path = _path("a.py")
+    assert index_contents([(path, "a.py", "a = 1\n")], embed) == 1
+    assert keployrag_index.index_size() == 1
+
+    assert index_contents([(path, "a.py", "  \n")], embed) == 1
+    assert keployrag_index.index_size() == 0
+    assert keployrag_index.get_metadata() == {}
+
+def _write_baseline_index(vectors, metadata, metadata_file=None):
+    # How versions before vector IDs saved an index: a plain flat index and a positional list
+    flat = faiss.IndexFlatL2(EMBEDDING_DIM)
+    flat.add(vectors)
+    faiss.write_index(flat, keployrag_index.FAISS_INDEX_FILE)
+    with open(metadata_file or keployrag_index.METADATA_FILE, "wb") as f:
+        np.save(f, metadata)
+
+def test_legacy_index_is_only_imported_when_positions_line_up(index_files):
+    vectors = _vectors(3, seed=15)
+    a, b = ({"content": f"{name} = 1", "filename": name, "filepath": name} for name in ("a.py", "b.py"))
+    _write_baseline_index(vectors[:2], [a, b])
+    keployrag_index.load_index()
+    assert keployrag_index.get_metadata()[1]["filepath"] == "b.py"
+    _, ids = keployrag_index.search_vectors(vectors[1:2], k=1)
+    assert ids[0].tolist() == [1]
+
+    # a.py was edited: its old vector stays first and its new entry goes last, after b.py's
+    keployrag_index.clear_index()
+    _write_baseline_index(vectors, [b, dict(a, content="a = 2")])
+    keployrag_index.load_index()
+    assert keployrag_index.index_size() == 0 and keployrag_index.get_metadata() == {}
+    assert not os.path.exists(keployrag_index.METADATA_FILE)
+
+def test_legacy_metadata_is_found_in_the_working_directory(index_files, monkeypatch):
+    # The first versions saved metadata.npy relative to the working directory, not next to the index
+    monkeypatch.chdir(index_files)
+    monkeypatch.setattr(keployrag_index, "WORKING_DIR_METADATA_FILE", "metadata.npy")
+    monkeypatch.setattr(keployrag_index, "METADATA_FILE", str(index_files / "index_dir" / "metadata.npy"))
+    _write_baseline_index(_vectors(1, seed=16), [{"content": "a = 1", "filename": "a.py", "filepath": "a.py"}],
+                          metadata_file="metadata.npy")
+    keployrag_index.load_index()
+    assert [entry["filepath"] for entry in keployrag_index.get_metadata().values()] == ["a.py"]
+    assert not os.path.exists(index_files / "metadata.npy")
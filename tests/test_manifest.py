@@ -0,0 +1,111 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+import pytest
+from keployrag import index as keployrag_index
+from keployrag import chunking, manifest, pathfilter
+from keployrag.config import EMBEDDING_DIM
+from keployrag.embedding_backends import HashingEmbedder
+from keployrag.indexing import index_contents, read_file
+
+@pytest.fixture
+def tree(index_files, monkeypatch):
+    root = index_files / "src"
+    root.mkdir()
+    for module in (keployrag_index, manifest):
+        monkeypatch.setattr(module, "WATCHED_DIR", str(root))
+    monkeypatch.setattr(pathfilter, "_default_filter", pathfilter.PathFilter(str(root)))
+    return root
+
+def _index(path):
+    content = path.read_text()
+    vectors = np.random.default_rng(len(content)).random((1, EMBEDDING_DIM), dtype=np.float32)
+    keployrag_index.add_to_index(vectors, content, path.name, str(path))
+
+def test_diff_tree_reports_only_churn(tree):
+    for name in ("a.py", "b.py", "c.py", "d.py"):
+        (tree / name).write_text(f"{name[0]} = 1\n")
+        _index(tree / name)
+    manifest.record_settings()
+    assert manifest.rebuild_reason() is None
+    assert manifest.diff_tree(str(tree)) == ([], [], [])
+
+    (tree / "a.py").write_text("a = 2\n")
+    (tree / "b.py").unlink()
+    (tree / "e.py").write_text("e = 1\n")
+    # A touched file with the same content only gets its recorded stat refreshed
+    os.utime(tree / "c.py", ns=(0, 0))
+    added, changed, removed = manifest.diff_tree(str(tree))
+    assert (added, changed, removed) == ([str(tree / "e.py")], [str(tree / "a.py")], [str(tree / "b.py")])
+    assert keployrag_index.store.manifest()["c.py"][1] == 0
+
+    keployrag_index.remove_from_index(str(tree / "b.py"))
+    for name in ("a.py", "e.py"):
+        _index(tree / name)
+    assert manifest.diff_tree(str(tree)) == ([], [], [])
+
+def test_edits_during_embedding_and_failed_chunks_are_indexed_again(tree, monkeypatch):
+    monkeypatch.setattr(chunking, "INDEX_GRANULARITY", "symbol")
+    embedder = HashingEmbedder(EMBEDDING_DIM)
+    path = tree / "a.py"
+    path.write_text("def a():\n    return 1\n")
+    item = read_file(str(path))
+
+    def embed_while_editing(texts):
+        path.write_text("def a():\n    return 2\n")
+        os.utime(path, ns=(item[3].st_mtime_ns + 10 ** 9,) * 2)
+        return embedder.embed(texts), {}
+
+    # The old content was indexed; the edit made meanwhile is still seen as a change
+    index_contents([item], embed_while_editing)
+    assert manifest.diff_tree(str(tree)) == ([], [str(path)], [])
+
+    # A file with a chunk that failed to embed is not recorded, so it is indexed again
+    path.write_text("def a():\n    return 2\n\ndef b():\n    return 3\n")
+    index_contents([read_file(str(path))],
+                   lambda texts: (embedder.embed(texts), {len(texts) - 1: "rate limited"}))
+    assert keployrag_index.is_indexed(str(path))
+    assert manifest.diff_tree(str(tree)) == ([str(path)], [], [])
+
+    index_contents([read_file(str(path))], lambda texts: (embedder.embed(texts), {}))
+    assert manifest.diff_tree(str(tree)) == ([], [], [])
+
+def test_lost_vectors_force_a_rebuild(tree, monkeypatch):
+    (tree / "a.py").write_text("a = 1\n")
+    _index(tree / "a.py")
+    manifest.record_settings()
+    os.remove(keployrag_index.FAISS_INDEX_FILE)
+    os.remove(keployrag_index.VERSION_FILE)
+    monkeypatch.setattr(keployrag_index, "index", keployrag_index._new_index())
+    assert manifest.rebuild_reason() == "index and metadata are out of sync"
+
+def _git(root, *args):
+    subprocess.run(["git", "-C", str(root), *args], check=True, capture_output=True)
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+def test_git_changes_cover_commits_renames_and_uncommitted_edits(tree):
+    _git(tree, "init", "-q")
+    _git(tree, "config", "user.email", "dev@example.com")
+    _git(tree, "config", "user.name", "dev")
+    for name in ("a.py", "b.py", "c.py"):
+        (tree / name).write_text(f"def {name[0]}():\n    return 1\n")
+        _index(tree / name)
+    _git(tree, "add", "-A")
+    _git(tree, "commit", "-qm", "init")
+    (tree / "c.py").write_text("c = 'uncommitted'\n")
+    _index(tree / "c.py")
+    manifest.record_settings()
+    manifest.record_git_state(manifest.git_state(str(tree)))
+
+    _git(tree, "mv", "a.py", "renamed.py")
+    _git(tree, "commit", "-qm", "rename")
+    # Reverting the edit that was indexed uncommitted must be noticed too
+    _git(tree, "checkout", "c.py")
+    moved, candidates = manifest.git_changes(str(tree))
+    assert moved == [(str(tree / "a.py"), str(tree / "renamed.py"))]
+    assert candidates == sorted(str(tree / name) for name in ("a.py", "c.py", "renamed.py"))
+
+    for src_path, dest_path in moved:
+        keployrag_index.move_in_index(src_path, dest_path)
+    assert manifest.diff_paths(candidates) == ([], [str(tree / "c.py")], [])
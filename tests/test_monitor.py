@@ -0,0 +1,79 @@
+import time
+import threading
+from keployrag.monitor import IndexingQueue
+
+def _recording_queue(**kwargs):
+    batches = []
+    done = threading.Event()
+
+    def process(changes):
+        batches.append(sorted(changes))
+        done.set()
+    return IndexingQueue(process=process, move=lambda src, dest: 1, **kwargs), batches, done
+
+def test_repeated_events_are_coalesced_into_one_batch():
+    queue, batches, done = _recording_queue(debounce=0.2, max_delay=5, batch_size=10, workers=2)
+    for _ in range(5):
+        queue.put("a.py")
+        queue.put("b.py")
+    assert queue.stats()["depth"] == 2
+
+    assert done.wait(2)
+    queue.stop()
+    assert batches == [[("a.py", "index"), ("b.py", "index")]]
+    assert queue.stats() == {"depth": 0, "in_flight": 0, "lag": 0.0, "processed": 2, "batches": 1}
+
+def test_stop_flushes_without_waiting_for_the_debounce():
+    queue, batches, _ = _recording_queue(debounce=60, max_delay=60, batch_size=2, workers=1)
+    for name in ("a.py", "b.py", "c.py"):
+        queue.put(name)
+
+    started = time.monotonic()
+    queue.stop()
+    assert time.monotonic() - started < 5
+    assert sorted(path for batch in batches for path, _ in batch) == ["a.py", "b.py", "c.py"]
+    assert max(len(batch) for batch in batches) == 2
+
+def test_queued_changes_follow_moves_and_deletes():
+    queue, batches, done = _recording_queue(debounce=0.2, max_delay=5, batch_size=10, workers=1)
+    queue.put("src/a.py")
+    queue.put("src/b.py")
+    queue.move("src", "lib")
+    queue.put("lib/b.py", op="delete")
+    queue.put("old/c.py")
+    queue.put("old", op="delete")
+
+    assert done.wait(2)
+    queue.stop()
+    assert batches == [[("lib/a.py", "index"), ("lib/b.py", "delete"), ("old", "delete")]]
+
+def test_moves_are_applied_without_blocking_the_queue():
+    release = threading.Event()
+    batches, done = [], threading.Event()
+
+    def process(changes):
+        batches.append(sorted(changes))
+        done.set()
+
+    def slow_move(src, dest):
+        release.wait(5)
+        return 1
+
+    queue = IndexingQueue(process=process, move=slow_move, debounce=0.05, max_delay=5, batch_size=10, workers=1)
+    queue.put("src/a.py")
+    mover = threading.Thread(target=queue.move, args=("src", "lib"))
+    mover.start()
+    time.sleep(0.1)
+
+    # Producers and stats carry on while the move's index I/O runs; the moved path is held back
+    started = time.monotonic()
+    queue.put("other.py")
+    assert queue.stats()["depth"] == 1
+    assert time.monotonic() - started < 1
+    assert done.wait(2)
+    assert batches == [[("other.py", "index")]]
+
+    release.set()
+    mover.join(2)
+    queue.stop()
+    assert batches == [[("other.py", "index")], [("lib/a.py", "index")]]
@@ -0,0 +1,33 @@
+import os
+from keployrag.pathfilter import PathFilter
+
+def _touch(root, relpath):
+    path = os.path.join(root, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("")
+
+def test_gitignore_and_patterns_prune_the_walk(tmp_path):
+    root = str(tmp_path)
+    for relpath in ("app.py", "build/out.py", "pkg/mod.py", "pkg/__pycache__/mod.pyc", "pkg/gen_a.py",
+                    "pkg/gen_keep.py", "vendor/lib/x.py", "docs/a.py", "docs/sub/b.py"):
+        _touch(root, relpath)
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("# build output\nbuild/\n/vendor\npkg/gen_*.py\n!pkg/gen_keep.py\n")
+    with open(os.path.join(root, "docs", ".gitignore"), "w") as f:
+        f.write("*.py\n!a.py\n")
+
+    path_filter = PathFilter(root, ["**/__pycache__/", os.path.join(root, "docs", "sub")])
+    walk = list(path_filter.walk())
+    # Ignored directories are never entered
+    assert sorted(os.path.relpath(dirpath, root) for dirpath, _, _ in walk) == [".", "docs", "pkg"]
+    walked = sorted(os.path.relpath(os.path.join(dirpath, f), root).replace(os.sep, "/")
+                    for dirpath, _, files in walk for f in files)
+    assert walked == [".gitignore", "app.py", "docs/.gitignore", "docs/a.py", "pkg/gen_keep.py", "pkg/mod.py"]
+
+    assert path_filter.ignores(os.path.join(root, "vendor", "lib", "x.py"))
+    assert path_filter.ignores(os.path.join(root, "build"), is_dir=True)
+    # "build/" only matches directories
+    assert not path_filter.ignores(os.path.join(root, "pkg", "build"), is_dir=False)
+    assert not path_filter.ignores(os.path.join(root, "pkg", "gen_keep.py"))
+    assert not path_filter.ignores("/elsewhere/build/x.py")
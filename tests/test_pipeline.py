@@ -0,0 +1,28 @@
+import pytest
+from keployrag import index as keployrag_index
+from keployrag import embeddings, embedding_backends
+from keployrag.pipeline import run_pipeline
+
+@pytest.fixture
+def tree(index_files, monkeypatch):
+    root = index_files / "src"
+    root.mkdir()
+    monkeypatch.setattr(keployrag_index, "WATCHED_DIR", str(root))
+    monkeypatch.setattr(embedding_backends, "EMBEDDING_BACKEND", "hashing")
+    monkeypatch.setattr(embeddings, "cache", None)
+    return root
+
+def test_pipeline_indexes_every_readable_file(tree):
+    paths = []
+    for i in range(7):
+        (tree / f"m{i}.py").write_text(f"def f{i}():\n    return {i}\n")
+        paths.append(str(tree / f"m{i}.py"))
+    paths.insert(3, str(tree / "missing.py"))
+
+    # Small groups and queues, so every stage has to wait on the next one
+    stats = run_pipeline(iter(paths), read_workers=2, group_files=2, embed_groups=2, queue_size=1,
+                         progress_interval=60)
+    assert (stats.read, stats.read_errors, stats.embedded, stats.indexed, stats.chunks) == (7, 1, 7, 7, 7)
+    indexed = {m["filepath"] for m in keployrag_index.get_metadata().values()}
+    assert indexed == {f"m{i}.py" for i in range(7)}
+    assert keployrag_index.index_size() == 7
@@ -0,0 +1,76 @@
+from parsing.preprocessing import load_files, parse_files, write_symbol_store
+from parsing.symbol_store import SymbolStore
+
+def test_single_pass_parse_resolves_references_across_files(tmp_path):
+    (tmp_path / "Greeter.java").write_text(
+        "class Greeter {\n"
+        "    String greet(String name) { return format(name); }\n"
+        "    String format(String name) { return name; }\n"
+        "}\n"
+    )
+    (tmp_path / "App.java").write_text(
+        "class App {\n"
+        "    void run() {\n"
+        "        Greeter g = new Greeter();\n"
+        "        g.greet(\"x\");\n"
+        "        unknown();\n"
+        "    }\n"
+        "}\n"
+    )
+    files = load_files(str(tmp_path))
+    # Two worker processes, so definitions and references have to be merged across workers
+    class_data, method_data, references = parse_files(files, workers=2)
+
+    assert sorted(cd["class_name"] for cd in class_data) == ["App", "Greeter"]
+    assert sorted((md["class_name"], md["name"]) for md in method_data) == [
+        ("App", "run"), ("Greeter", "format"), ("Greeter", "greet")]
+    assert sorted((ref["file"].endswith("App.java"), ref["line"]) for ref in references["method"]["greet"]) == [
+        (True, 4)]
+    assert sorted(ref["line"] for ref in references["method"]["format"]) == [2]
+    assert "unknown" not in references["method"]
+
+def test_symbol_store_streams_rows_and_replaces_reparsed_files(tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "Cart.java").write_text(
+        "class Cart {\n"
+        "    int total() { return price(); }\n"
+        "    int price() { return 1; }\n"
+        "}\n"
+    )
+    (source / "Main.java").write_text("class Main {\n    void run() { price(); }\n}\n")
+    files = load_files(str(source))
+    # A row group of one row, so every file is written as soon as it is parsed
+    store = SymbolStore(str(tmp_path / "symbols.db"), row_group_size=1)
+    assert write_symbol_store(files, store, workers=2) == 2
+
+    assert sorted(row["name"] for row in store.rows("methods", ["name"])) == ["price", "run", "total"]
+    assert sorted(row["file_path"] for row in store.rows("classes", ["file_path"])) == [
+        str(source / "Cart.java"), str(source / "Main.java")]
+    assert sorted((row["file_path"].endswith("Main.java"), row["line"])
+                  for row in store.rows("method_references", ["file_path", "line"])) == [(False, 2), (True, 2)]
+
+    # Re-parsing a file replaces its rows, and references to symbols it no longer defines
+    # stop resolving; a deleted file is dropped
+    (source / "Cart.java").write_text("class Cart {\n    int total() { return 2; }\n}\n")
+    write_symbol_store([f for f in files if f[0].endswith("Cart.java")], store)
+    assert list(store.rows("method_references")) == []
+    (source / "Main.java").unlink()
+    assert store.remove_missing_files() == [str(source / "Main.java")]
+    assert [(row["name"], row["source_code"]) for row in store.rows("methods", ["name", "source_code"])] == [
+        ("total", "int total() { return 2; }")]
+    store.close()
+
+def test_reopened_symbol_store_replaces_a_reparsed_file(tmp_path):
+    (tmp_path / "Cart.java").write_text("class Cart {\n    int price() { return 1; }\n}\n")
+    files = load_files(str(tmp_path))
+    store = SymbolStore(str(tmp_path / "out" / "symbols.db"))
+    write_symbol_store(files, store)
+    store.close()
+
+    # A later --since run opens the database afresh and re-parses only the changed file
+    (tmp_path / "Cart.java").write_text("class Cart {\n    int price() { return 2; }\n}\n")
+    store = SymbolStore(str(tmp_path / "out" / "symbols.db"))
+    write_symbol_store(files, store)
+    assert [row["source_code"] for row in store.rows("methods", ["source_code"])] == ["int price() { return 2; }"]
+    store.close()
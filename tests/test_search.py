@@ -0,0 +1,73 @@
+from keployrag import chunking, search
+from keployrag import index as keployrag_index
+from keployrag.config import EMBEDDING_DIM, WATCHED_DIR
+from keployrag.embedding_backends import HashingEmbedder
+from keployrag.indexing import index_contents
+
+STORE = '''class DocumentStore:
+    def update_document_index(self, doc):
+        return self.rebuild(doc)
+
+    def rebuild(self, doc):
+        return doc
+'''
+
+APP = '''from store import DocumentStore
+
+def sync(docs):
+    store = DocumentStore()
+    for doc in docs:
+        store.update_document_index(doc)
+'''
+
+def test_query_identifiers_keeps_code_shaped_words():
+    assert search.query_identifiers("where is `rebuild` defined") == ["rebuild"]
+    assert search.query_identifiers("How does update_document_index use DocumentStore.rebuild?") == [
+        "update_document_index", "DocumentStore", "rebuild"]
+    assert search.query_identifiers("How do I add a new page, e.g. for settings?") == []
+
+def test_exact_identifiers_skip_embedding_and_fuse_with_vector_hits(index_files, monkeypatch):
+    monkeypatch.setattr(chunking, "INDEX_GRANULARITY", "symbol")
+    embedder = HashingEmbedder(EMBEDDING_DIM)
+    queries = []
+
+    def embed_query(text):
+        queries.append(text)
+        return embedder.embed([text])
+
+    monkeypatch.setattr(search, "generate_embeddings", embed_query)
+    index_contents([(f"{WATCHED_DIR}/store.py", "store.py", STORE), (f"{WATCHED_DIR}/app.py", "app.py", APP)],
+                   lambda texts: (embedder.embed(texts), {}))
+
+    # A defined identifier is answered from the identifier index alone: definition, then its users
+    results = search.search_code("where is `update_document_index` defined", k=3)
+    assert queries == []
+    assert [(r["filepath"], r["symbol"]) for r in results] == [
+        ("store.py", "update_document_index"), ("app.py", "sync")]
+
+    # Unless every identifier is defined, the query is embedded and exact hits are fused with vector hits
+    results = search.search_code("what calls `sync` or store_helper_missing", k=10)
+    assert len(queries) == 1
+    assert results[0]["symbol"] == "sync" and results[0]["distance"] is not None
+
+    # The identifier index follows edits
+    index_contents([(f"{WATCHED_DIR}/app.py", "app.py", APP.replace("update_document_index", "refresh"))],
+                   lambda texts: (embedder.embed(texts), {}))
+    results = search.search_code("`update_document_index`", k=3)
+    assert [r["symbol"] for r in results] == ["update_document_index"]
+
+def test_identifier_users_are_ranked_before_the_limit(index_files):
+    store = keployrag_index.store
+    rows = [("old.py", {"content": "store_document(x)", "kind": "module"}),
+            ("helper.py", {"content": "def helper():\n    store_document(load_document())", "kind": "function",
+                           "symbol": "helper"}),
+            ("impl.py", {"content": "def store_document(doc):\n    pass", "kind": "function",
+                         "symbol": "store_document"})]
+    for vector_id, (path, entry) in enumerate(rows):
+        store.replace_paths([(path, [vector_id], [dict(entry, filename=path, filepath=path)])])
+
+    # The oldest row only uses one of the names; the definition and the row using both come first
+    defined, used = store.find_identifiers(["store_document", "load_document"], limit=2)
+    assert defined == {"store_document": [2]}
+    assert list(used) == [2, 1]
+    assert used[1] == {"store_document", "load_document"}
@@ -0,0 +1,132 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from keployrag import chunking, symbols, symbol_graph
+from keployrag import index as keployrag_index
+from keployrag.config import EMBEDDING_DIM, WATCHED_DIR
+from keployrag.embedding_backends import HashingEmbedder
+from keployrag.indexing import index_contents
+from keployrag.symbols import extract_symbol_chunks
+from parsing.preprocessing import get_language_from_extension
+
+SOURCE = '''import os
+
+class Store:
+    """Keeps things."""
+    limit = 10
+
+    @property
+    def size(self):
+        return 0
+
+    def add(self, item):
+        def check(value):
+            return value is not None
+        return check(item)
+
+def helper():
+    return os.sep
+
+if __name__ == "__main__":
+    helper()
+'''
+
+def test_symbols_become_separate_chunks_with_names_and_spans():
+    chunks = extract_symbol_chunks(SOURCE, "store.py")
+    encoded = SOURCE.encode("utf-8")
+
+    assert [(c["kind"], c["class_name"], c["symbol"], c["start_line"], c["end_line"]) for c in chunks] == [
+        ("module", None, None, 1, 1),
+        ("class", "Store", "Store", 3, 5),
+        ("method", "Store", "size", 7, 9),
+        ("method", "Store", "add", 11, 14),
+        ("function", None, "helper", 16, 17),
+        ("module", None, None, 19, 20)
+    ]
+    for chunk in chunks:
+        assert encoded[chunk["start_byte"]:chunk["end_byte"]].decode("utf-8") == chunk["content"]
+
+def test_unsupported_languages_are_left_to_the_chunker():
+    assert extract_symbol_chunks("key: value\n", "config.yaml") is None
+
+def test_read_workers_extract_symbols_in_parallel():
+    files = [(f"pkg/mod{i}.py", SOURCE.replace("Store", f"Store{i}")) for i in range(8)]
+    expected = {path: extract_symbol_chunks(content, path) for path, content in files}
+    python = get_language_from_extension(".py")
+    barrier = threading.Barrier(4)
+
+    def parser_of_worker(_):
+        barrier.wait(5)
+        return id(symbols._parser(python))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        parsers = set(executor.map(parser_of_worker, range(4)))
+        results = dict(executor.map(lambda file: (file[0], extract_symbol_chunks(file[1], file[0])), files * 3))
+
+    # Each worker parses with its own parser, and gets what a single thread would
+    assert len(parsers) == 4
+    assert results == expected
+
+def test_editing_one_function_only_reembeds_that_function(index_files, monkeypatch):
+    monkeypatch.setattr(chunking, "INDEX_GRANULARITY", "symbol")
+    embedder = HashingEmbedder(EMBEDDING_DIM)
+    embedded = []
+
+    def embed(texts):
+        embedded.append(texts)
+        return embedder.embed(texts), {}
+
+    path = f"{WATCHED_DIR}/store.py"
+    index_contents([(path, "store.py", SOURCE)], embed)
+    before = {m["symbol"]: (i, m["start_line"]) for i, m in keployrag_index.get_metadata().items()}
+
+    edited = SOURCE.replace("import os\n", "import os\nimport sys\n").replace("return os.sep", "return sys.platform")
+    index_contents([(path, "store.py", edited)], embed)
+    after = {m["symbol"]: (i, m["start_line"]) for i, m in keployrag_index.get_metadata().items()}
+
+    # Only the changed module block and function are embedded again; the rest keep their vectors
+    assert len(embedded[1]) == 2 and "sys.platform" in embedded[1][1]
+    assert after["add"] == (before["add"][0], before["add"][1] + 1)
+    assert after["helper"][0] != before["helper"][0]
+    assert keployrag_index.index_size() == len(keployrag_index.get_metadata()) == 6
+    # The second parse started from the cached tree of the first
+    assert symbols.tree_cache.incremental >= 1
+
+def test_symbol_graph_follows_calls_across_files(index_files, monkeypatch):
+    monkeypatch.setattr(chunking, "INDEX_GRANULARITY", "symbol")
+    embedder = HashingEmbedder(EMBEDDING_DIM)
+
+    def embed(texts):
+        return embedder.embed(texts), {}
+
+    app = "from store import Store\n\ndef main():\n    store = Store()\n    store.add(1)\n"
+    index_contents([(f"{WATCHED_DIR}/store.py", "store.py", SOURCE), (f"{WATCHED_DIR}/app.py", "app.py", app)], embed)
+
+    assert [(d["filepath"], d["kind"]) for d in symbol_graph.definitions("Store.add")] == [("store.py", "method")]
+    assert sorted((c["filepath"], c["symbol"], c["lines"]) for c in symbol_graph.callers("add")) == [
+        ("app.py", "main", [5])]
+    assert [(c["symbol"], c["lines"]) for c in symbol_graph.callers("helper")] == [(None, [20])]
+    (main,) = symbol_graph.definitions("main")
+    assert [d["symbol"] for d in symbol_graph.callees(main["id"])] == ["Store", "add"]
+    assert [c["symbol"] for c in symbol_graph.symbols_in_file(f"{WATCHED_DIR}/store.py")] == [
+        None, "Store", "size", "add", "helper", None]
+
+    results = [dict(d, content="") for d in symbol_graph.definitions("add")]
+    assert [(r["symbol"], r["calls"]) for r in symbol_graph.related_context(results)] == [("main", "add")]
+
+    # A call through self resolves to its own class; one through an untyped receiver could be either
+    cache = "class Cache:\n    def add(self, item):\n        pass\n\n    def fill(self):\n        self.add(0)\n"
+    index_contents([(f"{WATCHED_DIR}/cache.py", "cache.py", cache)], embed)
+    assert [c["symbol"] for c in symbol_graph.callers("Store.add")] == ["main"]
+    assert [c["symbol"] for c in symbol_graph.callers("Cache.add")] == ["fill", "main"]
+    assert [c["symbol"] for c in symbol_graph.callers("Cache.add", limit=1)] == ["fill"]
+    (fill,) = symbol_graph.definitions("fill")
+    assert [c["symbol"] for c in symbol_graph.callers("Cache.add", exclude=[fill["id"]])] == ["main"]
+    keployrag_index.remove_from_index(f"{WATCHED_DIR}/cache.py")
+
+    # Edges follow their chunks when a file is moved, and go away when the call does
+    keployrag_index.move_in_index(f"{WATCHED_DIR}/app.py", f"{WATCHED_DIR}/cli.py")
+    assert [c["filepath"] for c in symbol_graph.callers("add")] == ["cli.py"]
+    index_contents([(f"{WATCHED_DIR}/cli.py", "cli.py", app.replace("    store.add(1)\n", ""))], embed)
+    assert symbol_graph.callers("add") == []
+    keployrag_index.remove_from_index(f"{WATCHED_DIR}/cli.py")
+    assert symbol_graph.callers("Store") == []
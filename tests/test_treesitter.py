@@ -0,0 +1,47 @@
+from parsing.treesitter import Treesitter, LanguageEnum
+
+def test_parse_assigns_classes_and_docs_in_one_sweep():
+    source = b'''def helper():
+    """Helper docs."""
+
+class Outer:
+    """Outer docs."""
+    def method(self):
+        """Method docs."""
+        def nested():
+            pass
+
+    class Inner:
+        def inner_method(self):
+            pass
+
+def after():
+    pass
+'''
+    classes, methods = Treesitter.create_treesitter(LanguageEnum.PYTHON).parse(source)
+
+    assert [(m.name, m.class_name, m.doc_comment) for m in methods] == [
+        ("helper", None, '"""Helper docs."""'),
+        ("method", "Outer", '"""Method docs."""'),
+        ("nested", "Outer", ""),
+        ("inner_method", "Outer", ""),
+        ("after", None, ""),
+    ]
+    assert [(c.name, [d.split("(")[0] for d in c.method_declarations]) for c in classes] == [
+        ("Outer", ["def method", "def nested", "def inner_method"]),
+        ("Inner", ["def inner_method"]),
+    ]
+
+def test_java_doc_comments_come_from_preceding_comments():
+    source = b'''class A {
+    /** Documented. */
+    void documented() {}
+    // unrelated
+    void plain() {}
+}
+'''
+    _, methods = Treesitter.create_treesitter(LanguageEnum.JAVA).parse(source)
+    assert [(m.name, m.class_name, m.doc_comment) for m in methods] == [
+        ("documented", "A", "/** Documented. */"),
+        ("plain", "A", ""),
+    ]